@@ -1,673 +1,1128 @@
 # app.py
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, send_file
+from flask import Flask, Blueprint, render_template, request, redirect, url_for, session, jsonify, g, abort, Response, current_app, stream_with_context
+from werkzeug.local import LocalProxy
+from jinja2 import FileSystemBytecodeCache
+import os
 import random
+import secrets
+import threading
 import time
-import io
-from datetime import datetime
+from datetime import datetime, timedelta
 
-app = Flask(__name__)
-app.secret_key = "cricket_secret"
-app.config['SESSION_TYPE'] = 'filesystem'
+from store import MatchState, ConflictError, MatchLocks, create_store
+from engine import MatchEngine, SCORE, match_result
+from live import LiveHub
+from cache import LRUCache
+from export import FORMATS, innings_teams, stream_zip
+from archive import MatchArchive
+from forecast import forecast
+from metrics import Metrics, Sampler
+from tournament import TournamentStore, FORMATS as TOURNAMENT_FORMATS, SCHEDULED, LIVE
+from players import PlayerRegistry, roster
+from assets import StaticAssets
+from journal import MatchJournal, JournaledStore
+
+# Shared services live on the app, looked up per request
+store = LocalProxy(lambda: current_app.extensions['match_store'])
+hub = LocalProxy(lambda: current_app.extensions['live_hub'])
+fragments = LocalProxy(lambda: current_app.extensions['fragments'])
+locks = LocalProxy(lambda: current_app.extensions['match_locks'])
+archive = LocalProxy(lambda: current_app.extensions['match_archive'])
+tournaments = LocalProxy(lambda: current_app.extensions['tournaments'])
+metrics = LocalProxy(lambda: current_app.extensions['metrics'])
+registry = LocalProxy(lambda: current_app.extensions['player_registry'])
+
+# Scoring routes work on the scorer's current match; spectator routes are
+# read-only and never touch the session or take the match lock
+bp = Blueprint('main', __name__)
+spectator = Blueprint('spectator', __name__)
+
+# Idempotency keys remembered per match for ball submissions; enough to
+# cover a whole batch from an offline scorer being retried
+BALL_KEYS_KEPT = 64
+# Most deliveries accepted in one /api/balls request
+BALL_BATCH_LIMIT = 36
+
+# The current request's match state
+match = LocalProxy(lambda: g.match)
+
+def create_app(config=None):
+    app = Flask(__name__)
+    app.secret_key = os.environ.get('SECRET_KEY', "cricket_secret")
+    # Match state lives server-side; the cookie only carries the match id.
+    # Backends: memory (single process), sqlite, filesystem. Use sqlite or
+    # filesystem when running several worker processes.
+    app.config['MATCH_STORE'] = os.environ.get('MATCH_STORE', 'memory')
+    app.config['MATCH_STORE_PATH'] = os.environ.get('MATCH_STORE_PATH')
+    # Overs of commentary rendered with the score page; older ones load on demand
+    app.config['COMMENTARY_OVERS'] = 4
+    # Seconds spectators may lag behind balls saved by another worker process
+    app.config['LIVE_CHECK_INTERVAL'] = 2
+    # Rendered pages and JSON views keyed on (match id, version, view)
+    app.config['FRAGMENT_CACHE_SIZE'] = 512
+    # Seconds a request waits for another request on the same match
+    app.config['MATCH_LOCK_TIMEOUT'] = 10
+    # Completed matches are kept here permanently
+    app.config['ARCHIVE_PATH'] = os.environ.get('ARCHIVE_PATH', 'archive.db')
+    # Largest page of archived matches a query may ask for
+    app.config['ARCHIVE_PAGE_LIMIT'] = 100
+    # Allow ?_profile=1 to return a sampled profile of that request instead
+    # of its response
+    app.config['PROFILE_REQUESTS'] = os.environ.get('PROFILE_REQUESTS') == '1'
+    # HTML and JSON responses smaller than this aren't worth compressing
+    app.config['COMPRESS_MIN_SIZE'] = 500
+    app.config['COMPRESS_LEVEL'] = 6
+    # Compiled templates are kept on disk and shared by every worker, so a
+    # fresh worker loads bytecode instead of parsing. Without a directory
+    # they go in Jinja's own per-user one, which only the user running the
+    # app can write to; any directory given should be just as private.
+    app.config['TEMPLATE_CACHE'] = os.environ.get('TEMPLATE_CACHE', '1') == '1'
+    app.config['TEMPLATE_CACHE_DIR'] = os.environ.get('TEMPLATE_CACHE_DIR')
+    # Compile every template at startup rather than on its first request
+    app.config['PRECOMPILE_TEMPLATES'] = os.environ.get('PRECOMPILE_TEMPLATES', '1') == '1'
+    # Every saved change to a match in progress is journalled here first,
+    # and matches are recovered from it at startup. Empty to turn it off.
+    app.config['MATCH_JOURNAL_PATH'] = os.environ.get('MATCH_JOURNAL_PATH', 'journal')
+    # Journal records between full snapshots of a match
+    app.config['JOURNAL_SNAPSHOT_EVERY'] = 30
+    # Bytes a match's journal may grow to before it is rewritten from its
+    # newest snapshot
+    app.config['JOURNAL_COMPACT_SIZE'] = 256 * 1024
+    # Seconds without a save before a match in the journal counts as
+    # abandoned and is no longer recovered at startup
+    app.config['JOURNAL_MAX_AGE'] = 2 * 24 * 60 * 60
+    if config:
+        app.config.update(config)
+    
+    match_store = create_store(app.config['MATCH_STORE'], app.config['MATCH_STORE_PATH'])
+    app.extensions['match_journal'] = None
+    if app.config['MATCH_JOURNAL_PATH']:
+        app.extensions['match_journal'] = MatchJournal(app.config['MATCH_JOURNAL_PATH'],
+                                                       app.config['JOURNAL_SNAPSHOT_EVERY'],
+                                                       app.config['JOURNAL_COMPACT_SIZE'],
+                                                       app.config['JOURNAL_MAX_AGE'])
+        match_store = JournaledStore(match_store, app.extensions['match_journal'])
+        match_store.recover()
+    app.extensions['match_store'] = match_store
+    # Spectator scoreboards, one channel per match. Other worker processes'
+    # changes are looked for in the store every LIVE_CHECK_INTERVAL seconds.
+    app.extensions['live_hub'] = LiveHub(
+        refresh=live_refresh(match_store) if app.config['MATCH_STORE'] != 'memory' else None,
+        check_interval=app.config['LIVE_CHECK_INTERVAL'])
+    app.extensions['fragments'] = LRUCache(app.config['FRAGMENT_CACHE_SIZE'])
+    app.extensions['match_locks'] = MatchLocks()
+    app.extensions['match_archive'] = MatchArchive(app.config['ARCHIVE_PATH'])
+    # Tournament tables live alongside the archive
+    app.extensions['tournaments'] = TournamentStore(app.config['ARCHIVE_PATH'])
+    # Players and saved squads too
+    app.extensions['player_registry'] = PlayerRegistry(app.config['ARCHIVE_PATH'])
+    
+    app.extensions['metrics'] = Metrics()
+    app.extensions['metrics'].install(app)
+    # Fingerprinted, precompressed static files; also compresses responses,
+    # so it goes in first and its after_request hook runs last
+    app.extensions['static_assets'] = StaticAssets(app)
+    app.extensions['static_assets'].install(app)
+    
+    if app.config['TEMPLATE_CACHE']:
+        if app.config['TEMPLATE_CACHE_DIR']:
+            os.makedirs(app.config['TEMPLATE_CACHE_DIR'], mode=0o700, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['TEMPLATE_CACHE_DIR'])
+    
+    app.register_blueprint(bp)
+    app.register_blueprint(spectator)
+    if app.config['PRECOMPILE_TEMPLATES']:
+        for name in app.jinja_env.list_templates():
+            app.jinja_env.get_template(name)
+    return app
 
 # Add session support
-@app.before_request
-def make_session_permanent():
+@bp.before_request
+def load_match():
     session.permanent = True
+    g.match_id = session.get('match_id')
+    g.match = None
+    if g.match_id:
+        # One request at a time per match within this process; other
+        # processes are caught by the version check when saving
+        lock = locks.lock_for(g.match_id)
+        if not lock.acquire(timeout=current_app.config['MATCH_LOCK_TIMEOUT']):
+            abort(503)
+        g.match_lock = lock
+        with metrics.store.time('load'):
+            g.match = store.load(g.match_id)
+    if g.match is None:
+        g.match = MatchState()
+    g.loaded_version = g.match.get('version', 0)
+
+@bp.after_request
+def save_match(response):
+    if not commit_match():
+        return conflict_response()
+    return response
+
+def commit_match():
+    # Save the request's changes to the match, if any. Views call this
+    # themselves before doing anything that mustn't happen unless the
+    # changes are kept; False if someone else saved the match first.
+    if not (g.get('match_id') and g.match.modified):
+        return True
+    # Every saved change gets a new version, which keys cached views
+    g.match['version'] = g.loaded_version + 1
+    try:
+        with metrics.store.time('save'):
+            store.save(g.match_id, g.match, expected_version=g.loaded_version)
+    except ConflictError:
+        return False
+    g.loaded_version = g.match['version']
+    metrics.touch(g.match_id)
+    # Spectators, if there are any, get one snapshot per change, built
+    # and serialized once
+    channel = hub.get(g.match_id)
+    if channel is not None:
+        channel.publish(live_snapshot(g.match), g.match['version'])
+    return True
+
+@bp.teardown_request
+def release_match(exc):
+    lock = g.pop('match_lock', None)
+    if lock is not None:
+        lock.release()
+
+def conflict_response():
+    # Someone else saved the match first; nothing from this request was kept
+    if request.is_json or request.path.startswith('/api/'):
+        response = jsonify({"error": "The match was updated elsewhere, reload and try again"})
+        response.status_code = 409
+        return response
+    return redirect(url_for('.score'))
+
+@bp.before_app_request
+def start_profiler():
+    # ?_profile=<sampling interval in ms>, 1ms if not given
+    if current_app.config['PROFILE_REQUESTS'] and '_profile' in request.args:
+        interval = request.args.get('_profile', 1, type=float) or 1
+        g.sampler = Sampler(threading.get_ident(), interval / 1000).start()
+
+@bp.after_app_request
+def finish_profiler(response):
+    sampler = g.pop('sampler', None)
+    if sampler is None:
+        return response
+    sampler.stop()
+    return Response(sampler.report(), mimetype='text/plain')
+
+@bp.teardown_app_request
+def stop_profiler(exc):
+    sampler = g.pop('sampler', None)
+    if sampler is not None:
+        sampler.stop()
+
+@bp.app_context_processor
+def inject_match():
+    current = g.get('match')
+    return {'match': current, 'engine': current.get('engine') if current is not None else None}
+
+def step_url(step):
+    # URL for one of the engine's next steps
+    return url_for('main.' + step)
+
+def render_page(page, **context):
+    # Each page is its own template, named after it, extending base.html
+    return render_template(f"{page}.html", page=page, **context)
 
-@app.route('/')
+def cached_view(name, build, mimetype='text/html'):
+    # Serve a view of the current match version from the fragment cache and
+    # answer conditional GETs for an unchanged match with 304
+    if match.modified:
+        # Changed by this request; the new version isn't assigned until saved
+        return Response(build(), mimetype=mimetype)
+    response = versioned_view(g.match_id, match.get('version', 0), name, build, mimetype)
+    response.vary.add('Cookie')
+    return response
+
+def versioned_view(match_id, version, name, build, mimetype):
+    etag = f"{match_id}-{version}-{name}"
+    # Compressed copies carry the tag as a weak one
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        body = fragments.get_or_build((match_id, version, name), build)
+        response = Response(body, mimetype=mimetype)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def start_match(match_id=None):
+    # Begin a fresh match under a new id, leaving the old one in the store.
+    # Only someone with the scorer token can pick it up on another device;
+    # the match id alone is public (it's in the spectator link).
+    g.match_id = match_id or store.new_id()
+    g.match = MatchState()
+    g.match['scorer_token'] = secrets.token_urlsafe(16)
+    session['match_id'] = g.match_id
+
+@bp.route('/')
 def index():
-    return render_template('main.html', page="home")
+    return render_page("home")
 
-@app.route('/add_players', methods=['GET', 'POST'])
+@bp.route('/add_players', methods=['GET', 'POST'])
 def add_players():
     if request.method == 'POST':
-        team1_name = request.form['team1_name']
-        team2_name = request.form['team2_name']
-        
-        # Get all players from both teams, filtering out empty entries
-        team1 = [p.strip() for p in request.form.getlist('team1') if p.strip()]
-        team2 = [p.strip() for p in request.form.getlist('team2') if p.strip()]
-        
-        # Validate at least 2 players per team
-        if len(team1) < 2:
-            return render_template('main.html', page="add_players", error="Team 1 needs at least 2 players")
-        if len(team2) < 2:
-            return render_template('main.html', page="add_players", error="Team 2 needs at least 2 players")
+        teams = {}
+        for team in ('team1', 'team2'):
+            squad = request.form.get(team + '_squad', type=int)
+            if squad:
+                # A saved squad keeps its players' ids from match to match
+                saved = registry.squad(squad)
+                if saved is None:
+                    abort(400)
+                name, players = request.form.get(team + '_name') or saved['name'], saved['players']
+            else:
+                # Get the typed players, filtering out empty entries
+                name = request.form[team + '_name']
+                players = [p.strip() for p in request.form.getlist(team) if p.strip()]
+            
+            # Validate at least 2 players per team
+            if len(players) < 2:
+                return render_page("add_players", squads=registry.squads(),
+                                   error=f"Team {team[-1]} needs at least 2 players")
+            teams[team] = (name, players, squad)
         
         overs = int(request.form['overs'])
 
-        # Clear previous session data
-        session.clear()
+        # Start a new match
+        start_match()
         
-        session['team1_name'] = team1_name
-        session['team2_name'] = team2_name
-        session['team1'] = team1
-        session['team2'] = team2
-        session['overs'] = overs
-        return redirect(url_for('toss_page'))
+        for team, (name, players, squad) in teams.items():
+            if not squad:
+                # New players, even where a name has been seen before
+                players = registry.register(players)
+                if 'save_squads' in request.form:
+                    registry.save_squad(name, players)
+            match[team + '_name'] = name
+            match[team] = [player['name'] for player in players]
+            match[team + '_ids'] = [player['id'] for player in players]
+        match['overs'] = overs
+        return redirect(url_for('.toss_page'))
     
-    return render_template('main.html', page="add_players")
+    return render_page("add_players", squads=registry.squads())
 
-@app.route('/toss')
+@bp.route('/toss')
 def toss_page():
-    return render_template('main.html', page="toss")
+    return render_page("toss")
 
-@app.route('/perform_toss')
+@bp.route('/perform_toss')
 def perform_toss():
-    teams = [session['team1_name'], session['team2_name']]
+    teams = [match['team1_name'], match['team2_name']]
     toss_winner = random.choice(teams)
-    toss_loser = session['team1_name'] if toss_winner == session['team2_name'] else session['team2_name']
+    toss_loser = match['team1_name'] if toss_winner == match['team2_name'] else match['team2_name']
     
-    session['toss_winner'] = toss_winner
-    session['toss_loser'] = toss_loser
+    match['toss_winner'] = toss_winner
+    match['toss_loser'] = toss_loser
     
     return jsonify({
         'winner': toss_winner,
         'loser': toss_loser
     })
 
-@app.route('/toss_decision', methods=['POST'])
+def team_players(team):
+    side = 'team1' if team == match['team1_name'] else 'team2'
+    return roster(match[side + '_ids'], match[side])
+
+def batting_team_players():
+    return team_players(match['batting_team'])
+
+def bowling_team_players():
+    return team_players(match['bowling_team'])
+
+def chosen_player(players, field):
+    # The player whose id was submitted in `field`, from the side's roster
+    by_id = {player['id']: player for player in players}
+    player = by_id.get(request.form.get(field, type=int))
+    if player is None:
+        abort(400)
+    return player
+
+@bp.route('/toss_decision', methods=['POST'])
 def toss_decision():
     choice = request.form['choice']
-    session['batting_team'] = session['toss_winner'] if choice == "bat" else session['toss_loser']
-    session['bowling_team'] = session['toss_loser'] if choice == "bat" else session['toss_winner']
+    match['batting_team'] = match['toss_winner'] if choice == "bat" else match['toss_loser']
+    match['bowling_team'] = match['toss_loser'] if choice == "bat" else match['toss_winner']
     
-    # Initialize score variables for first innings
-    session['innings'] = 1
-    session['current_over'] = 0
-    session['current_ball'] = 0
-    session['total_runs'] = 0
-    session['wickets'] = 0
-    session['score'] = []
-    session['batsmen'] = []
-    session['striker_index'] = 0
-    session['non_striker_index'] = 1
-    session['bowlers'] = []
-    session['current_bowler'] = None
-    session['current_bowler_index'] = -1
-    session['previous_bowler'] = None
-    session['free_hit'] = False
-    session['target'] = None
-    session['last_ball_wicket'] = False
+    # Start the first innings
+    match['engine'] = MatchEngine(match['overs'], len(batting_team_players()))
     
-    return redirect(url_for('select_batsmen'))
+    return redirect(url_for('.select_batsmen'))
 
-@app.route('/select_batsmen', methods=['GET', 'POST'])
+@bp.route('/select_batsmen', methods=['GET', 'POST'])
 def select_batsmen():
+    engine = match['engine']
+    players = batting_team_players()
     if request.method == 'POST':
-        striker = request.form['striker']
-        non_striker = request.form['non_striker']
-        
-        # Initialize batsmen data
-        session['batsmen'] = [
-            {"name": striker, "runs": 0, "balls": 0, "fours": 0, "sixes": 0, "out": False, "wicket_type": None},
-            {"name": non_striker, "runs": 0, "balls": 0, "fours": 0, "sixes": 0, "out": False, "wicket_type": None}
-        ]
-        
-        return redirect(url_for('select_bowler'))
+        try:
+            engine.set_openers(chosen_player(players, 'striker'), chosen_player(players, 'non_striker'))
+        except ValueError as e:
+            return render_page("select_batsmen", players=players, error=str(e))
+        match.modified = True
+        return redirect(step_url(engine.next_step()))
     
-    # Get the batting team's players
-    batting_team_players = session['team1'] if session['batting_team'] == session['team1_name'] else session['team2']
-    return render_template('main.html', page="select_batsmen", players=batting_team_players)
+    return render_page("select_batsmen", players=players)
 
-@app.route('/select_bowler', methods=['GET', 'POST'])
+@bp.route('/select_bowler', methods=['GET', 'POST'])
 def select_bowler():
+    engine = match['engine']
+    # The previous bowler can't bowl consecutive overs
+    available_bowlers = [p for p in bowling_team_players() if p['id'] != engine.previous_bowler_id]
+    
     if request.method == 'POST':
-        bowler = request.form['bowler']
-        
-        # Initialize bowler data if not exists
-        if 'bowlers' not in session:
-            session['bowlers'] = []
-        
-        # Add bowler if not already added
-        bowler_exists = False
-        for i, b in enumerate(session['bowlers']):
-            if b['name'] == bowler:
-                session['current_bowler_index'] = i
-                bowler_exists = True
-                break
-        
-        if not bowler_exists:
-            session['bowlers'].append({
-                "name": bowler,
-                "overs": 0,
-                "maidens": 0,
-                "runs": 0,
-                "wickets": 0,
-                "balls": 0
-            })
-            session['current_bowler_index'] = len(session['bowlers']) - 1
-        
-        session['current_bowler'] = bowler
-        # Store the current bowler to prevent selection in next over
-        session['previous_bowler'] = bowler
-        return redirect(url_for('score'))
+        engine.set_bowler(chosen_player(available_bowlers, 'bowler'))
+        match.modified = True
+        return redirect(step_url(engine.next_step()))
     
-    # Get the bowling team's players
-    bowling_team_players = session['team1'] if session['bowling_team'] == session['team1_name'] else session['team2']
+    return render_page("select_bowler", players=available_bowlers)
+
+def delivery_from_form():
+    # Get ball outcome as (runs, wicket_type, run_out_batsman id)
+    runs = int(request.form['runs'])
+    wicket_type = request.form.get('wicket_type') or None if 'is_wicket' in request.form else None
+    run_out_batsman = request.form.get('run_out_batsman', type=int)
+    return runs, wicket_type, run_out_batsman
+
+def delivery_from_json(data):
+    # JSON bodies name the dismissal directly: {"runs": 1, "wicket_type": "Run Out", "run_out_batsman": 12}.
+    # Anything else is a ValueError, for a 400.
+    if not isinstance(data, dict):
+        raise ValueError("Expected a JSON object for each delivery")
+    runs = data.get('runs')
+    wicket_type = data.get('wicket_type') or None
+    run_out_batsman = data.get('run_out_batsman') or None
+    if type(runs) is not int:
+        raise ValueError("runs must be a whole number")
+    if wicket_type is not None and not isinstance(wicket_type, str):
+        raise ValueError("wicket_type must be a string")
+    if isinstance(run_out_batsman, str) and run_out_batsman.isdigit():
+        # As read from a form field
+        run_out_batsman = int(run_out_batsman)
+    if run_out_batsman is not None and type(run_out_batsman) is not int:
+        raise ValueError("run_out_batsman must be a player id")
+    return runs, wicket_type, run_out_batsman
+
+def delivery_from_request():
+    data = request.get_json(silent=True)
+    if data is None:
+        return delivery_from_form()
+    return delivery_from_json(data)
+
+def seen_ball_key(key):
+    return bool(key) and key in match.get('ball_keys', {})
+
+def remember_ball_key(key):
+    # Only the last few keys are kept; retries come within seconds
+    if not key:
+        return
+    keys = match.get('ball_keys', {})
+    keys[key] = len(match['engine'].log)
+    while len(keys) > BALL_KEYS_KEPT:
+        del keys[next(iter(keys))]
+    match['ball_keys'] = keys
+
+def bowler_figures(bowler):
+    # Overs are only carried at the end of an over, so a bowler part way
+    # through one after finishing someone else's can have six balls or more
+    balls = bowler['overs'] * 6 + bowler['balls']
+    return {
+        "name": bowler['name'],
+        "overs": f"{balls // 6}.{balls % 6}",
+        "maidens": bowler['maidens'],
+        "runs": bowler['runs'],
+        "wickets": bowler['wickets'],
+    }
+
+def match_forecast(engine):
+    # Memoized on the state, so repeated renders of a ball cost nothing
+    if engine.innings_complete:
+        return None
+    return forecast(engine.total_runs, engine.wickets_remaining, engine.overs * 6 - engine.balls_bowled,
+                    engine.target, len(bowling_team_players()), engine.overs * 6)
+
+def ball_delta(engine):
+    # Just the parts of the score page a single delivery can change
+    score_line = {
+        "runs": engine.total_runs,
+        "wickets": engine.wickets,
+        "overs": f"{engine.current_over}.{engine.current_ball}",
+        "run_rate": round(engine.run_rate, 2),
+        "free_hit": engine.free_hit,
+    }
+    if engine.innings == 2:
+        score_line["required"] = engine.target - engine.total_runs
+        score_line["balls_left"] = engine.overs * 6 - engine.balls_bowled
+        score_line["par"] = engine.par_score
     
-    # Filter out the previous bowler if it exists
-    available_bowlers = bowling_team_players.copy()
-    if 'previous_bowler' in session and session['previous_bowler'] in available_bowlers:
-        available_bowlers.remove(session['previous_bowler'])
+    batsmen = []
+    for index, striker in ((engine.striker_index, True), (engine.non_striker_index, False)):
+        if index != -1:
+            batsman = engine.batsmen[index]
+            batsmen.append({"index": index, "name": batsman['name'], "runs": batsman['runs'],
+                            "balls": batsman['balls'], "striker": striker})
     
-    return render_template('main.html', page="select_bowler", players=available_bowlers)
+    ball = engine.log[-1].to_dict()
+    ball['index'] = len(engine.log) - 1
+    return {
+        "score": score_line,
+        "batsmen": batsmen,
+        "bowler": bowler_figures(engine.bowlers[engine.current_bowler_index]),
+        "ball": ball,
+        "over": engine.over_summary(ball['over']),
+        "forecast": match_forecast(engine),
+    }
 
-@app.route('/score', methods=['GET', 'POST'])
+def commentary_page(engine, before=None):
+    # Newest-first overs of commentary, each with its summary from the over
+    # index, plus the cursor for the next page (the oldest over shown) if
+    # there are earlier overs
+    log = engine.log
+    groups = log.over_groups(before, current_app.config['COMMENTARY_OVERS'])
+    overs = [
+        {"over": over, "summary": engine.over_summary(over),
+         "balls": [(i, log[i]) for i in range(end - 1, start - 1, -1)]}
+        for over, start, end in groups
+    ]
+    older = groups[-1][0] if groups and groups[-1][1] > 0 else None
+    return overs, older
+
+@bp.route('/score', methods=['GET', 'POST'])
 def score():
-    # Check if we're coming from new batsman after last ball wicket
-    if request.method == 'GET' and session.get('last_ball_wicket', False):
-        session['last_ball_wicket'] = False
-        # If it was the last ball of the over, redirect to bowler selection
-        if session['current_ball'] >= 6:
-            return redirect(url_for('select_bowler'))
-    
+    engine = match['engine']
     if request.method == 'POST':
-        # Get ball outcome
-        runs = int(request.form['runs'])
-        is_wicket = 'is_wicket' in request.form
-        wicket_type = request.form.get('wicket_type', '')
-        is_run_out = wicket_type == 'Run Out'
-        run_out_batsman = request.form.get('run_out_batsman', '')
-        
-        # Handle extras
-        is_extra = runs < 0
-        is_wide = runs == -1
-        is_no_ball = runs == -2
-        
-        # Update ball count (except for wides and no-balls)
-        if not (is_wide or is_no_ball):
-            session['current_ball'] += 1
-        
-        # Update bowler stats
-        if session['current_bowler_index'] >= 0:
-            # Only increment ball count for legitimate deliveries (not wides or no-balls)
-            if not (is_wide or is_no_ball):
-                session['bowlers'][session['current_bowler_index']]['balls'] += 1
-            
-            # Add runs to bowler's account
-            if is_wide:
-                session['bowlers'][session['current_bowler_index']]['runs'] += 1
-            elif is_no_ball:
-                session['bowlers'][session['current_bowler_index']]['runs'] += 1
-            elif runs >= 0:
-                session['bowlers'][session['current_bowler_index']]['runs'] += runs
-        
-        # Update batsman stats if not a wide/no-ball
-        if runs >= 0 and not is_extra:
-            session['batsmen'][session['striker_index']]['runs'] += runs
-            if not is_extra:  # Only count balls for legitimate deliveries
-                session['batsmen'][session['striker_index']]['balls'] += 1
-            
-            if runs == 4:
-                session['batsmen'][session['striker_index']]['fours'] += 1
-            elif runs == 6:
-                session['batsmen'][session['striker_index']]['sixes'] += 1
-        
-        # Update total runs
-        if is_no_ball:
-            session['total_runs'] += 1  # Only 1 run for no ball
-        elif is_wide:
-            session['total_runs'] += 1  # Only 1 run for wide
-        else:
-            session['total_runs'] += runs
-        
-        # Handle free hit
-        if session.get('free_hit', False):
-            # Wicket can only be run out on free hit
-            if is_wicket and wicket_type != 'Run Out':
-                is_wicket = False
-            
-            # Reset free hit after this delivery
-            session['free_hit'] = False
-        
-        # Set free hit for next ball if no ball
-        if is_no_ball:
-            session['free_hit'] = True
-        
-        # Record ball details BEFORE handling wicket
-        ball_data = {
-            "over": session['current_over'],
-            "ball": session['current_ball'],
-            "batsman": session['batsmen'][session['striker_index']]['name'],
-            "bowler": session['current_bowler'],
-            "runs": runs,
-            "is_wicket": is_wicket,
-            "wicket_type": wicket_type if is_wicket else None,
-            "is_extra": is_extra,
-            "extra_type": "WD" if is_wide else "NB" if is_no_ball else None
-        }
-        session['score'].append(ball_data)
-        
-        # Handle wicket
-        if is_wicket:
-            session['wickets'] += 1
-            
-            # Determine which batsman is out
-            if is_run_out and run_out_batsman:
-                # Find the run out batsman
-                for i, batsman in enumerate(session['batsmen']):
-                    if batsman['name'] == run_out_batsman:
-                        session['batsmen'][i]['out'] = True
-                        session['batsmen'][i]['wicket_type'] = wicket_type
-                        break
-            else:
-                # Regular dismissal
-                session['batsmen'][session['striker_index']]['out'] = True
-                session['batsmen'][session['striker_index']]['wicket_type'] = wicket_type
-            
-            # Update bowler wickets (except run outs)
-            if session['current_bowler_index'] >= 0 and not is_run_out:
-                session['bowlers'][session['current_bowler_index']]['wickets'] += 1
-            
-            # Handle runout cases - determine who should be on strike
-            if is_wicket and is_run_out:
-                # Determine which batsman was run out
-                run_out_striker = (run_out_batsman == session['batsmen'][session['striker_index']]['name'])
-                run_out_non_striker = (run_out_batsman == session['batsmen'][session['non_striker_index']]['name']) if session['non_striker_index'] != -1 else False
-                
-                # If striker was run out and odd runs were scored, non-striker should stay on strike
-                if run_out_striker and runs % 2 == 1:
-                    # Non-striker becomes striker, new batsman comes at non-strike
-                    session['striker_index'] = session['non_striker_index']
-                    session['non_striker_index'] = -1  # Flag for new batsman at non-strike
-                
-                # If non-striker was run out and even runs were scored, striker should stay on strike
-                elif run_out_non_striker and runs % 2 == 0:
-                    # Striker stays on strike, new batsman comes at non-strike
-                    session['non_striker_index'] = -1  # Flag for new batsman at non-strike
-                
-                # If non-striker was run out and odd runs were scored, new batsman should come at strike
-                elif run_out_non_striker and runs % 2 == 1:
-                    # Current striker moves to non-strike, new batsman comes at strike
-                    session['non_striker_index'] = session['striker_index']  # Current striker moves to non-strike
-                    session['striker_index'] = -1  # Flag for new batsman at strike
-                
-                # If striker was run out and even runs were scored, new batsman should come at strike
-                elif run_out_striker and runs % 2 == 0:
-                    # New batsman comes at striker position, non-striker stays
-                    session['striker_index'] = -1  # Flag for new batsman at strike
-
-            # Logic for "last man standing"
-            batting_team_players = session['team1'] if session['batting_team'] == session['team1_name'] else session['team2']
-            total_players = len(batting_team_players)
-            
-            # If the last batsman gets out, the innings ends
-            if session['wickets'] >= total_players:
-                session.modified = True
-                return redirect(url_for('innings_end'))
-
-            # If a wicket falls and there's only one batsman left
-            if total_players - session['wickets'] == 1:
-                # The innings does not end. The last batsman is already on the field.
-                # If the striker got out (not run-out)
-                if not is_run_out:
-                    # The non-striker becomes the new striker
-                    session['striker_index'], session['non_striker_index'] = session['non_striker_index'], session['striker_index']
-                    # There is no non-striker anymore
-                    session['non_striker_index'] = -1
-
-                # If a run-out happened and the striker was out, the non-striker becomes the new striker
-                elif is_run_out and session['batsmen'][session['striker_index']]['name'] == run_out_batsman:
-                    session['striker_index'], session['non_striker_index'] = session['non_striker_index'], session['striker_index']
-                    session['non_striker_index'] = -1
-
-                # If a run-out happened and the non-striker was out, the striker stays on strike
-                # No change to striker/non-striker indices is needed in this case
-                
-                # Check if this was the last ball of the over
-                if session['current_ball'] >= 6:
-                    session['last_ball_wicket'] = True
-                
-                session.modified = True
-                return redirect(url_for('score'))
-            
-            # If a new batsman needs to come in
-            else:
-                # Check if this was the last ball of the over
-                if session['current_ball'] >= 6:
-                    session['last_ball_wicket'] = True
-                    batting_team_players = session['team1'] if session['batting_team'] == session['team1_name'] else session['team2'] 
-                    wickets_remaining = len(batting_team_players) - session['wickets']
-                    if wickets_remaining > 1:
-                        session['striker_index'], session['non_striker_index'] = session['non_striker_index'], session['striker_index']
-                
-                # We need to find the correct striker. If the wicket was a runout
-                # and the striker was runout, a new batsman comes in for the striker's slot.
-                # If the non-striker was runout, a new batsman comes in for the non-striker slot.
-                
-                # Redirect to select new batsman
-                session.modified = True
-                return redirect(url_for('new_batsman'))
-
-        # Check if target achieved in second innings
-        if session['innings'] == 2 and session['total_runs'] >= session['target']:
-            session.modified = True
-            return redirect(url_for('innings_end'))
-        
-        # Calculate wickets remaining to determine if we should rotate strike
-        batting_team_players = session['team1'] if session['batting_team'] == session['team1_name'] else session['team2']
-        wickets_remaining = len(batting_team_players) - session['wickets']
-        
-        # Switch striker for odd runs only if there's more than one batsman remaining
-        if wickets_remaining > 1 and runs % 2 == 1 and not is_wide:  # Wides don't change strike
-            session['striker_index'], session['non_striker_index'] = session['non_striker_index'], session['striker_index']
-        
-        # End of over handling
-        if session['current_ball'] >= 6:
-            # Update bowler overs (convert balls to proper over format)
-            if session['current_bowler_index'] >= 0:
-                # Calculate proper overs (6 balls = 1 over)
-                total_balls = session['bowlers'][session['current_bowler_index']]['overs'] * 6 + session['bowlers'][session['current_bowler_index']]['balls']
-                session['bowlers'][session['current_bowler_index']]['overs'] = total_balls // 6
-                session['bowlers'][session['current_bowler_index']]['balls'] = total_balls % 6
-                
-                # Check for maiden over (0 runs in the over from legal deliveries)
-                over_runs = 0
-                start_idx = max(0, len(session['score']) - 6)
-                for ball in session['score'][start_idx:]:
-                    if not ball['is_extra']:
-                        over_runs += ball['runs']
-
-                if over_runs == 0:
-                    session['bowlers'][session['current_bowler_index']]['maidens'] += 1
-            
-            session['current_over'] += 1
-            session['current_ball'] = 0
-            
-            # Switch striker and non-striker at the end of the over
-            if wickets_remaining > 1:
-                session['striker_index'], session['non_striker_index'] = session['non_striker_index'], session['striker_index']
-            
-            # Check if innings is complete (all overs bowled or all out)
-            batting_team_players = session['team1'] if session['batting_team'] == session['team1_name'] else session['team2']
-            if session['current_over'] >= session['overs'] or session['wickets'] >= len(batting_team_players):
-                # Check if target achieved in second innings
-                if session['innings'] == 2 and session['total_runs'] >= session['target']:
-                    session.modified = True
-                    return redirect(url_for('innings_end'))
-                else:
-                    session.modified = True
-                    return redirect(url_for('innings_end'))
-            
-            # Redirect to select new bowler for the next over
-            session.modified = True
-            return redirect(url_for('select_bowler'))
-        
-        session.modified = True
-        return redirect(url_for('score'))
+        # A resubmitted form (double tap, retry) carries a key already used
+        ball_key = request.form.get('ball_key')
+        if not seen_ball_key(ball_key):
+            # Too late for this ball (over ended, wicket fell): pick up
+            # the selection first
+            if engine.next_step() != SCORE:
+                return redirect(step_url(engine.next_step()))
+            try:
+                engine.apply(*delivery_from_form())
+            except ValueError:
+                abort(400)
+            metrics.balls.inc()
+            remember_ball_key(ball_key)
+            match.modified = True
+        return redirect(step_url(engine.next_step()))
     
-    # Calculate current run rate
-    total_balls = session['current_over'] * 6 + session['current_ball']
-    current_run_rate = (session['total_runs'] / total_balls * 6) if total_balls > 0 else 0
+    # Finish any pending selection (new batsman, next bowler) first
+    next_step = engine.next_step()
+    if next_step != SCORE:
+        return redirect(step_url(next_step))
     
-    # Get the batting team's players for selecting new batsman if needed
-    batting_team_players = session['team1'] if session['batting_team'] == session['team1_name'] else session['team2']
-    available_batsmen = []
-    for player in batting_team_players:
-        player_has_batted = False
-        for batsman in session['batsmen']:
-            if batsman['name'] == player:
-                player_has_batted = True
-                break
-        if not player_has_batted:
-            available_batsmen.append(player)
+    return cached_view('score', render_score_page)
+
+def render_score_page():
+    engine = match['engine']
+    commentary, older_overs = commentary_page(engine)
+    return render_page("score",
+                          commentary=commentary,
+                          older_overs=older_overs,
+                          batting_team=match['batting_team'],
+                          bowling_team=match['bowling_team'],
+                          total_runs=engine.total_runs,
+                          wickets=engine.wickets,
+                          current_over=engine.current_over,
+                          current_ball=engine.current_ball,
+                          batsmen=engine.batsmen,
+                          striker_index=engine.striker_index,
+                          non_striker_index=engine.non_striker_index,
+                          current_run_rate=round(engine.run_rate, 2),
+                          available_batsmen=engine.available_batsmen(batting_team_players()),
+                          bowlers=engine.bowlers,
+                          current_bowler=engine.current_bowler,
+                          free_hit=engine.free_hit,
+                          innings=engine.innings,
+                          target=engine.target,
+                          forecast=match_forecast(engine),
+                          match_id=g.match_id)
+
+@bp.route('/api/ball', methods=['POST'])
+def api_ball():
+    # Record a delivery without the POST-redirect-GET round trip. Returns the
+    # changed parts of the score page, or where to go next if a selection
+    # (new batsman, next bowler, innings end) is needed first.
+    engine = match.get('engine')
+    if engine is None:
+        return jsonify({"error": "No match in progress"}), 404
     
-    return render_template('main.html', 
-                          page="score", 
-                          score=session['score'], 
-                          batting_team=session['batting_team'],
-                          bowling_team=session['bowling_team'],
-                          total_runs=session['total_runs'],
-                          wickets=session['wickets'],
-                          current_over=session['current_over'],
-                          current_ball=session['current_ball'],
-                          batsmen=session['batsmen'],
-                          striker_index=session['striker_index'],
-                          non_striker_index=session['non_striker_index'] if 'non_striker_index' in session else -1,
-                          current_run_rate=round(current_run_rate, 2),
-                          available_batsmen=available_batsmen,
-                          bowlers=session.get('bowlers', []),
-                          current_bowler=session.get('current_bowler', ''),
-                          free_hit=session.get('free_hit', False),
-                          innings=session.get('innings', 1),
-                          target=session.get('target', 0))
-
-@app.route('/new_batsman', methods=['GET', 'POST'])
-def new_batsman():
-    # Get the batting team's players
-    batting_team_players = session['team1'] if session['batting_team'] == session['team1_name'] else session['team2']
+    # Retries reuse the same key; answer them with the current state
+    # instead of recording the ball twice
+    data = request.get_json(silent=True)
+    if data is None:
+        data = request.form
+    elif not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON object"}), 400
+    ball_key = request.headers.get('Idempotency-Key') or data.get('ball_key')
+    if seen_ball_key(ball_key):
+        next_step = engine.next_step()
+    elif engine.next_step() != SCORE:
+        return jsonify({"next": step_url(engine.next_step())}), 409
+    else:
+        try:
+            next_step = engine.apply(*delivery_from_request())
+        except (KeyError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+        metrics.balls.inc()
+        remember_ball_key(ball_key)
+        match.modified = True
+    
+    if next_step != SCORE:
+        return jsonify({"next": step_url(next_step)})
+    return jsonify(ball_delta(engine))
+
+@bp.route('/api/balls', methods=['POST'])
+def api_balls():
+    # Sync a batch of deliveries queued by an offline scorer, in order:
+    #   {"innings": 1, "balls": [{"key": ..., "seq": 12, "runs": 1, ...}, ...]}
+    # seq is the ball's position in the innings, as the client saw it. Keys
+    # already recorded are skipped, so a retried batch is harmless. Applying
+    # stops at the first ball that doesn't follow on from the server's
+    # state, or when a selection (new batsman, next bowler) is needed.
+    engine = match.get('engine')
+    if engine is None:
+        return jsonify({"error": "No match in progress"}), 404
+    data = request.get_json(silent=True) or {}
+    balls = data.get('balls') or [] if isinstance(data, dict) else None
+    if not isinstance(balls, list) or not all(isinstance(ball, dict) for ball in balls):
+        return jsonify({"error": 'Expected {"balls": [...]} with an object per delivery'}), 400
+    if len(balls) > BALL_BATCH_LIMIT:
+        return jsonify({"error": f"At most {BALL_BATCH_LIMIT} balls per request"}), 413
+    
+    applied = []
+    start = len(engine.log)
+    error, status = None, 200
+    for ball in balls:
+        key = ball.get('key')
+        if seen_ball_key(key):
+            applied.append(key)
+            continue
+        if data.get('innings') != engine.innings or ball.get('seq') != len(engine.log):
+            error, status = "Out of order with the match on the server", 409
+            break
+        if engine.next_step() != SCORE:
+            break
+        try:
+            engine.apply(*delivery_from_json(ball))
+        except ValueError as e:
+            error, status = str(e), 400
+            break
+        remember_ball_key(key)
+        applied.append(key)
+        match.modified = True
+    if len(engine.log) > start:
+        metrics.balls.inc(amount=len(engine.log) - start)
     
+    next_step = engine.next_step()
+    body = {
+        "applied": applied,
+        "innings": engine.innings,
+        "balls": len(engine.log),
+        # The balls this request recorded, for the commentary
+        "recorded": [dict(engine.log[i].to_dict(), index=i) for i in range(start, len(engine.log))],
+        "next": step_url(next_step) if next_step != SCORE else None,
+        "delta": ball_delta(engine) if len(engine.log) and engine.current_bowler_index >= 0 else None,
+    }
+    if error:
+        body["error"] = error
+    return jsonify(body), status
+
+@bp.route('/commentary')
+def commentary():
+    # Older overs of the current innings, a page at a time (cursor = over number)
+    engine = match.get('engine')
+    if engine is None:
+        return jsonify({"error": "No match in progress"}), 404
+    before = request.args.get('before', type=int)
+    
+    def build():
+        overs, older = commentary_page(engine, before)
+        return current_app.json.dumps({
+            "overs": [
+                {"over": group["over"], "summary": group["summary"],
+                 "balls": [dict(ball.to_dict(), index=i) for i, ball in group["balls"]]}
+                for group in overs
+            ],
+            "next": older,
+        })
+    
+    return cached_view(f"commentary-{before}", build, mimetype='application/json')
+
+@bp.route('/reduce_overs', methods=['POST'])
+def reduce_overs():
+    # Rain: fewer overs for this innings, and a revised target in a chase
+    engine = match['engine']
+    try:
+        engine.reduce_overs(request.form.get('overs', type=int) or 0)
+    except ValueError:
+        abort(400)
+    match.modified = True
+    return redirect(step_url(engine.next_step()))
+
+@bp.route('/undo_ball', methods=['POST'])
+def undo_ball():
+    engine = match['engine']
+    if len(engine.log) == 0:
+        return redirect(step_url(engine.next_step()))
+    next_step = engine.undo()
+    match.modified = True
+    return redirect(step_url(next_step))
+
+@bp.route('/edit_ball/<int:ball>', methods=['GET', 'POST'])
+def edit_ball(ball):
+    engine = match['engine']
+    if not 0 <= ball < len(engine.log):
+        return redirect(url_for('.score'))
+    
+    error = None
+    if request.method == 'POST':
+        try:
+            next_step = engine.edit(ball, *delivery_from_form())
+        except ValueError as e:
+            error = str(e)
+        else:
+            match.modified = True
+            return redirect(step_url(next_step))
+    
+    return render_page("edit_ball", ball=engine.log[ball], batsmen=engine.batsmen, error=error)
+
+@bp.route('/new_batsman', methods=['GET', 'POST'])
+def new_batsman():
+    engine = match['engine']
     # Filter out batsmen who are already playing or have played
-    available_batsmen = []
-    for player in batting_team_players:
-        if not any(batsman['name'] == player for batsman in session['batsmen']):
-            available_batsmen.append(player)
+    available_batsmen = engine.available_batsmen(batting_team_players())
     
     # If no batsmen left, end the innings
     if not available_batsmen:
-        return redirect(url_for('innings_end'))
+        return redirect(url_for('.innings_end'))
     
     if request.method == 'POST':
-        new_batsman = request.form['new_batsman']
-        
-        # Add new batsman
-        session['batsmen'].append({
-            "name": new_batsman, 
-            "runs": 0, 
-            "balls": 0, 
-            "fours": 0, 
-            "sixes": 0, 
-            "out": False,
-            "wicket_type": None
-        })
-        
-        # Find which position the new batsman takes based on session flags
-        if session.get('striker_index') == -1:
-            # New batsman comes at striker position
-            session['striker_index'] = len(session['batsmen']) - 1
-        elif session.get('non_striker_index') == -1:
-            # New batsman comes at non-strike position
-            session['non_striker_index'] = len(session['batsmen']) - 1
-        else:
-            # Default behavior: determine position based on who got out
-            current_batsmen = [b for b in session['batsmen'] if not b['out']]
-            if len(current_batsmen) == 2:
-                # A batsman at the crease got out. We need to find which one
-                out_batsman_name = [b for b in session['batsmen'] if b['out']][-1]['name']
-                if session['batsmen'][session['striker_index']]['name'] == out_batsman_name:
-                    session['striker_index'] = len(session['batsmen']) - 1
-                else:
-                    session['non_striker_index'] = len(session['batsmen']) - 1
-            else: # This case is for the first two batsmen
-                session['striker_index'] = len(session['batsmen']) - 1
-        
-        # If wicket happened on the last ball of the over
-        if session.get('last_ball_wicket', False) and session['current_ball'] >= 6:
-            session['last_ball_wicket'] = False  # reset flag
-            session['current_ball'] = 0
-            session['current_over'] += 1
-            return redirect(url_for('select_bowler'))
-        
-        return redirect(url_for('score'))
+        engine.add_batsman(chosen_player(available_batsmen, 'new_batsman'))
+        match.modified = True
+        return redirect(step_url(engine.next_step()))
     
-    return render_template('main.html', page="new_batsman", players=available_batsmen)
+    return render_page("new_batsman", players=available_batsmen)
 
 
-@app.route('/innings_end')
+@bp.route('/innings_end')
 def innings_end():
-    # Calculate bowler economy rates and format overs properly
-    for bowler in session.get('bowlers', []):
-        # Convert balls to proper over format (e.g., 7 balls = 1.1 overs)
-        total_balls = bowler['overs'] * 6 + bowler['balls']
-        bowler['overs'] = total_balls // 6
-        bowler['balls'] = total_balls % 6
-        
-        if bowler['overs'] > 0 or bowler['balls'] > 0:
-            total_balls = bowler['overs'] * 6 + bowler['balls']
-            bowler['economy'] = round(bowler['runs'] / (total_balls / 6), 2) if total_balls > 0 else 0
+    engine = match['engine']
+    summary = engine.innings_summary()
     
     # Store first innings data
-    if session['innings'] == 1:
-        session['first_innings_total'] = session['total_runs']
-        session['first_innings_wickets'] = session['wickets']
-        session['first_innings_overs'] = f"{session['current_over']}.{session['current_ball']}"
-        session['first_innings_batsmen'] = session['batsmen'].copy()
-        session['first_innings_bowlers'] = session['bowlers'].copy()
-        
-        # Set target for second innings
-        session['target'] = session['total_runs'] + 1
+    if engine.innings == 1:
+        match['first_innings_total'] = summary['total']
+        match['first_innings_wickets'] = summary['wickets']
+        match['first_innings_overs'] = summary['overs']
+        match['first_innings_batsmen'] = summary['batsmen']
+        match['first_innings_bowlers'] = summary['bowlers']
+        match['first_innings_max_overs'] = summary['max_overs']
+        match['first_innings_reductions'] = summary['reductions']
+        match['first_innings_log'] = engine.log
+        match['first_innings_charts'] = engine.charts()
+        match['batting_first'] = match['batting_team']
         
         # Switch teams for second innings
-        session['batting_team'], session['bowling_team'] = session['bowling_team'], session['batting_team']
+        match['batting_team'], match['bowling_team'] = match['bowling_team'], match['batting_team']
         
-        # Reset score variables for second innings
-        session['innings'] = 2
-        session['current_over'] = 0
-        session['current_ball'] = 0
-        session['total_runs'] = 0
-        session['wickets'] = 0
-        session['score'] = []
-        session['batsmen'] = []
-        session['striker_index'] = 0
-        session['non_striker_index'] = 1
-        session['bowlers'] = []
-        session['current_bowler'] = None
-        session['current_bowler_index'] = -1
-        session['previous_bowler'] = None
-        session['free_hit'] = False
-        session['last_ball_wicket'] = False
+        # Start the second innings; the target allows for any overs lost
+        engine.start_innings(2, len(batting_team_players()), first_innings=(summary['total'], engine.resources))
         
-        return redirect(url_for('select_batsmen'))
-    else:
-        # Second innings is complete, show match result
-        session['second_innings_total'] = session['total_runs']
-        session['second_innings_wickets'] = session['wickets']
-        session['second_innings_overs'] = f"{session['current_over']}.{session['current_ball']}"
-        session['second_innings_batsmen'] = session['batsmen'].copy()
-        session['second_innings_bowlers'] = session['bowlers'].copy()
+        return redirect(url_for('.select_batsmen'))
+    elif 'winner' not in match:
+        # Second innings is complete, record the match result
+        match['second_innings_total'] = summary['total']
+        match['second_innings_wickets'] = summary['wickets']
+        match['second_innings_overs'] = summary['overs']
+        match['second_innings_batsmen'] = summary['batsmen']
+        match['second_innings_bowlers'] = summary['bowlers']
+        match['second_innings_max_overs'] = summary['max_overs']
+        match['second_innings_reductions'] = summary['reductions']
+        match['second_innings_log'] = engine.log
+        match['second_innings_charts'] = engine.charts()
         
         # Determine winner
-        if session['first_innings_total'] > session['second_innings_total']:
-            session['winner'] = session['team1_name'] if session['team1_name'] == session['bowling_team'] else session['team2_name']
-            session['win_margin'] = f"{session['first_innings_total'] - session['second_innings_total']} runs"
-            session['win_type'] = "runs"
-        elif session['second_innings_total'] > session['first_innings_total']:
-            session['winner'] = session['batting_team']
-            wickets_left = (len(session['team1']) if session['batting_team'] == session['team1_name'] else len(session['team2'])) - session['wickets']
-            session['win_margin'] = f"{wickets_left} wickets"
-            session['win_type'] = "wickets"
-        else:
-            session['winner'] = "Match Tied"
-            session['win_margin'] = ""
-            session['win_type'] = "tie"
+        match['winner'], match['win_margin'], match['win_type'] = match_result(
+            match['first_innings_total'], match['second_innings_total'], engine.wickets_remaining,
+            match['bowling_team'], match['batting_team'], engine.target)
+        match['target'] = engine.target
         
-        return render_template('main.html', 
-                              page="match_result", 
-                              first_innings_total=session['first_innings_total'],
-                              first_innings_wickets=session['first_innings_wickets'],
-                              first_innings_overs=session['first_innings_overs'],
-                              first_innings_batsmen=session['first_innings_batsmen'],
-                              first_innings_bowlers=session['first_innings_bowlers'],
-                              second_innings_total=session['second_innings_total'],
-                              second_innings_wickets=session['second_innings_wickets'],
-                              second_innings_overs=session['second_innings_overs'],
-                              second_innings_batsmen=session['second_innings_batsmen'],
-                              second_innings_bowlers=session['second_innings_bowlers'],
-                              winner=session['winner'],
-                              win_margin=session['win_margin'],
-                              win_type=session['win_type'],
-                              team1_name=session['team1_name'],
-                              team2_name=session['team2_name'])
+        # Saved first: a result that loses to a conflicting save mustn't
+        # reach the archive or the tournament table
+        if not commit_match():
+            return conflict_response()
+        archive.record(g.match_id, match)
+        if 'fixture' in match:
+            tournaments.complete_fixture(match['fixture'], match)
+    
+    return cached_view('match_result', render_match_result)
+
+def render_match_result():
+    first_team, second_team = innings_teams(match)
+    return render_page("match_result",
+                          first_innings_total=match['first_innings_total'],
+                          first_innings_wickets=match['first_innings_wickets'],
+                          first_innings_overs=match['first_innings_overs'],
+                          first_innings_batsmen=match['first_innings_batsmen'],
+                          first_innings_bowlers=match['first_innings_bowlers'],
+                          second_innings_total=match['second_innings_total'],
+                          second_innings_wickets=match['second_innings_wickets'],
+                          second_innings_overs=match['second_innings_overs'],
+                          second_innings_batsmen=match['second_innings_batsmen'],
+                          second_innings_bowlers=match['second_innings_bowlers'],
+                          winner=match['winner'],
+                          win_margin=match['win_margin'],
+                          win_type=match['win_type'],
+                          first_innings_team=first_team,
+                          second_innings_team=second_team,
+                          match_id=g.match_id)
     
-@app.route('/switch_strike', methods=['POST'])
+@bp.route('/switch_strike', methods=['POST'])
 def switch_strike():
     # Simply swap the striker and non-striker
-    if 'non_striker_index' in session and session['non_striker_index'] != -1:
-        session['striker_index'], session['non_striker_index'] = session['non_striker_index'], session['striker_index']
-        session.modified = True
+    match['engine'].switch_strike()
+    match.modified = True
     
-    return redirect(url_for('score'))
+    return redirect(url_for('.score'))
 
-@app.route('/download_summary')
-def download_summary():
-    # Create a text file in memory
-    output = io.StringIO()
-    
-    # Write match header
-    output.write(f"Match Summary: {session['team1_name']} vs {session['team2_name']}\n")
-    output.write("=" * 60 + "\n\n")
-    
-    # Write toss information
-    output.write("TOSS INFORMATION\n")
-    output.write("-" * 20 + "\n")
-    output.write(f"Toss Winner: {session['toss_winner']}\n")
-    output.write(f"Batting First: {session['batting_team'] if session['innings'] == 1 else session['bowling_team']}\n\n")
-    
-    # Write first innings summary
-    output.write("FIRST INNINGS\n")
-    output.write("-" * 15 + "\n")
-    output.write(f"{session['team1_name'] if session['innings'] == 1 else session['team2_name']}: {session['first_innings_total']}/{session['first_innings_wickets']} in {session['first_innings_overs']} overs\n\n")
-    
-    output.write("BATTING PERFORMANCE\n")
-    output.write("-" * 20 + "\n")
-    output.write(f"{'Batsman':<20} {'Runs':<6} {'Balls':<6} {'4s':<4} {'6s':<4} {'SR':<8} {'Status':<15}\n")
-    for batsman in session['first_innings_batsmen']:
-        strikerate = round(batsman['runs'] / batsman['balls'] * 100, 2) if batsman['balls'] > 0 else 0
-        status = f"OUT ({batsman['wicket_type']})" if batsman['out'] else "not out"
-        output.write(f"{batsman['name']:<20} {batsman['runs']:<6} {batsman['balls']:<6} {batsman['fours']:<4} {batsman['sixes']:<4} {strikerate:<8} {status:<15}\n")
-    output.write("\n")
-    
-    output.write("BOWLING PERFORMANCE\n")
-    output.write("-" * 20 + "\n")
-    output.write(f"{'Bowler':<20} {'Overs':<6} {'Maidens':<8} {'Runs':<6} {'Wickets':<8} {'Economy':<8}\n")
-    for bowler in session['first_innings_bowlers']:
-        overs = f"{bowler['overs']}.{bowler['balls']}"
-        economy = bowler.get('economy', 0)
-        output.write(f"{bowler['name']:<20} {overs:<6} {bowler['maidens']:<8} {bowler['runs']:<6} {bowler['wickets']:<8} {economy:<8}\n")
-    output.write("\n")
-    
-    # Write second innings summary
-    output.write("SECOND INNINGS\n")
-    output.write("-" * 15 + "\n")
-    output.write(f"{session['team2_name'] if session['innings'] == 1 else session['team1_name']}: {session['second_innings_total']}/{session['second_innings_wickets']} in {session['second_innings_overs']} overs\n\n")
-    
-    output.write("BATTING PERFORMANCE\n")
-    output.write("-" * 20 + "\n")
-    output.write(f"{'Batsman':<20} {'Runs':<6} {'Balls':<6} {'4s':<4} {'6s':<4} {'SR':<8} {'Status':<15}\n")
-    for batsman in session['second_innings_batsmen']:
-        strikerate = round(batsman['runs'] / batsman['balls'] * 100, 2) if batsman['balls'] > 0 else 0
-        status = f"OUT ({batsman['wicket_type']})" if batsman['out'] else "not out"
-        output.write(f"{batsman['name']:<20} {batsman['runs']:<6} {batsman['balls']:<6} {batsman['fours']:<4} {batsman['sixes']:<4} {strikerate:<8} {status:<15}\n")
-    output.write("\n")
-    
-    output.write("BOWLING PERFORMANCE\n")
-    output.write("-" * 20 + "\n")
-    for bowler in session['second_innings_bowlers']:
-        overs = f"{bowler['overs']}.{bowler['balls']}"
-        economy = bowler.get('economy', 0)
-        output.write(f"{bowler['name']:<20} {overs:<6} {bowler['maidens']:<8} {bowler['runs']:<6} {bowler['wickets']:<8} {economy:<8}\n")
-    output.write("\n")
-    
-    # Write match result
-    output.write("MATCH RESULT\n")
-    output.write("-" * 12 + "\n")
-    if session['win_type'] == "tie":
-        output.write("Match Tied\n")
-    else:
-        output.write(f"{session['winner']} won by {session['win_margin']}\n")
-    
-    # Prepare response
-    output.seek(0)
+def live_snapshot(state):
+    # Read-only scoreboard for spectators
+    snapshot = {
+        "team1_name": state.get('team1_name'),
+        "team2_name": state.get('team2_name'),
+        "batting_team": state.get('batting_team'),
+        "bowling_team": state.get('bowling_team'),
+    }
+    engine = state.get('engine')
+    if engine is not None:
+        snapshot.update({
+            "innings": engine.innings,
+            "runs": engine.total_runs,
+            "wickets": engine.wickets,
+            "overs": f"{engine.current_over}.{engine.current_ball}",
+            "run_rate": round(engine.run_rate, 2),
+            "target": engine.target,
+            "free_hit": engine.free_hit,
+            "batsmen": [
+                {"name": b['name'], "runs": b['runs'], "balls": b['balls'], "striker": i == engine.striker_index}
+                for i, b in enumerate(engine.batsmen)
+                if i in (engine.striker_index, engine.non_striker_index)
+            ],
+            "bowler": bowler_figures(engine.bowlers[engine.current_bowler_index])
+                      if engine.current_bowler_index >= 0 else None,
+            "recent": [ball.to_dict() for ball in engine.log[-6:]],
+        })
+        if engine.innings == 2:
+            snapshot["required"] = engine.target - engine.total_runs
+            snapshot["balls_left"] = engine.overs * 6 - engine.balls_bowled
+            snapshot["par"] = engine.par_score
+    if 'winner' in state:
+        snapshot["result"] = state['winner'] if state['win_type'] == "tie" else f"{state['winner']} won by {state['win_margin']}"
+    return snapshot
+
+def live_refresh(match_store):
+    # For LiveHub: the scoreboard of a match saved since `version`, by this
+    # process or another
+    def refresh(match_id, version):
+        if match_store.version(match_id) in (None, version):
+            return None
+        state = match_store.load(match_id)
+        if state is None:
+            return None
+        return live_snapshot(state), state.get('version', 0)
+    return refresh
+
+def live_channel(match_id):
+    # Subscribe to the match's channel; the caller unsubscribes. A match
+    # that doesn't exist is a 404 before any channel is made for it.
+    def load():
+        state = store.load(match_id)
+        if state is None:
+            return None
+        return live_snapshot(state), state.get('version', 0)
+
+    channel = hub.subscribe(match_id, load)
+    if channel is None:
+        abort(404)
+    return channel
+
+@spectator.route('/match/<match_id>')
+def spectate(match_id):
+    if store.version(match_id) is None:
+        abort(404)
+    return render_page("live", match_id=match_id)
+
+@spectator.route('/match/<match_id>/live')
+def live_stream(match_id):
+    # Server-Sent Events: one event per change to the match
+    channel = live_channel(match_id)
+    last_seq = request.headers.get('Last-Event-ID', type=int) or 0
+    stream = hub.stream(channel, last_seq)
+    if stream is None:
+        hub.unsubscribe(channel)
+        return jsonify({"error": "Too many spectators, try polling"}), 503
+    response = Response(stream, mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Also run for a stream that's never read, after the app context is gone
+    unsubscribe = hub.unsubscribe
+    response.call_on_close(lambda: unsubscribe(channel))
+    return response
+
+def match_charts(state):
+    # Worm, manhattan, partnerships and fall of wickets for each innings
+    # started so far, from the series the engine keeps as it goes
+    innings = []
+    if 'first_innings_charts' in state:
+        innings.append(dict(state['first_innings_charts'], team=state['batting_first']))
+    if 'second_innings_charts' in state:
+        innings.append(dict(state['second_innings_charts'], team=state['batting_team']))
+    elif state.get('engine') is not None:
+        innings.append(dict(state['engine'].charts(), team=state['batting_team']))
+    return {"overs": state.get('overs'), "innings": innings}
+
+@spectator.route('/match/<match_id>/charts')
+def charts(match_id):
+    state = store.load(match_id)
+    if state is None:
+        abort(404)
+    return versioned_view(match_id, state.get('version', 0), 'charts',
+                          lambda: current_app.json.dumps(match_charts(state)), 'application/json')
+
+@spectator.route('/match/<match_id>/poll')
+def live_poll(match_id):
+    # Long-poll fallback for clients without EventSource
+    since = request.args.get('since', 0, type=int)
+    channel = live_channel(match_id)
+    try:
+        seq, data, _ = hub.wait(channel, since, 25)
+    finally:
+        hub.unsubscribe(channel)
+    if seq == since:
+        return '', 204
+    return Response(f'{{"seq":{seq},"state":{data}}}', mimetype='application/json',
+                    headers={'Cache-Control': 'no-cache'})
+
+@bp.route('/resume/<match_id>/<token>')
+def resume_match_by_id(match_id, token):
+    # The scorer's own link, for carrying on after losing the cookie or on
+    # another device
+    state = store.load(match_id)
+    if state is None or 'winner' in state or not secrets.compare_digest(state.get('scorer_token', ''), token):
+        abort(404)
+    session['match_id'] = match_id
+    return redirect(url_for('.resume_match'))
+
+@bp.route('/resume')
+def resume_match():
+    # Carry on with the session's match from wherever it got to
+    if 'engine' in match:
+        return redirect(step_url(match['engine'].next_step()))
+    if 'team1_name' in match:
+        return redirect(url_for('.toss_page'))
+    return redirect(url_for('.index'))
+
+def parse_teams(text):
+    # One team per line: "NAME: PLAYER, PLAYER, ..."
+    teams = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        name, _, players = line.partition(':')
+        players = [p.strip().upper() for p in players.split(',') if p.strip()]
+        if len(players) < 2:
+            raise ValueError(f"{name.strip() or 'Each team'} needs at least 2 players")
+        teams.append((name.strip().upper(), players))
+    return teams
+
+@bp.route('/tournaments', methods=['GET', 'POST'])
+def tournament_list():
+    error = None
+    if request.method == 'POST':
+        try:
+            teams = parse_teams(request.form['teams'])
+            tournament_id = tournaments.create(request.form['name'].strip(), request.form['format'],
+                                               int(request.form['overs']),
+                                               [(team, registry.register(players)) for team, players in teams])
+        except ValueError as e:
+            error = str(e)
+        else:
+            return redirect(url_for('.tournament_page', tournament_id=tournament_id))
+    return render_page("tournaments", tournaments=tournaments.recent(),
+                       formats=TOURNAMENT_FORMATS, error=error)
+
+@bp.route('/tournaments/<int:tournament_id>')
+def tournament_page(tournament_id):
+    tournament = tournaments.get(tournament_id)
+    if tournament is None:
+        abort(404)
+    return render_page("tournament", tournament=tournament,
+                       standings=tournaments.standings(tournament_id),
+                       fixtures=tournaments.fixtures(tournament_id))
+
+@bp.route('/tournaments/<int:tournament_id>/fixtures/<int:fixture_id>/start', methods=['POST'])
+def start_fixture(tournament_id, fixture_id):
+    fixture = tournaments.fixture(fixture_id)
+    if fixture is None or fixture['tournament_id'] != tournament_id:
+        abort(404)
+    if fixture['status'] == LIVE:
+        # Only its scorer carries on here; anyone else gets the scoreboard.
+        # Another device takes over through the scorer's resume link.
+        if session.get('match_id') == fixture['match_id']:
+            return redirect(url_for('.resume_match'))
+        return redirect(url_for('spectator.spectate', match_id=fixture['match_id']))
+    if fixture['status'] != SCHEDULED:
+        return redirect(url_for('.tournament_page', tournament_id=tournament_id))
+    match_id = store.new_id()
+    if not tournaments.start_fixture(fixture_id, match_id):
+        # Started from somewhere else in the meantime
+        return redirect(url_for('.tournament_page', tournament_id=tournament_id))
+    start_match(match_id)
+    match['team1_name'] = fixture['team1']
+    match['team2_name'] = fixture['team2']
+    for team in ('team1', 'team2'):
+        players = tournaments.squad(tournament_id, fixture[team])
+        match[team] = [player['name'] for player in players]
+        match[team + '_ids'] = [player['id'] for player in players]
+    match['overs'] = tournaments.get(tournament_id)['overs']
+    match['fixture'] = fixture_id
+    match['tournament'] = tournament_id
+    return redirect(url_for('.toss_page'))
+
+@spectator.route('/tournaments/<int:tournament_id>/standings')
+def tournament_standings(tournament_id):
+    tournament = tournaments.get(tournament_id)
+    if tournament is None:
+        abort(404)
+    return jsonify({"tournament": tournament, "standings": tournaments.standings(tournament_id)})
+
+def export_filename(ext):
     timestamp = datetime.now().strftime("ON %d-%m-%Y AT %H-%M-%S")
-    filename = f"CRICKET MATCH {timestamp}.txt"
-    
-    return send_file(
-        io.BytesIO(output.getvalue().encode('utf-8')),
-        mimetype='text/plain',
-        as_attachment=True,
-        download_name=filename
-    )
+    return f"CRICKET MATCH {timestamp}.{ext}"
+
+@bp.route('/download_summary')
+def download_summary():
+    fmt = request.args.get('format', 'text')
+    if fmt not in FORMATS or 'winner' not in match:
+        abort(404)
+    exporter, mimetype, ext = FORMATS[fmt]
+    # The generator holds its own reference to the finished match, so it
+    # keeps streaming after the request's match lock is released
+    return Response(exporter(g.match), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{export_filename(ext)}"'})
+
+def archive_date(name, days=0):
+    # YYYY-MM-DD query argument as a timestamp
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return (datetime.strptime(value, "%Y-%m-%d") + timedelta(days=days)).timestamp()
+    except ValueError:
+        abort(400)
+
+def archive_filters():
+    return {
+        'team': request.args.get('team'),
+        'player': request.args.get('player'),
+        'winner': request.args.get('winner'),
+        'result': request.args.get('result'),
+        'since': archive_date('since'),
+        # Inclusive of the whole `until` day
+        'until': archive_date('until', days=1),
+    }
+
+def archived_matches(match_ids=None, filters=None):
+    # Completed matches loaded one at a time as the zip is written, either
+    # by id or by walking the archive a page at a time
+    if match_ids:
+        for match_id in match_ids:
+            state = archive.get(match_id)
+            if state is None:
+                # Finished before the archive existed
+                state = store.load(match_id)
+            if state is not None and 'winner' in state:
+                yield match_id, state
+        return
+    before = None
+    while True:
+        rows, before = archive.search(before=before, limit=50, **filters)
+        for row in rows:
+            yield row['match_id'], archive.get(row['match_id'])
+        if before is None:
+            return
+
+@spectator.route('/archive/matches')
+def archive_search():
+    # ?team=&player=&winner=&result=runs|wickets|tie&since=&until=&before=&limit=
+    limit = min(max(request.args.get('limit', 20, type=int), 1), current_app.config['ARCHIVE_PAGE_LIMIT'])
+    rows, cursor = archive.search(before=request.args.get('before', type=int), limit=limit,
+                                  **archive_filters())
+    return jsonify({"matches": rows, "next": cursor})
+
+@spectator.route('/archive/matches/<match_id>')
+def archive_match(match_id):
+    state = archive.get(match_id, with_balls=False)
+    if state is None:
+        abort(404)
+    return jsonify(state)
+
+@spectator.route('/archive/matches/<match_id>/export')
+def archive_export(match_id):
+    fmt = request.args.get('format', 'text')
+    if fmt not in FORMATS:
+        abort(404)
+    state = archive.get(match_id, with_balls=fmt in ('balls', 'json'))
+    if state is None:
+        abort(404)
+    exporter, mimetype, ext = FORMATS[fmt]
+    return Response(exporter(state), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{export_filename(ext)}"'})
+
+@spectator.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.exposition(), mimetype='text/plain; version=0.0.4')
+
+@spectator.route('/players/<int:player_id>')
+@spectator.route('/players/<player_id>')
+def player_profile(player_id):
+    # Registry ids are numbers; players from imported scorebooks go by name
+    profile = archive.player(player_id)
+    if profile is None:
+        abort(404)
+    return jsonify(profile)
+
+@spectator.route('/leaderboards/<kind>')
+def leaderboard(kind):
+    # /leaderboards/batting?by=runs|sixes|fours, /leaderboards/bowling?by=wickets|maidens
+    by = request.args.get('by', 'runs' if kind == 'batting' else 'wickets')
+    limit = min(max(request.args.get('limit', 10, type=int), 1), current_app.config['ARCHIVE_PAGE_LIMIT'])
+    try:
+        leaders = archive.leaders(kind, by, limit)
+    except ValueError:
+        abort(404)
+    return jsonify({"kind": kind, "by": by, "leaders": leaders})
+
+@spectator.route('/export/matches.zip')
+def export_matches():
+    # ?ids=a,b,c or the /archive/matches filters, plus &format=csv
+    fmt = request.args.get('format', 'text')
+    if fmt not in FORMATS:
+        abort(404)
+    exporter, _, ext = FORMATS[fmt]
+    match_ids = [i for i in request.args.get('ids', '').split(',') if i]
+    matches = archived_matches(match_ids) if match_ids else archived_matches(filters=archive_filters())
+    entries = ((f"{match_id}.{ext}", exporter(state)) for match_id, state in matches)
+    return Response(stream_with_context(stream_zip(entries)), mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename="{export_filename("zip")}"'})
 
+# For several workers, e.g.:
+#   MATCH_STORE=sqlite gunicorn -w 4 --threads 8 'app:create_app()'
 if __name__ == "__main__":
-    app.run(debug=True, host="0.0.0.0", port=5001)
+    create_app().run(debug=True, host="0.0.0.0", port=5001)
@@ -0,0 +1,414 @@
+# archive.py
+# Completed matches, kept permanently in SQLite. A match is written once,
+# when its result is recorded. Summary columns and the lookup tables are
+# indexed for browsing history; scorecards and ball logs sit in a separate
+# table and are only read when a single match is opened or exported.
+#
+# Players are kept by id, so two players with the same name are two rows in
+# a match and two careers. The id is the registry's for matches scored here,
+# and the name for scorebook imports, which have nothing else; the id
+# columns have no type so the two never compare equal.
+import json
+import sqlite3
+import threading
+import time
+
+from balllog import BallLog
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS matches (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    match_id TEXT NOT NULL UNIQUE,
+    played_at REAL NOT NULL,
+    team1 TEXT NOT NULL,
+    team2 TEXT NOT NULL,
+    overs INTEGER NOT NULL,
+    toss_winner TEXT NOT NULL,
+    batting_first TEXT NOT NULL,
+    first_total INTEGER NOT NULL,
+    first_wickets INTEGER NOT NULL,
+    first_overs TEXT NOT NULL,
+    second_total INTEGER NOT NULL,
+    second_wickets INTEGER NOT NULL,
+    second_overs TEXT NOT NULL,
+    winner TEXT NOT NULL,
+    win_type TEXT NOT NULL,
+    win_margin TEXT NOT NULL,
+    target INTEGER
+);
+CREATE INDEX IF NOT EXISTS matches_played_at ON matches (played_at);
+CREATE INDEX IF NOT EXISTS matches_winner ON matches (winner, id);
+CREATE INDEX IF NOT EXISTS matches_win_type ON matches (win_type, id);
+
+CREATE TABLE IF NOT EXISTS match_teams (
+    team TEXT NOT NULL,
+    match_row INTEGER NOT NULL REFERENCES matches (id),
+    PRIMARY KEY (team, match_row)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS match_players (
+    player_id NOT NULL,
+    match_row INTEGER NOT NULL REFERENCES matches (id),
+    team TEXT NOT NULL,
+    player TEXT NOT NULL,
+    PRIMARY KEY (player_id, match_row, team)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS match_players_name ON match_players (player, match_row);
+CREATE INDEX IF NOT EXISTS match_players_match ON match_players (match_row, team);
+
+CREATE TABLE IF NOT EXISTS innings (
+    match_row INTEGER NOT NULL REFERENCES matches (id),
+    number INTEGER NOT NULL,
+    team TEXT NOT NULL,
+    batting TEXT NOT NULL,
+    bowling TEXT NOT NULL,
+    log BLOB,
+    max_overs INTEGER,
+    reductions TEXT,
+    PRIMARY KEY (match_row, number)
+) WITHOUT ROWID;
+
+-- Career totals, added to as each match is archived
+CREATE TABLE IF NOT EXISTS batting_careers (
+    player_id PRIMARY KEY,
+    player TEXT NOT NULL,
+    matches INTEGER NOT NULL DEFAULT 0,
+    innings INTEGER NOT NULL DEFAULT 0,
+    runs INTEGER NOT NULL DEFAULT 0,
+    balls INTEGER NOT NULL DEFAULT 0,
+    fours INTEGER NOT NULL DEFAULT 0,
+    sixes INTEGER NOT NULL DEFAULT 0,
+    outs INTEGER NOT NULL DEFAULT 0,
+    highest INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS batting_careers_runs ON batting_careers (runs);
+CREATE INDEX IF NOT EXISTS batting_careers_sixes ON batting_careers (sixes);
+CREATE INDEX IF NOT EXISTS batting_careers_fours ON batting_careers (fours);
+
+CREATE TABLE IF NOT EXISTS bowling_careers (
+    player_id PRIMARY KEY,
+    player TEXT NOT NULL,
+    innings INTEGER NOT NULL DEFAULT 0,
+    balls INTEGER NOT NULL DEFAULT 0,
+    runs INTEGER NOT NULL DEFAULT 0,
+    maidens INTEGER NOT NULL DEFAULT 0,
+    wickets INTEGER NOT NULL DEFAULT 0,
+    best_wickets INTEGER NOT NULL DEFAULT 0,
+    best_runs INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS bowling_careers_wickets ON bowling_careers (wickets);
+CREATE INDEX IF NOT EXISTS bowling_careers_maidens ON bowling_careers (maidens);
+"""
+
+# Archives from before players were kept by id: the old tables are moved
+# aside, to be copied into the new ones
+MIGRATE_TO_IDS = """
+BEGIN;
+ALTER TABLE match_players RENAME TO match_players_by_name;
+DROP INDEX IF EXISTS match_players_match;
+DROP TABLE IF EXISTS batting_careers;
+DROP TABLE IF EXISTS bowling_careers;
+COMMIT;
+"""
+
+# Columns added since archives were first made: (table, column, type)
+ADDED_COLUMNS = (
+    ('matches', 'target', 'INTEGER'),
+    ('innings', 'max_overs', 'INTEGER'),
+    ('innings', 'reductions', 'TEXT'),
+)
+
+BATTING_COLUMNS = ("player_id", "player", "matches", "innings", "runs", "balls", "fours", "sixes", "outs", "highest")
+BOWLING_COLUMNS = ("player_id", "player", "innings", "balls", "runs", "maidens", "wickets", "best_wickets", "best_runs")
+
+# Leaderboard orderings, each backed by an index
+BATTING_LEADERS = ('runs', 'sixes', 'fours')
+BOWLING_LEADERS = ('wickets', 'maidens')
+
+SUMMARY_COLUMNS = (
+    "id", "match_id", "played_at", "team1", "team2", "overs", "toss_winner", "batting_first",
+    "first_total", "first_wickets", "first_overs", "second_total", "second_wickets", "second_overs",
+    "winner", "win_type", "win_margin", "target",
+)
+
+PREFIXES = ('first', 'second')
+
+
+class MatchArchive:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(match_players)")]
+        if columns and 'player_id' not in columns:
+            conn.executescript(MIGRATE_TO_IDS)
+        conn.executescript(SCHEMA)
+        for table, column, kind in ADDED_COLUMNS:
+            if column not in [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {kind}")
+        with conn:
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'match_players_by_name'").fetchone():
+                self._copy_players_by_name(conn)
+            # Archives from before career tables existed
+            if (conn.execute("SELECT 1 FROM batting_careers LIMIT 1").fetchone() is None
+                    and conn.execute("SELECT 1 FROM matches LIMIT 1").fetchone() is not None):
+                self._rebuild_careers(conn)
+
+    def _connect(self):
+        # One connection per thread, as in SQLiteStore
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def record(self, match_id, match):
+        # Archive a completed match. Returns its row id, or None if it was
+        # archived already.
+        second = match['team2_name'] if match['batting_first'] == match['team1_name'] else match['team1_name']
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO matches (match_id, played_at, team1, team2, overs, toss_winner,"
+                " batting_first, first_total, first_wickets, first_overs, second_total, second_wickets,"
+                " second_overs, winner, win_type, win_margin, target)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (match_id, time.time(), match['team1_name'], match['team2_name'], match['overs'],
+                 match['toss_winner'], match['batting_first'],
+                 match['first_innings_total'], match['first_innings_wickets'], match['first_innings_overs'],
+                 match['second_innings_total'], match['second_innings_wickets'], match['second_innings_overs'],
+                 match['winner'], match['win_type'], match['win_margin'], match.get('target')),
+            )
+            if not cursor.rowcount:
+                return None
+            row = cursor.lastrowid
+            conn.executemany(
+                "INSERT OR IGNORE INTO match_teams (team, match_row) VALUES (?, ?)",
+                [(match['team1_name'], row), (match['team2_name'], row)],
+            )
+            players = [(player_id, name, match[team + '_name'])
+                       for team in ('team1', 'team2')
+                       for player_id, name in zip(match.get(team + '_ids', match[team]), match[team])]
+            conn.executemany(
+                "INSERT OR IGNORE INTO match_players (player_id, match_row, team, player) VALUES (?, ?, ?, ?)",
+                [(player_id, row, team, name) for player_id, name, team in players],
+            )
+            for number, (prefix, team) in enumerate(zip(PREFIXES, (match['batting_first'], second)), 1):
+                log = match.get(prefix + '_innings_log')
+                conn.execute(
+                    "INSERT INTO innings (match_row, number, team, batting, bowling, log, max_overs, reductions)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (row, number, team, json.dumps(match[prefix + '_innings_batsmen']),
+                     json.dumps(match[prefix + '_innings_bowlers']),
+                     log.to_bytes() if log is not None else None,
+                     match.get(prefix + '_innings_max_overs'),
+                     json.dumps(match.get(prefix + '_innings_reductions', []))),
+                )
+            self._add_careers(conn, [(player_id, name) for player_id, name, _ in players],
+                              [match[prefix + '_innings_batsmen'] for prefix in PREFIXES],
+                              [match[prefix + '_innings_bowlers'] for prefix in PREFIXES])
+            return row
+
+    def _add_careers(self, conn, players, batting, bowling):
+        # Fold one match's scorecards into the career tables, in the
+        # archiving transaction. players: (id, name) for both squads.
+        conn.executemany(
+            "INSERT INTO batting_careers (player_id, player, matches) VALUES (?, ?, 1)"
+            " ON CONFLICT (player_id) DO UPDATE SET player = excluded.player, matches = matches + 1",
+            list(dict(players).items()),
+        )
+        conn.executemany(
+            "UPDATE batting_careers SET innings = innings + 1, runs = runs + ?, balls = balls + ?,"
+            " fours = fours + ?, sixes = sixes + ?, outs = outs + ?, highest = max(highest, ?)"
+            " WHERE player_id = ?",
+            [(b['runs'], b['balls'], b['fours'], b['sixes'], 1 if b['out'] else 0, b['runs'], player_id(b))
+             for innings in batting for b in innings],
+        )
+        conn.executemany(
+            "INSERT INTO bowling_careers (player_id, player, innings, balls, runs, maidens, wickets,"
+            " best_wickets, best_runs)"
+            " VALUES (?1, ?2, 1, ?3, ?4, ?5, ?6, ?6, ?4)"
+            " ON CONFLICT (player_id) DO UPDATE SET player = ?2, innings = innings + 1, balls = balls + ?3,"
+            " runs = runs + ?4, maidens = maidens + ?5, wickets = wickets + ?6,"
+            " best_runs = CASE WHEN ?6 > best_wickets OR (?6 = best_wickets AND ?4 < best_runs)"
+            " THEN ?4 ELSE best_runs END,"
+            " best_wickets = max(best_wickets, ?6)",
+            [(player_id(b), b['name'], b['overs'] * 6 + b['balls'], b['runs'], b['maidens'], b['wickets'])
+             for innings in bowling for b in innings],
+        )
+
+    def _copy_players_by_name(self, conn):
+        # Squads from before players were kept by id, which kept one row for
+        # same-named teammates. The ids come from the scorecards, every one
+        # under that name for that side; players without any keep their name.
+        ids = {}
+        for row, team, batting, bowling, fielding in conn.execute(
+                "SELECT i.match_row, i.team, i.batting, i.bowling, t.team FROM innings i"
+                " JOIN match_teams t ON t.match_row = i.match_row AND t.team != i.team"):
+            for side, entries in ((team, json.loads(batting)), (fielding, json.loads(bowling))):
+                for entry in entries:
+                    ids.setdefault((row, side, entry['name']), {})[player_id(entry)] = None
+        conn.executemany(
+            "INSERT OR IGNORE INTO match_players (player_id, match_row, team, player) VALUES (?, ?, ?, ?)",
+            [(player, row, team, name)
+             for name, row, team in conn.execute("SELECT player, match_row, team FROM match_players_by_name")
+             for player in ids.get((row, team, name), [name])],
+        )
+        conn.execute("DROP TABLE match_players_by_name")
+        self._rebuild_careers(conn)
+
+    def _rebuild_careers(self, conn):
+        conn.execute("DELETE FROM batting_careers")
+        conn.execute("DELETE FROM bowling_careers")
+        for (row,) in conn.execute("SELECT id FROM matches ORDER BY id").fetchall():
+            players = conn.execute(
+                "SELECT player_id, player FROM match_players WHERE match_row = ?", (row,)).fetchall()
+            innings = conn.execute(
+                "SELECT batting, bowling FROM innings WHERE match_row = ? ORDER BY number", (row,)).fetchall()
+            self._add_careers(conn, players, [json.loads(batting) for batting, _ in innings],
+                              [json.loads(bowling) for _, bowling in innings])
+
+    def search(self, team=None, player=None, winner=None, result=None, since=None, until=None,
+               before=None, limit=20):
+        # Newest first, one page at a time. `before` is the cursor returned
+        # with the previous page. Pages walk the most selective index in match
+        # order, so each is a range scan however deep into history it is.
+        key = "m.id"
+        joins, where, params = [], [], []
+        if team:
+            key = "t.match_row"
+            joins.append("JOIN match_teams t ON t.match_row = m.id")
+            where.append("t.team = ?")
+            params.append(team)
+        if player:
+            key = "p.match_row"
+            joins.append("JOIN match_players p ON p.match_row = m.id")
+            where.append("p.player = ?")
+            params.append(player)
+        if winner:
+            where.append("m.winner = ?")
+            params.append(winner)
+        if result:
+            where.append("m.win_type = ?")
+            params.append(result)
+        if since is not None:
+            where.append("m.played_at >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("m.played_at < ?")
+            params.append(until)
+        if before is not None:
+            where.append(key + " < ?")
+            params.append(before)
+        sql = "SELECT DISTINCT " + ", ".join("m." + column for column in SUMMARY_COLUMNS) + " FROM matches m"
+        if joins:
+            sql += " " + " ".join(joins)
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {key} DESC LIMIT ?"
+        params.append(limit + 1)
+        rows = [dict(zip(SUMMARY_COLUMNS, row)) for row in self._connect().execute(sql, params)]
+        cursor = rows[limit - 1]['id'] if len(rows) > limit else None
+        return rows[:limit], cursor
+
+    def summary(self, match_id):
+        row = self._connect().execute(
+            "SELECT " + ", ".join(SUMMARY_COLUMNS) + " FROM matches WHERE match_id = ?", (match_id,)
+        ).fetchone()
+        return dict(zip(SUMMARY_COLUMNS, row)) if row else None
+
+    def get(self, match_id, with_balls=True):
+        # The match in the same shape as a completed match in the store, so
+        # views and exporters can take either
+        summary = self.summary(match_id)
+        if summary is None:
+            return None
+        match = {
+            'team1_name': summary['team1'],
+            'team2_name': summary['team2'],
+            'overs': summary['overs'],
+            'toss_winner': summary['toss_winner'],
+            'batting_first': summary['batting_first'],
+            'winner': summary['winner'],
+            'win_type': summary['win_type'],
+            'win_margin': summary['win_margin'],
+            'target': summary['target'],
+            'played_at': summary['played_at'],
+        }
+        for prefix in PREFIXES:
+            match[prefix + '_innings_total'] = summary[prefix + '_total']
+            match[prefix + '_innings_wickets'] = summary[prefix + '_wickets']
+            match[prefix + '_innings_overs'] = summary[prefix + '_overs']
+        # Squads
+        conn = self._connect()
+        for team in ('team1', 'team2'):
+            players = conn.execute(
+                "SELECT player_id, player FROM match_players WHERE match_row = ? AND team = ?",
+                (summary['id'], summary[team])).fetchall()
+            match[team] = [name for _, name in players]
+            match[team + '_ids'] = [player_id for player_id, _ in players]
+        columns = "number, batting, bowling, max_overs, reductions, " + ("log" if with_balls else "NULL")
+        for number, batting, bowling, max_overs, reductions, log in conn.execute(
+                f"SELECT {columns} FROM innings WHERE match_row = ? ORDER BY number", (summary['id'],)):
+            prefix = PREFIXES[number - 1]
+            match[prefix + '_innings_batsmen'] = json.loads(batting)
+            match[prefix + '_innings_bowlers'] = json.loads(bowling)
+            match[prefix + '_innings_max_overs'] = max_overs
+            match[prefix + '_innings_reductions'] = json.loads(reductions or '[]')
+            if log is not None:
+                match[prefix + '_innings_log'] = BallLog.from_bytes(log)
+        return match
+
+    def player(self, player_id):
+        # Career batting and bowling for one player, or None if unknown
+        conn = self._connect()
+        batting = conn.execute(
+            "SELECT " + ", ".join(BATTING_COLUMNS) + " FROM batting_careers WHERE player_id = ?", (player_id,)
+        ).fetchone()
+        bowling = conn.execute(
+            "SELECT " + ", ".join(BOWLING_COLUMNS) + " FROM bowling_careers WHERE player_id = ?", (player_id,)
+        ).fetchone()
+        if batting is None and bowling is None:
+            return None
+        return {
+            'player_id': player_id,
+            'player': (batting or bowling)[1],
+            'batting': batting_record(batting) if batting else None,
+            'bowling': bowling_record(bowling) if bowling else None,
+        }
+
+    def leaders(self, kind, by, limit=10):
+        # Top players straight off the leaderboard index
+        if kind == 'batting' and by in BATTING_LEADERS:
+            table, columns, record = 'batting_careers', BATTING_COLUMNS, batting_record
+        elif kind == 'bowling' and by in BOWLING_LEADERS:
+            table, columns, record = 'bowling_careers', BOWLING_COLUMNS, bowling_record
+        else:
+            raise ValueError(f"Unknown leaderboard: {kind} by {by}")
+        rows = self._connect().execute(
+            f"SELECT {', '.join(columns)} FROM {table} WHERE {by} > 0 ORDER BY {by} DESC LIMIT ?", (limit,)
+        )
+        return [record(row) for row in rows]
+
+
+def player_id(entry):
+    # Scorecard entries from before players had ids go by name
+    return entry.get('id', entry['name'])
+
+
+def batting_record(row):
+    record = dict(zip(BATTING_COLUMNS, row))
+    record['average'] = round(record['runs'] / record['outs'], 2) if record['outs'] else None
+    record['strike_rate'] = round(record['runs'] / record['balls'] * 100, 2) if record['balls'] else 0
+    return record
+
+
+def bowling_record(row):
+    record = dict(zip(BOWLING_COLUMNS, row))
+    record['overs'] = f"{record['balls'] // 6}.{record['balls'] % 6}"
+    record['economy'] = round(record['runs'] / (record['balls'] / 6), 2) if record['balls'] else 0
+    record['average'] = round(record['runs'] / record['wickets'], 2) if record['wickets'] else None
+    record['best'] = f"{record.pop('best_wickets')}/{record.pop('best_runs')}"
+    return record
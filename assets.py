@@ -0,0 +1,146 @@
+# assets.py
+# Static files under content-hashed URLs, and compression for everything
+# else. At startup every file in the static folder is read, hashed and, for
+# text types, compressed once with gzip (and brotli when the brotli package
+# is installed). url_for('static', ...) then points at style.<hash>.css, which
+# browsers may cache forever: a changed file gets a new URL.
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+from flask import Response, current_app, request
+from flask.sessions import SecureCookieSessionInterface
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Cached for a year and never revalidated
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+# Static types worth compressing; images are compressed already
+COMPRESSIBLE = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+# Dynamic responses compressed on the way out
+COMPRESSED_MIMETYPES = ('text/html', 'application/json')
+
+_FINGERPRINTED = re.compile(r'^(?P<stem>.+)\.(?P<digest>[0-9a-f]{12})(?P<ext>\.[^./]+)$')
+
+
+def accepted_encodings():
+    # Encodings the client accepts, best first
+    encodings = []
+    if brotli is not None and request.accept_encodings['br']:
+        encodings.append('br')
+    if request.accept_encodings['gzip']:
+        encodings.append('gzip')
+    return encodings
+
+
+def compress(data, encoding, level):
+    if encoding == 'br':
+        # Brotli's quality runs 0-11; scale the gzip-style level
+        return brotli.compress(data, quality=min(11, level + 2))
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+class Asset:
+    def __init__(self, path, filename):
+        with open(path, 'rb') as f:
+            self.body = f.read()
+        self.digest = hashlib.sha256(self.body).hexdigest()[:12]
+        stem, ext = os.path.splitext(filename)
+        self.url_name = f"{stem}.{self.digest}{ext}"
+        self.mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        # Encoding -> body, only kept where it is actually smaller
+        self.variants = {}
+        if self.mimetype.startswith(COMPRESSIBLE):
+            for encoding in ('br', 'gzip') if brotli is not None else ('gzip',):
+                compressed = compress(self.body, encoding, 9)
+                if len(compressed) < len(self.body):
+                    self.variants[encoding] = compressed
+
+
+class AssetSessionInterface(SecureCookieSessionInterface):
+    # Static files never refresh the session cookie, so a Set-Cookie header
+    # doesn't stop shared caches from keeping them
+    def save_session(self, app, session, response):
+        if request.endpoint != 'static':
+            super().save_session(app, session, response)
+
+
+class StaticAssets:
+    def __init__(self, app):
+        self.app = app
+        self.assets = {}
+        # Fingerprinted name -> source filename
+        self.by_url_name = {}
+        root = app.static_folder
+        for directory, _, files in os.walk(root):
+            for name in files:
+                path = os.path.join(directory, name)
+                filename = os.path.relpath(path, root).replace(os.sep, '/')
+                asset = Asset(path, filename)
+                self.assets[filename] = asset
+                self.by_url_name[os.path.join(os.path.dirname(filename), asset.url_name).lstrip('/')] = filename
+
+    def install(self, app):
+        # Rewrite url_for('static', filename=...) to the fingerprinted name
+        # and take over the static route
+        @app.url_defaults
+        def fingerprint(endpoint, values):
+            if endpoint == 'static' and values.get('filename') in self.assets:
+                asset = self.assets[values['filename']]
+                values['filename'] = os.path.join(os.path.dirname(values['filename']), asset.url_name).lstrip('/')
+
+        app.view_functions['static'] = self.serve
+        app.session_interface = AssetSessionInterface()
+        app.after_request(compress_dynamic)
+
+    def serve(self, filename):
+        source = self.by_url_name.get(filename)
+        if source is None:
+            match = _FINGERPRINTED.match(filename)
+            if match and match['stem'] + match['ext'] in self.assets:
+                # A page from before a deploy asking for an older version;
+                # the current one is the best there is, but not for keeps
+                return self.response(self.assets[match['stem'] + match['ext']], 'no-cache')
+            # Unversioned URLs keep Flask's default handling
+            return self.app.send_static_file(filename)
+        return self.response(self.assets[source], IMMUTABLE)
+
+    def response(self, asset, cache_control):
+        if request.if_none_match.contains_weak(asset.digest):
+            response = Response(status=304)
+        else:
+            encoding = next((e for e in accepted_encodings() if e in asset.variants), None)
+            response = Response(asset.variants[encoding] if encoding else asset.body, mimetype=asset.mimetype)
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(asset.digest)
+        response.headers['Cache-Control'] = cache_control
+        response.vary.add('Accept-Encoding')
+        return response
+
+
+def compress_dynamic(response):
+    # Compress HTML and JSON bodies for clients that accept it. Streamed
+    # responses (event streams, downloads) are left alone so they still
+    # flush as they go.
+    if (response.is_streamed or response.direct_passthrough or response.status_code != 200
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSED_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    encodings = accepted_encodings()
+    if len(body) < current_app.config['COMPRESS_MIN_SIZE'] or not encodings:
+        return response
+    response.set_data(compress(body, encodings[0], current_app.config['COMPRESS_LEVEL']))
+    response.headers['Content-Encoding'] = encodings[0]
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        # Same content, different bytes
+        response.set_etag(etag, weak=True)
+    return response
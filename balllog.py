@@ -0,0 +1,220 @@
+# balllog.py
+# Compact, column-oriented ball-by-ball log. Player names are interned to
+# small integer ids and each delivery takes a handful of bytes instead of a
+# 9-key dict.
+import base64
+import struct
+import sys
+from array import array
+
+from store import register_type
+
+EXTRA_TYPES = (None, 'WD', 'NB')
+WICKET_TYPES = (None, 'Bowled', 'Caught', 'LBW', 'Run Out', 'Stumped', 'Hit Wicket')
+
+_EXTRA_CODES = {name: code for code, name in enumerate(EXTRA_TYPES)}
+_WICKET_CODES = {name: code for code, name in enumerate(WICKET_TYPES)}
+
+# Column name -> array typecode. The "kind" column packs the extra type in
+# the low 2 bits and the dismissal type in the bits above.
+_COLUMNS = (
+    ('over', 'H'),
+    ('ball', 'B'),
+    ('batsman', 'H'),
+    ('bowler', 'H'),
+    ('runs', 'b'),
+    ('kind', 'B'),
+)
+
+_FORMAT_VERSION = 1
+_HEADER = struct.Struct('<BII')
+_NAME_LEN = struct.Struct('<H')
+
+
+class Ball:
+    # Read-only view of one delivery in a BallLog
+    __slots__ = ('_log', '_i')
+
+    def __init__(self, log, i):
+        self._log = log
+        self._i = i
+
+    @property
+    def over(self):
+        return self._log._over[self._i]
+
+    @property
+    def ball(self):
+        return self._log._ball[self._i]
+
+    @property
+    def batsman(self):
+        return self._log.players[self._log._batsman[self._i]]
+
+    @property
+    def bowler(self):
+        return self._log.players[self._log._bowler[self._i]]
+
+    @property
+    def runs(self):
+        return self._log._runs[self._i]
+
+    @property
+    def is_wicket(self):
+        return self._log._kind[self._i] >> 2 != 0
+
+    @property
+    def wicket_type(self):
+        return WICKET_TYPES[self._log._kind[self._i] >> 2]
+
+    @property
+    def is_extra(self):
+        return self._log._kind[self._i] & 3 != 0
+
+    @property
+    def extra_type(self):
+        return EXTRA_TYPES[self._log._kind[self._i] & 3]
+
+    def to_dict(self):
+        return {
+            "over": self.over,
+            "ball": self.ball,
+            "batsman": self.batsman,
+            "bowler": self.bowler,
+            "runs": self.runs,
+            "is_wicket": self.is_wicket,
+            "wicket_type": self.wicket_type,
+            "is_extra": self.is_extra,
+            "extra_type": self.extra_type,
+        }
+
+
+class BallLog:
+    def __init__(self):
+        self.players = []
+        self._player_ids = {}
+        for name, typecode in _COLUMNS:
+            setattr(self, '_' + name, array(typecode))
+        # Index of the first delivery of each over, in order
+        self._over_starts = array('I')
+
+    def player_id(self, name):
+        # Intern a player name, returning its id in this log
+        pid = self._player_ids.get(name)
+        if pid is None:
+            pid = len(self.players)
+            self.players.append(name)
+            self._player_ids[name] = pid
+        return pid
+
+    def append(self, over, ball, batsman, bowler, runs, wicket_type=None, extra_type=None):
+        # Every delivery has both players; the log can't store a missing one
+        if batsman is None or bowler is None:
+            raise ValueError("A delivery needs a batsman and a bowler")
+        if not self._over or self._over[-1] != over:
+            self._over_starts.append(len(self._over))
+        self._over.append(over)
+        self._ball.append(ball)
+        self._batsman.append(self.player_id(batsman))
+        self._bowler.append(self.player_id(bowler))
+        self._runs.append(runs)
+        self._kind.append(_WICKET_CODES[wicket_type] << 2 | _EXTRA_CODES[extra_type])
+
+    def truncate(self, length):
+        # Drop every delivery from index `length` onwards
+        for name, _ in _COLUMNS:
+            del getattr(self, '_' + name)[length:]
+        while self._over_starts and self._over_starts[-1] >= length:
+            self._over_starts.pop()
+
+    def over_groups(self, before=None, limit=None):
+        # Newest-first (over, start, end) ranges for the overs numbered below
+        # `before` (all overs if None), at most `limit` of them
+        starts = self._over_starts
+        lo, hi = 0, len(starts)
+        if before is not None:
+            # Over numbers only ever increase through the log
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self._over[starts[mid]] < before:
+                    lo = mid + 1
+                else:
+                    hi = mid
+        end_position = lo if before is not None else len(starts)
+        start_position = 0 if limit is None else max(0, end_position - limit)
+        groups = []
+        for position in range(end_position - 1, start_position - 1, -1):
+            start = starts[position]
+            end = starts[position + 1] if position + 1 < len(starts) else len(self)
+            groups.append((self._over[start], start, end))
+        return groups
+
+    def __len__(self):
+        return len(self._over)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [Ball(self, j) for j in range(*i.indices(len(self)))]
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("ball index out of range")
+        return Ball(self, i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield Ball(self, i)
+
+    def __reversed__(self):
+        for i in range(len(self) - 1, -1, -1):
+            yield Ball(self, i)
+
+    def to_bytes(self):
+        names = b''.join(
+            _NAME_LEN.pack(len(encoded)) + encoded
+            for encoded in (name.encode('utf-8') for name in self.players)
+        )
+        parts = [_HEADER.pack(_FORMAT_VERSION, len(self), len(names)), names]
+        for name, _ in _COLUMNS:
+            column = getattr(self, '_' + name)
+            if sys.byteorder == 'big':
+                column = array(column.typecode, column)
+                column.byteswap()
+            parts.append(column.tobytes())
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        version, count, names_len = _HEADER.unpack_from(data)
+        if version != _FORMAT_VERSION:
+            raise ValueError(f"Unsupported ball log version: {version}")
+        log = cls()
+        offset = _HEADER.size
+        end = offset + names_len
+        while offset < end:
+            (size,) = _NAME_LEN.unpack_from(data, offset)
+            offset += _NAME_LEN.size
+            log.player_id(bytes(data[offset:offset + size]).decode('utf-8'))
+            offset += size
+        for name, typecode in _COLUMNS:
+            column = getattr(log, '_' + name)
+            size = column.itemsize * count
+            column.frombytes(data[offset:offset + size])
+            if sys.byteorder == 'big':
+                column.byteswap()
+            offset += size
+        for i, over in enumerate(log._over):
+            if i == 0 or log._over[i - 1] != over:
+                log._over_starts.append(i)
+        return log
+
+    def to_json(self):
+        return base64.b64encode(self.to_bytes()).decode('ascii')
+
+    @classmethod
+    def from_json(cls, data):
+        return cls.from_bytes(base64.b64decode(data))
+
+
+register_type('balllog', BallLog)
@@ -0,0 +1,270 @@
+# bench.py
+# End-to-end benchmark. Plays randomized matches through the scoring pages
+# with the Flask test client, the same way a scorer's browser does, and
+# records per-request latency, cookie and stored match size per ball,
+# template render time and matches/sec with several scorers at once.
+#
+#   python bench.py [--matches 20] [--threads 4] [--overs 5] [--save bench.json]
+#   python bench.py --baseline bench.json    # exit 1 on a regression
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+from flask import before_render_template, template_rendered
+from werkzeug.datastructures import MultiDict
+
+from app import create_app
+from store import dumps
+
+
+class Recorder:
+    # Samples by name, from any number of threads
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, value):
+        with self._lock:
+            self.samples.setdefault(name, []).append(value)
+
+    def summary(self):
+        return {name: distribution(values) for name, values in sorted(self.samples.items())}
+
+
+def distribution(values):
+    values = sorted(values)
+
+    def pct(p):
+        return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+    return {
+        'count': len(values),
+        'mean': statistics.fmean(values),
+        'p50': pct(50),
+        'p90': pct(90),
+        'p99': pct(99),
+        'max': values[-1],
+    }
+
+
+def options(html, name):
+    found = re.search(r'<select name="%s"[^>]*>(.*?)</select>' % name, html, re.S)
+    return re.findall(r'<option value="([^"]*)"', found.group(1)) if found else []
+
+
+class Scorer:
+    # One simulated scorer with their own browser session
+    def __init__(self, app, recorder, rnd):
+        self.app = app
+        self.client = app.test_client()
+        self.recorder = recorder
+        self.rnd = rnd
+
+    def request(self, method, path, **kwargs):
+        start = time.perf_counter()
+        response = self.client.open(path, method=method, **kwargs)
+        elapsed = time.perf_counter() - start
+        label = path.split('?')[0]
+        self.recorder.add(f"{method} {label}", elapsed * 1000)
+        return response, elapsed
+
+    def play(self, squad, overs):
+        rnd = self.rnd
+        players = [('team1_name', 'HOME'), ('team2_name', 'AWAY'), ('overs', str(overs))]
+        players += [('team1', f'H{i}') for i in range(squad)] + [('team2', f'A{i}') for i in range(squad)]
+        self.request('POST', '/add_players', data=MultiDict(players))
+        self.request('GET', '/perform_toss')
+        response, _ = self.request('POST', '/toss_decision', data={'choice': rnd.choice(['bat', 'bowl'])})
+        location = response.headers['Location']
+        for _ in range(10000):
+            response, elapsed = self.request('GET', location)
+            if response.status_code == 302:
+                location = response.headers['Location']
+                continue
+            html = response.get_data(as_text=True)
+            if 'name="striker"' in html:
+                batsmen = options(html, 'striker')
+                response, _ = self.request('POST', location, data={'striker': batsmen[0], 'non_striker': batsmen[1]})
+            elif 'name="bowler"' in html:
+                response, _ = self.request('POST', location, data={'bowler': rnd.choice(options(html, 'bowler'))})
+            elif 'name="new_batsman"' in html:
+                response, _ = self.request('POST', location,
+                                           data={'new_batsman': options(html, 'new_batsman')[0]})
+            elif 'id="ball-form"' in html:
+                response, posted = self.request('POST', '/score', data=self.delivery(html))
+                # A ball, as the scorer sees it: the post and the page after it
+                self.recorder.add('ball', (posted + elapsed) * 1000)
+                self.measure_state()
+            elif 'Match Result' in html:
+                return
+            else:
+                raise RuntimeError(f"Unexpected page at {location}")
+            if response.status_code != 302:
+                raise RuntimeError(f"{response.status_code} from {location}")
+            location = response.headers['Location']
+        raise RuntimeError("Match didn't finish")
+
+    def delivery(self, html):
+        rnd = self.rnd
+        form = {'runs': str(rnd.choice([0, 0, 0, 1, 1, 2, 4, 6, -1, -2])),
+                # A new key per ball, as the page's script makes
+                'ball_key': uuid.uuid4().hex}
+        if int(form['runs']) >= 0 and rnd.random() < 0.05:
+            form['is_wicket'] = 'on'
+            form['wicket_type'] = rnd.choice(['Bowled', 'Caught', 'LBW', 'Run Out'])
+            if form['wicket_type'] == 'Run Out':
+                form['run_out_batsman'] = rnd.choice(options(html, 'run_out_batsman'))
+        return form
+
+    def measure_state(self):
+        cookie = self.client.get_cookie('session')
+        self.recorder.add('cookie bytes', len(cookie.value) if cookie else 0)
+        with self.client.session_transaction() as session:
+            match_id = session.get('match_id')
+        state = self.app.extensions['match_store'].load(match_id)
+        self.recorder.add('match bytes', len(dumps(state)))
+
+
+def time_templates(app, recorder):
+    started = threading.local()
+
+    def before(sender, template, context, **extra):
+        started.at = time.perf_counter()
+
+    def after(sender, template, context, **extra):
+        recorder.add(f"render {context.get('page', template.name)}", (time.perf_counter() - started.at) * 1000)
+
+    before_render_template.connect(before, app, weak=False)
+    template_rendered.connect(after, app, weak=False)
+
+
+def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        config = {
+            'TESTING': True,
+            'MATCH_STORE': args.store,
+            'MATCH_STORE_PATH': os.path.join(tmp, 'matches.db' if args.store == 'sqlite' else 'matches'),
+            'ARCHIVE_PATH': os.path.join(tmp, 'archive.db'),
+            'MATCH_JOURNAL_PATH': os.path.join(tmp, 'journal') if args.journal else '',
+        }
+
+        # Latency, sizes and render times with one scorer
+        app = create_app(config)
+        serial = Recorder()
+        time_templates(app, serial)
+        start = time.perf_counter()
+        for seed in range(args.matches):
+            Scorer(app, serial, random.Random(seed)).play(args.squad, args.overs)
+        serial_elapsed = time.perf_counter() - start
+
+        # Throughput with several scorers at once, on a fresh app and with
+        # different matches so nothing is served from the serial run's caches
+        app = create_app(config)
+        concurrent = Recorder()
+        time_templates(app, concurrent)
+        errors = []
+
+        def worker(seeds):
+            try:
+                for seed in seeds:
+                    Scorer(app, concurrent, random.Random(seed)).play(args.squad, args.overs)
+            except Exception as e:
+                errors.append(e)
+
+        seeds = range(args.matches, args.matches * 2)
+        threads = [threading.Thread(target=worker, args=(seeds[i::args.threads],))
+                   for i in range(args.threads)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        concurrent_elapsed = time.perf_counter() - start
+        if errors:
+            raise errors[0]
+
+    return {
+        'config': {'matches': args.matches, 'threads': args.threads, 'overs': args.overs,
+                   'squad': args.squad, 'store': args.store, 'journal': args.journal},
+        'serial': {'matches_per_sec': args.matches / serial_elapsed, 'samples': serial.summary()},
+        'concurrent': {'matches_per_sec': args.matches / concurrent_elapsed, 'samples': concurrent.summary()},
+    }
+
+
+# (phase, sample, statistic) compared against a baseline; higher is worse
+# except for throughput
+WATCHED = (
+    ('serial', 'POST /score', 'p50'),
+    ('serial', 'POST /score', 'p90'),
+    ('serial', 'GET /score', 'p50'),
+    ('serial', 'ball', 'p90'),
+    ('serial', 'render score', 'p50'),
+    ('serial', 'match bytes', 'max'),
+)
+
+
+def regressions(results, baseline, tolerance):
+    found = []
+    for phase, sample, stat in WATCHED:
+        old = baseline[phase]['samples'].get(sample, {}).get(stat)
+        new = results[phase]['samples'].get(sample, {}).get(stat)
+        if old and new and new > old * (1 + tolerance):
+            found.append(f"{phase} {sample} {stat}: {old:.3f} -> {new:.3f}")
+    for phase in ('serial', 'concurrent'):
+        old, new = baseline[phase]['matches_per_sec'], results[phase]['matches_per_sec']
+        if new < old * (1 - tolerance):
+            found.append(f"{phase} matches/sec: {old:.2f} -> {new:.2f}")
+    return found
+
+
+def report(results):
+    for phase in ('serial', 'concurrent'):
+        data = results[phase]
+        print(f"\n{phase}: {data['matches_per_sec']:.2f} matches/sec")
+        print(f"  {'sample':<28} {'count':>7} {'mean':>9} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}")
+        for name, d in data['samples'].items():
+            print(f"  {name:<28} {d['count']:>7} {d['mean']:>9.3f} {d['p50']:>9.3f} {d['p90']:>9.3f} "
+                  f"{d['p99']:>9.3f} {d['max']:>9.3f}")
+    print("\nTimes in ms, sizes in bytes")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark full matches through the scoring pages")
+    parser.add_argument('--matches', type=int, default=20)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--overs', type=int, default=5)
+    parser.add_argument('--squad', type=int, default=6)
+    parser.add_argument('--store', default='memory', choices=('memory', 'sqlite', 'filesystem'))
+    parser.add_argument('--no-journal', dest='journal', action='store_false', help="don't journal matches")
+    parser.add_argument('--save', help="write the results to this JSON file")
+    parser.add_argument('--baseline', help="compare against results saved earlier")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown, as a fraction")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    report(results)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['config'] != results['config']:
+            print(f"Note: baseline was run with {baseline['config']}")
+        found = regressions(results, baseline, args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}")
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+# dls.py
+# Duckworth-Lewis targets for matches cut short by rain. A side's resources
+# are the overs it has left and the wickets it has in hand, as a percentage
+# of what a side has at the start of a 50-over innings. The whole table is
+# built once at import; every lookup after that is array indexing, so the
+# par score can be worked out on every ball, or for many balls at once.
+import numpy as np
+
+
+# Longest innings in the table; longer ones are looked up as 50 overs,
+# where the curves have all but levelled off
+MAX_OVERS = 50
+MAX_BALLS = MAX_OVERS * 6
+
+# Resource curves Z(u, w) = F(w) * (1 - exp(-DECAY * u / F(w))) for u overs
+# left with w wickets lost. DECAY and F are fitted to the Standard Edition
+# table: 56.6% left with 20 overs to go and none down, and 100, 93.4, 85.1,
+# 74.9, 62.7, 49.0, 34.9, 22.0, 11.9 and 4.7% with all 50 overs to go.
+DECAY = 0.0275
+WICKET_FACTOR = (1.0, 0.885, 0.7606, 0.631, 0.5006, 0.3758, 0.2621, 0.1644, 0.0889, 0.0351)
+
+# Average 50-over first-innings score, for when the side batting second
+# ends up with more resources than the first had
+G50 = 245
+
+
+def _table():
+    overs_left = np.arange(MAX_BALLS + 1)[:, None] / 6
+    factor = np.array(WICKET_FACTOR)[None, :]
+    curves = factor * (1 - np.exp(-DECAY * overs_left / factor))
+    table = np.zeros((MAX_BALLS + 1, 11))
+    table[:, :10] = curves / curves[-1, 0] * 100
+    # All out: nothing left, whatever the overs
+    return table
+
+
+# Percentage of resources left, indexed [balls left, wickets lost]
+RESOURCES = _table()
+
+
+def resources(balls_left, wickets_lost, squad_size=11):
+    # Works on numbers or arrays. Wickets are scaled to a side of eleven,
+    # so a side of six losing its fifth wicket is all out here too.
+    balls = np.clip(balls_left, 0, MAX_BALLS)
+    lost = np.minimum(np.asarray(wickets_lost) * 10 // (squad_size - 1), 10)
+    return RESOURCES[balls, lost]
+
+
+def par(runs, first_resources, used):
+    # Runs the side batting second needs to be level with the first side's
+    # `runs`, having used `used` resources. Works on arrays of `used` too.
+    used = np.asarray(used, dtype=float)
+    return np.where(used <= first_resources, runs * (used / first_resources),
+                    runs + G50 * (used - first_resources) / 100)
+
+
+def revised_target(runs, first_resources, second_resources):
+    # An unchanged match keeps the usual target of one more than scored
+    return int(par(runs, first_resources, second_resources)) + 1
@@ -0,0 +1,687 @@
+# engine.py
+# Scoring rules for a match, independent of Flask. Routes feed the engine
+# deliveries and player selections, then ask it what the scorer has to do
+# next. Every delivery is applied in O(1) against running totals.
+#
+# Every input is also kept in an event list, with a checkpoint taken at the
+# start of each over. Undoing or correcting a delivery restores the nearest
+# checkpoint and replays only the events after it. Only the innings' first
+# checkpoint and those of the last few overs are kept, and they hold the
+# over index and chart series by length, so they stay the same size
+# however long the innings gets.
+#
+# Each over also gets an entry in an over index (runs, extras, wickets, legal
+# balls, bowler, maiden), and chart series (partnerships, fall of wickets)
+# are kept up to date the same way, so nothing ever rescans the log for
+# over summaries, maidens or charts.
+#
+# Players are {"id", "name"} dicts and are told apart by id, so two players
+# with the same name never get mixed up.
+import dls
+from balllog import BallLog, WICKET_TYPES
+from store import register_type
+
+# What the scorer has to do next. These match the route names in app.py.
+SELECT_BATSMEN = 'select_batsmen'
+NEW_BATSMAN = 'new_batsman'
+SELECT_BOWLER = 'select_bowler'
+SCORE = 'score'
+INNINGS_END = 'innings_end'
+
+WIDE = -1
+NO_BALL = -2
+
+# The only ways to be out off a wide or a no ball
+EXTRA_DISMISSALS = {
+    WIDE: ('Stumped', 'Run Out', 'Hit Wicket'),
+    NO_BALL: ('Run Out',),
+}
+
+# Scalar engine state, copied as-is by snapshot()/restore()
+_STATE = (
+    'innings',
+    'overs',
+    'squad_size',
+    'target',
+    'current_over',
+    'current_ball',
+    'total_runs',
+    'wickets',
+    'striker_index',
+    'non_striker_index',
+    'current_bowler_index',
+    'current_bowler',
+    'previous_bowler',
+    'previous_bowler_id',
+    'free_hit',
+    'innings_complete',
+    'partnership_open',
+    'resources',
+    'first_innings_runs',
+    'first_innings_resources',
+)
+
+# Series that only ever grow, apart from their last entry
+_SERIES = ('over_index', 'partnerships', 'fall_of_wickets')
+
+# Over checkpoints kept besides the innings' first. Correcting anything
+# older replays from the first.
+CHECKPOINTS_KEPT = 3
+
+
+def check_delivery(runs, wicket_type):
+    # A delivery that could have happened: runs 0-6 off the bat or one
+    # extra, and a dismissal that's possible off it
+    if type(runs) is not int or not NO_BALL <= runs <= 6:
+        raise ValueError(f"Invalid runs value: {runs}")
+    if wicket_type not in WICKET_TYPES:
+        raise ValueError(f"Invalid wicket type: {wicket_type}")
+    if wicket_type and runs in EXTRA_DISMISSALS and wicket_type not in EXTRA_DISMISSALS[runs]:
+        raise ValueError(f"Can't be out {wicket_type} off a {'wide' if runs == WIDE else 'no ball'}")
+
+
+def new_batsman_entry(player):
+    return {"id": player['id'], "name": player['name'], "runs": 0, "balls": 0, "fours": 0, "sixes": 0, "out": False, "wicket_type": None}
+
+
+def new_over_entry(bowler):
+    # bowler is the position in MatchEngine.bowlers of the bowler who started
+    # the over, and bowlers has [position, legal balls, runs] for each who
+    # bowled in it, in case one takes over part way through. Wides and no
+    # balls are charged to the bowler, so any run spoils a maiden.
+    return {"bowler": bowler, "bowlers": [], "runs": 0, "extras": 0, "wickets": 0, "run_outs": 0, "balls": 0,
+            "maiden": False}
+
+
+def copy_over_entry(over):
+    return dict(over, bowlers=[list(spell) for spell in over.get('bowlers', ())])
+
+
+def new_bowler_entry(player):
+    return {"id": player['id'], "name": player['name'], "overs": 0, "maidens": 0, "runs": 0, "wickets": 0, "balls": 0}
+
+
+class MatchEngine:
+    def __init__(self, overs, squad_size):
+        self.overs = overs
+        self.start_innings(1, squad_size)
+
+    def start_innings(self, innings, squad_size, first_innings=None):
+        # first_innings is (runs, resources used) for the side that batted
+        # first, which sets the target
+        self.innings = innings
+        self.squad_size = squad_size
+        # Duckworth-Lewis resources this innings has, less any lost to rain
+        self.resources = float(dls.resources(self.overs * 6, 0, squad_size))
+        self.first_innings_runs, self.first_innings_resources = first_innings or (None, None)
+        self.target = None
+        if first_innings:
+            self.target = dls.revised_target(*first_innings, self.resources)
+        self.current_over = 0
+        self.current_ball = 0
+        self.total_runs = 0
+        self.wickets = 0
+        self.log = BallLog()
+        self.batsmen = []
+        self.striker_index = 0
+        self.non_striker_index = 1
+        self.bowlers = []
+        self.current_bowler_index = -1
+        self.current_bowler = None
+        self.previous_bowler = None
+        self.previous_bowler_id = None
+        self.free_hit = False
+        self.innings_complete = False
+        # One entry per over so far, the current one included
+        self.over_index = []
+        # [name, name, runs, balls] per partnership, the last one
+        # still going while partnership_open, and [wicket, score, over, name]
+        # per wicket
+        self.partnerships = []
+        self.partnership_open = False
+        self.fall_of_wickets = []
+        # Inputs for this innings, and {events, state} at the start of each over
+        self.events = []
+        self.checkpoints = []
+        self.marked = None
+        self._index_players()
+
+    def _index_players(self):
+        # Ids that have batted, and each bowler's position in self.bowlers.
+        # Derived from the entries, so never saved.
+        self.batted = {batsman['id'] for batsman in self.batsmen}
+        self.bowler_positions = {bowler['id']: i for i, bowler in enumerate(self.bowlers)}
+
+    # -- selections -------------------------------------------------------
+
+    def set_openers(self, striker, non_striker):
+        if striker['id'] == non_striker['id']:
+            raise ValueError("The openers must be two different players")
+        self.events.append(['openers', striker, non_striker])
+        self.batsmen = [new_batsman_entry(striker), new_batsman_entry(non_striker)]
+        self.batted = {striker['id'], non_striker['id']}
+        self.striker_index = 0
+        self.non_striker_index = 1
+        self._start_partnership()
+
+    def set_bowler(self, player):
+        self.events.append(['bowler', player])
+        position = self.bowler_positions.get(player['id'])
+        if position is None:
+            position = self.bowler_positions[player['id']] = len(self.bowlers)
+            self.bowlers.append(new_bowler_entry(player))
+        self.current_bowler_index = position
+        self.current_bowler = player['name']
+        # Remember the bowler so they can't bowl the next over too
+        self.previous_bowler = player['name']
+        self.previous_bowler_id = player['id']
+
+    def add_batsman(self, player):
+        # The new batsman fills whichever end was left empty by the wicket
+        if player['id'] in self.batted:
+            raise ValueError(f"{player['name']} has already batted")
+        self.events.append(['batsman', player])
+        self.batsmen.append(new_batsman_entry(player))
+        self.batted.add(player['id'])
+        if self.striker_index == -1:
+            self.striker_index = len(self.batsmen) - 1
+        elif self.non_striker_index == -1:
+            self.non_striker_index = len(self.batsmen) - 1
+        self._start_partnership()
+
+    def switch_strike(self):
+        if self.non_striker_index != -1 and self.striker_index != -1:
+            self.events.append(['strike'])
+            self._swap_ends()
+
+    def reduce_overs(self, overs):
+        # Overs lost to rain. The resources they would have been worth come
+        # off this innings', and in a chase the target is revised.
+        if not 0 < overs < self.overs:
+            raise ValueError(f"The innings has {self.overs} overs; reduce it to fewer")
+        if overs * 6 < self.balls_bowled:
+            raise ValueError("More overs than that have been bowled already")
+        self.events.append(['overs', overs])
+        balls, wickets = self.balls_bowled, self.wickets
+        self.resources -= float(dls.resources(self.overs * 6 - balls, wickets, self.squad_size)
+                                - dls.resources(overs * 6 - balls, wickets, self.squad_size))
+        self.overs = overs
+        if self.innings == 2:
+            self.target = dls.revised_target(self.first_innings_runs, self.first_innings_resources,
+                                             self.resources)
+            if self.total_runs >= self.target:
+                self.innings_complete = True
+        if balls == overs * 6:
+            self.innings_complete = True
+
+    def _start_partnership(self):
+        # Begins whenever both ends are filled
+        if self.striker_index != -1 and self.non_striker_index != -1:
+            self.partnerships.append([self.batsmen[self.striker_index]['name'],
+                                      self.batsmen[self.non_striker_index]['name'], 0, 0])
+            self.partnership_open = True
+
+    def _swap_ends(self):
+        self.striker_index, self.non_striker_index = self.non_striker_index, self.striker_index
+
+    def available_batsmen(self, players):
+        return [player for player in players if player['id'] not in self.batted]
+
+    # -- state queries ----------------------------------------------------
+
+    @property
+    def wickets_remaining(self):
+        return self.squad_size - self.wickets
+
+    @property
+    def balls_bowled(self):
+        return self.current_over * 6 + self.current_ball
+
+    @property
+    def run_rate(self):
+        balls = self.balls_bowled
+        return self.total_runs / balls * 6 if balls > 0 else 0
+
+    @property
+    def par_score(self):
+        # In a chase, the score that would tie if no more play were possible
+        if self.innings != 2:
+            return None
+        left = dls.resources(self.overs * 6 - self.balls_bowled, self.wickets, self.squad_size)
+        return int(dls.par(self.first_innings_runs, self.first_innings_resources, self.resources - left))
+
+    def needs_batsman(self):
+        # An empty end only needs filling while there's someone left to bat
+        vacancy = self.striker_index == -1 or self.non_striker_index == -1
+        return vacancy and self.wickets_remaining > 1
+
+    def next_step(self):
+        if self.innings_complete:
+            return INNINGS_END
+        if not self.batsmen:
+            return SELECT_BATSMEN
+        if self.needs_batsman():
+            return NEW_BATSMAN
+        if self.current_bowler_index < 0:
+            return SELECT_BOWLER
+        return SCORE
+
+    # -- deliveries -------------------------------------------------------
+
+    def apply(self, runs, wicket_type=None, run_out_batsman=None):
+        # Apply one delivery and return the next step for the scorer.
+        # runs is 0-6 off the bat, or WIDE / NO_BALL (one run each), and
+        # run_out_batsman is the id of the batsman run out.
+        step = self.next_step()
+        if step != SCORE:
+            raise ValueError(f"Not ready for a delivery; the next step is {step.replace('_', ' ')}")
+        check_delivery(runs, wicket_type)
+        if wicket_type == 'Run Out' and run_out_batsman is not None and run_out_batsman not in self.batted:
+            raise ValueError("The batsman run out hasn't batted")
+        if not self.checkpoints or self.checkpoints[-1]['state']['current_over'] < self.current_over:
+            self.checkpoints.append({'events': len(self.events), 'state': self.checkpoint()})
+            if len(self.checkpoints) > CHECKPOINTS_KEPT + 1:
+                del self.checkpoints[1]
+        self.events.append(['ball', runs, wicket_type, run_out_batsman])
+        is_wide = runs == WIDE
+        is_no_ball = runs == NO_BALL
+        is_extra = is_wide or is_no_ball
+        striker = self.batsmen[self.striker_index]
+        bowler = self.bowlers[self.current_bowler_index]
+
+        # Only legal deliveries count towards the over
+        if len(self.over_index) <= self.current_over:
+            self.over_index.append(new_over_entry(self.current_bowler_index))
+        over = self.over_index[self.current_over]
+        spell = over['bowlers'][-1] if over['bowlers'] else None
+        if spell is None or spell[0] != self.current_bowler_index:
+            spell = [self.current_bowler_index, 0, 0]
+            over['bowlers'].append(spell)
+
+        if not is_extra:
+            self.current_ball += 1
+            over['balls'] += 1
+            spell[1] += 1
+            striker['runs'] += runs
+            striker['balls'] += 1
+            if runs == 4:
+                striker['fours'] += 1
+            elif runs == 6:
+                striker['sixes'] += 1
+
+        conceded = 1 if is_extra else runs
+        self.total_runs += conceded
+        over['runs'] += conceded
+        over['extras'] += 1 if is_extra else 0
+        spell[2] += conceded
+        if self.partnership_open:
+            partnership = self.partnerships[-1]
+            partnership[2] += conceded
+            partnership[3] += 0 if is_extra else 1
+        bowler['runs'] += conceded
+        if not is_extra:
+            bowler['balls'] += 1
+
+        # Only a run out counts on a free hit, and a no ball earns the next one
+        if self.free_hit:
+            if wicket_type != 'Run Out':
+                wicket_type = None
+            self.free_hit = False
+        if is_no_ball:
+            self.free_hit = True
+
+        self.log.append(
+            self.current_over,
+            self.current_ball,
+            striker['name'],
+            self.current_bowler,
+            runs,
+            wicket_type=wicket_type,
+            extra_type="WD" if is_wide else "NB" if is_no_ball else None
+        )
+
+        if wicket_type:
+            self._dismiss(runs, wicket_type, run_out_batsman, bowler)
+            if self.innings_complete:
+                return self.next_step()
+        elif self.wickets_remaining > 1 and runs % 2 == 1 and not is_wide:
+            # Odd runs change ends; wides don't
+            self._swap_ends()
+
+        # Target reached in the second innings
+        if self.innings == 2 and self.total_runs >= self.target:
+            self.innings_complete = True
+            return self.next_step()
+
+        if self.current_ball >= 6:
+            self._end_over()
+        return self.next_step()
+
+    def _dismiss(self, runs, wicket_type, run_out_batsman, bowler):
+        self.wickets += 1
+        is_run_out = wicket_type == 'Run Out'
+
+        # Work out which end the dismissed batsman was at
+        out_index = self.striker_index
+        if is_run_out and run_out_batsman and self.non_striker_index != -1:
+            if self.batsmen[self.non_striker_index]['id'] == run_out_batsman:
+                out_index = self.non_striker_index
+        self.batsmen[out_index]['out'] = True
+        self.batsmen[out_index]['wicket_type'] = wicket_type
+        self.over_index[self.current_over]['run_outs' if is_run_out else 'wickets'] += 1
+        balls = self.balls_bowled
+        self.fall_of_wickets.append([self.wickets, self.total_runs, f"{balls // 6}.{balls % 6}",
+                                     self.batsmen[out_index]['name']])
+        self.partnership_open = False
+
+        # Run outs aren't credited to the bowler
+        if not is_run_out:
+            bowler['wickets'] += 1
+
+        if is_run_out:
+            # After a run out the batsmen may have crossed, so the new
+            # batsman's end depends on who was out and the runs completed
+            odd = runs % 2 == 1
+            if out_index == self.striker_index:
+                if odd:
+                    self.striker_index = self.non_striker_index
+                    self.non_striker_index = -1
+                else:
+                    self.striker_index = -1
+            elif odd:
+                self.non_striker_index = self.striker_index
+                self.striker_index = -1
+            else:
+                self.non_striker_index = -1
+        else:
+            self.striker_index = -1
+
+        # The last batsman out ends the innings
+        if self.wickets_remaining <= 0:
+            self.innings_complete = True
+            return
+
+        # Last man standing bats on alone, always on strike
+        if self.wickets_remaining == 1:
+            if self.striker_index == -1:
+                self.striker_index = self.non_striker_index
+            self.non_striker_index = -1
+
+    def _end_over(self):
+        over = self.over_index[self.current_over]
+        over['maiden'] = over['runs'] == 0
+        for position, _, _ in over['bowlers']:
+            if position >= 0:
+                # Carry completed balls into overs (6 balls = 1 over); a
+                # bowler who took over part way through may complete one
+                bowler = self.bowlers[position]
+                total_balls = bowler['overs'] * 6 + bowler['balls']
+                bowler['overs'] = total_balls // 6
+                bowler['balls'] = total_balls % 6
+        # A maiden is only the bowler's if they bowled the whole over
+        if over['maiden'] and len(over['bowlers']) == 1 and over['bowlers'][0][0] >= 0:
+            self.bowlers[over['bowlers'][0][0]]['maidens'] += 1
+
+        self.current_over += 1
+        self.current_ball = 0
+
+        # Batsmen change ends, empty end included
+        if self.wickets_remaining > 1:
+            self._swap_ends()
+
+        if self.current_over >= self.overs:
+            self.innings_complete = True
+        else:
+            # A new bowler has to be picked for the next over
+            self.current_bowler_index = -1
+            self.current_bowler = None
+
+    # -- corrections ------------------------------------------------------
+
+    def undo(self):
+        # Remove the last delivery, and any selections made after it
+        last = self._ball_event_index(len(self.log) - 1)
+        position = self._checkpoint_before(len(self.log) - 1)
+        tail = self.events[self.checkpoints[position]['events']:last]
+        self._replay(position, tail)
+        return self.next_step()
+
+    def edit(self, ball, runs, wicket_type=None, run_out_batsman=None):
+        # Correct delivery number `ball` (0-based) of this innings. Later
+        # events are replayed on top; if they no longer fit (say the edit
+        # adds a wicket) the innings is left unchanged.
+        check_delivery(runs, wicket_type)
+        index = self._ball_event_index(ball)
+        position = self._checkpoint_before(ball)
+        start = self.checkpoints[position]['events']
+        tail = self.events[start:]
+        # The replay drops these checkpoints and only adds back the ones it
+        # gets to, so keep them for putting the innings back
+        checkpoints = self.checkpoints[position:]
+        marked = self.marked
+        edited = list(tail)
+        edited[index - start] = ['ball', runs, wicket_type, run_out_batsman]
+        try:
+            self._replay(position, edited)
+        except ValueError:
+            self.checkpoints[position:] = checkpoints
+            self._replay(position, tail)
+            self.marked = marked
+            raise ValueError("That correction doesn't fit the deliveries recorded after it")
+        return self.next_step()
+
+    def _checkpoint_before(self, ball):
+        if not 0 <= ball < len(self.log):
+            raise ValueError("No such delivery in this innings")
+        # Checkpoints are in ball order, one per over, so only the last few
+        # are ever looked at
+        for position in range(len(self.checkpoints) - 1, -1, -1):
+            if self.checkpoints[position]['state']['balls'] <= ball:
+                return position
+        raise ValueError("No checkpoint for that delivery")
+
+    def _ball_event_index(self, ball):
+        checkpoint = self.checkpoints[self._checkpoint_before(ball)]
+        count = checkpoint['state']['balls']
+        for i in range(checkpoint['events'], len(self.events)):
+            if self.events[i][0] == 'ball':
+                if count == ball:
+                    return i
+                count += 1
+        raise ValueError("No such delivery in this innings")
+
+    def _replay(self, position, events):
+        checkpoint = self.checkpoints[position]
+        if self.marked is not None and checkpoint['events'] < self.marked:
+            self.marked = None
+        del self.checkpoints[position:]
+        del self.events[checkpoint['events']:]
+        self.rewind(checkpoint['state'])
+        self.play(events)
+
+    def play(self, events):
+        # Apply recorded inputs in order, checking each still fits
+        for event in events:
+            kind = event[0]
+            if kind == 'ball':
+                if self.next_step() != SCORE:
+                    raise ValueError("Delivery recorded while the innings wasn't ready")
+                self.apply(*event[1:])
+            elif kind == 'batsman':
+                if not self.needs_batsman():
+                    raise ValueError("New batsman recorded without a vacancy")
+                self.add_batsman(event[1])
+            elif kind == 'bowler':
+                self.set_bowler(event[1])
+            elif kind == 'openers':
+                self.set_openers(event[1], event[2])
+            elif kind == 'strike':
+                self.switch_strike()
+            elif kind == 'overs':
+                self.reduce_overs(event[1])
+
+    def mark(self):
+        # Start counting inputs from here, for events_since_mark()
+        self.marked = len(self.events)
+
+    def events_since_mark(self):
+        # Inputs added since mark(), or None if an undo, an edit or a new
+        # innings has changed any from before it
+        if self.marked is None:
+            return None
+        return self.events[self.marked:]
+
+    # -- results ----------------------------------------------------------
+
+    def innings_summary(self):
+        bowlers = []
+        for bowler in self.bowlers:
+            bowler = dict(bowler)
+            # Convert balls to proper over format (e.g., 7 balls = 1.1 overs)
+            total_balls = bowler['overs'] * 6 + bowler['balls']
+            bowler['overs'] = total_balls // 6
+            bowler['balls'] = total_balls % 6
+            if total_balls > 0:
+                bowler['economy'] = round(bowler['runs'] / (total_balls / 6), 2)
+            bowlers.append(bowler)
+        return {
+            'total': self.total_runs,
+            'wickets': self.wickets,
+            'overs': f"{self.current_over}.{self.current_ball}",
+            'batsmen': [dict(batsman) for batsman in self.batsmen],
+            'bowlers': bowlers,
+            # Overs the innings was limited to in the end, and how it got there
+            'max_overs': self.overs,
+            'reductions': self.reductions(),
+        }
+
+    def reductions(self):
+        # [deliveries bowled, overs] for each time overs were lost to rain
+        # this innings, so a replay can cut them at the same point
+        found = []
+        balls = 0
+        for event in self.events:
+            if event[0] == 'ball':
+                balls += 1
+            elif event[0] == 'overs':
+                found.append([balls, event[1]])
+        return found
+
+    def over_summary(self, over):
+        # One over of this innings, straight from the over index
+        if not 0 <= over < len(self.over_index):
+            return None
+        entry = self.over_index[over]
+        summary = dict(entry, over=over, wickets=entry['wickets'] + entry['run_outs'])
+        positions = [position for position, _, _ in entry.get('bowlers', ())] or [entry['bowler']]
+        summary['bowler'] = '/'.join(self.bowlers[p]['name'] for p in positions if p >= 0) or None
+        del summary['run_outs']
+        summary.pop('bowlers', None)
+        return summary
+
+    def charts(self):
+        # Worm (score at the end of each over), manhattan (runs per over) and
+        # the wicket series, as plain lists
+        manhattan = [over['runs'] for over in self.over_index]
+        worm = []
+        total = 0
+        for runs in manhattan:
+            total += runs
+            worm.append(total)
+        return {
+            'manhattan': manhattan,
+            'worm': worm,
+            'wickets': [over['wickets'] + over['run_outs'] for over in self.over_index],
+            'partnerships': [list(partnership) for partnership in self.partnerships],
+            'fall_of_wickets': [list(wicket) for wicket in self.fall_of_wickets],
+        }
+
+    # -- persistence ------------------------------------------------------
+
+    def snapshot(self):
+        # Full engine state; the ball log is referenced by length only
+        state = {name: getattr(self, name) for name in _STATE}
+        state['batsmen'] = [dict(batsman) for batsman in self.batsmen]
+        state['bowlers'] = [dict(bowler) for bowler in self.bowlers]
+        state['over_index'] = [copy_over_entry(over) for over in self.over_index]
+        state['partnerships'] = [list(partnership) for partnership in self.partnerships]
+        state['fall_of_wickets'] = [list(wicket) for wicket in self.fall_of_wickets]
+        state['balls'] = len(self.log)
+        return state
+
+    def restore(self, state):
+        for name in _STATE:
+            setattr(self, name, state[name])
+        self.batsmen = [dict(batsman) for batsman in state['batsmen']]
+        self.bowlers = [dict(bowler) for bowler in state['bowlers']]
+        self.over_index = [copy_over_entry(over) for over in state['over_index']]
+        self.partnerships = [list(partnership) for partnership in state['partnerships']]
+        self.fall_of_wickets = [list(wicket) for wicket in state['fall_of_wickets']]
+        self._index_players()
+        self.log.truncate(state['balls'])
+
+    def checkpoint(self):
+        # Like snapshot(), but series are kept as their length and a copy of
+        # their last entry, which is all that can change after this point
+        state = {name: getattr(self, name) for name in _STATE}
+        state['batsmen'] = [dict(batsman) for batsman in self.batsmen]
+        state['bowlers'] = [dict(bowler) for bowler in self.bowlers]
+        state['series'] = {name: [len(series), _copy(series[-1]) if series else None]
+                           for name, series in ((name, getattr(self, name)) for name in _SERIES)}
+        state['balls'] = len(self.log)
+        return state
+
+    def rewind(self, state):
+        # Back to a checkpoint taken earlier in this innings
+        if 'series' not in state:
+            # Taken before checkpoints held series by length
+            return self.restore(state)
+        for name in _STATE:
+            setattr(self, name, state[name])
+        self.batsmen = [dict(batsman) for batsman in state['batsmen']]
+        self.bowlers = [dict(bowler) for bowler in state['bowlers']]
+        for name, (length, last) in state['series'].items():
+            series = getattr(self, name)
+            del series[length:]
+            if length:
+                series[-1] = _copy(last)
+        self._index_players()
+        self.log.truncate(state['balls'])
+
+    def to_json(self):
+        return {
+            'state': self.snapshot(),
+            'log': self.log.to_json(),
+            'events': self.events,
+            'checkpoints': self.checkpoints,
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        engine = cls.__new__(cls)
+        engine.log = BallLog.from_json(data['log'])
+        engine.restore(data['state'])
+        engine.events = data['events']
+        engine.checkpoints = data['checkpoints']
+        engine.mark()
+        return engine
+
+
+def _copy(entry):
+    return copy_over_entry(entry) if isinstance(entry, dict) else list(entry)
+
+
+def match_result(first_total, second_total, wickets_remaining, batting_first, batting_second, target=None):
+    # (winner, margin, win type) once both innings are complete. A target
+    # revised for overs lost to rain stands in for first_total + 1.
+    revised = target is not None and target != first_total + 1
+    par = target - 1 if revised else first_total
+    method = " (DLS)" if revised else ""
+    if par > second_total:
+        return batting_first, f"{par - second_total} runs{method}", "runs"
+    if second_total > par:
+        return batting_second, f"{wickets_remaining} wickets{method}", "wickets"
+    return "Match Tied", "", "tie"
+
+
+register_type('engine', MatchEngine)
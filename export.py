@@ -0,0 +1,168 @@
+# export.py
+# Match exports as generators of text chunks, so responses stream instead
+# of building the whole report in memory. Each exporter takes a completed
+# match state (the dict kept in the match store).
+import csv
+import json
+import zipfile
+
+
+def innings_teams(match):
+    # (first innings team, second innings team)
+    first = match['batting_first']
+    second = match['team2_name'] if first == match['team1_name'] else match['team1_name']
+    return first, second
+
+
+def strike_rate(batsman):
+    return round(batsman['runs'] / batsman['balls'] * 100, 2) if batsman['balls'] > 0 else 0
+
+
+def result_line(match):
+    if match['win_type'] == "tie":
+        return "Match Tied"
+    return f"{match['winner']} won by {match['win_margin']}"
+
+
+def export_text(match):
+    first, second = innings_teams(match)
+    yield f"Match Summary: {match['team1_name']} vs {match['team2_name']}\n"
+    yield "=" * 60 + "\n\n"
+
+    yield "TOSS INFORMATION\n"
+    yield "-" * 20 + "\n"
+    yield f"Toss Winner: {match['toss_winner']}\n"
+    yield f"Batting First: {first}\n\n"
+
+    for title, team, prefix in (("FIRST INNINGS", first, 'first'), ("SECOND INNINGS", second, 'second')):
+        yield f"{title}\n"
+        yield "-" * 15 + "\n"
+        yield (f"{team}: {match[prefix + '_innings_total']}/{match[prefix + '_innings_wickets']}"
+               f" in {match[prefix + '_innings_overs']} overs\n\n")
+
+        yield "BATTING PERFORMANCE\n"
+        yield "-" * 20 + "\n"
+        yield f"{'Batsman':<20} {'Runs':<6} {'Balls':<6} {'4s':<4} {'6s':<4} {'SR':<8} {'Status':<15}\n"
+        for batsman in match[prefix + '_innings_batsmen']:
+            status = f"OUT ({batsman['wicket_type']})" if batsman['out'] else "not out"
+            yield (f"{batsman['name']:<20} {batsman['runs']:<6} {batsman['balls']:<6} {batsman['fours']:<4} "
+                   f"{batsman['sixes']:<4} {strike_rate(batsman):<8} {status:<15}\n")
+        yield "\n"
+
+        yield "BOWLING PERFORMANCE\n"
+        yield "-" * 20 + "\n"
+        yield f"{'Bowler':<20} {'Overs':<6} {'Maidens':<8} {'Runs':<6} {'Wickets':<8} {'Economy':<8}\n"
+        for bowler in match[prefix + '_innings_bowlers']:
+            overs = f"{bowler['overs']}.{bowler['balls']}"
+            economy = bowler.get('economy', 0)
+            yield (f"{bowler['name']:<20} {overs:<6} {bowler['maidens']:<8} {bowler['runs']:<6} "
+                   f"{bowler['wickets']:<8} {economy:<8}\n")
+        yield "\n"
+
+    yield "MATCH RESULT\n"
+    yield "-" * 12 + "\n"
+    yield result_line(match) + "\n"
+
+
+class _Echo:
+    # csv.writer target that hands each formatted row straight back
+    def write(self, value):
+        return value
+
+
+def export_csv(match):
+    # One row per batting and bowling entry in the scorecard
+    writer = csv.writer(_Echo())
+    first, second = innings_teams(match)
+    yield writer.writerow(["innings", "team", "role", "player", "runs", "balls", "fours", "sixes",
+                           "strike_rate", "dismissal", "overs", "maidens", "wickets", "economy"])
+    for number, team, prefix in ((1, first, 'first'), (2, second, 'second')):
+        for batsman in match[prefix + '_innings_batsmen']:
+            yield writer.writerow([number, team, "bat", batsman['name'], batsman['runs'], batsman['balls'],
+                                   batsman['fours'], batsman['sixes'], strike_rate(batsman),
+                                   batsman['wicket_type'] if batsman['out'] else "not out", "", "", "", ""])
+        for bowler in match[prefix + '_innings_bowlers']:
+            yield writer.writerow([number, team, "bowl", bowler['name'], bowler['runs'], "", "", "", "", "",
+                                   f"{bowler['overs']}.{bowler['balls']}", bowler['maidens'],
+                                   bowler['wickets'], bowler.get('economy', 0)])
+
+
+def export_balls(match):
+    # Ball-by-ball CSV for both innings
+    writer = csv.writer(_Echo())
+    first, second = innings_teams(match)
+    yield writer.writerow(["innings", "team", "over", "ball", "bowler", "batsman", "runs",
+                           "extra_type", "wicket_type"])
+    for number, team, prefix in ((1, first, 'first'), (2, second, 'second')):
+        log = match.get(prefix + '_innings_log')
+        for ball in log if log is not None else ():
+            yield writer.writerow([number, team, ball.over, ball.ball, ball.bowler, ball.batsman, ball.runs,
+                                   ball.extra_type or "", ball.wicket_type or ""])
+
+
+def export_json(match):
+    # Scorecard and deliveries as one JSON document, written a piece at a time
+    first, second = innings_teams(match)
+    dumps = json.dumps
+    players = {match['team1_name']: match.get('team1'), match['team2_name']: match.get('team2')}
+    yield '{"team1":%s,"team2":%s,"overs":%s,"players":%s,"toss_winner":%s,"target":%s,"result":%s,"innings":[' % (
+        dumps(match['team1_name']), dumps(match['team2_name']), dumps(match.get('overs')), dumps(players),
+        dumps(match['toss_winner']), dumps(match.get('target')), dumps(result_line(match)))
+    for number, team, prefix in ((1, first, 'first'), (2, second, 'second')):
+        if number > 1:
+            yield ','
+        # reductions are [deliveries bowled, overs] for each cut for rain
+        yield ('{"team":%s,"total":%d,"wickets":%d,"overs":%s,"max_overs":%s,"reductions":%s,'
+               '"batting":%s,"bowling":%s,"balls":[') % (
+            dumps(team), match[prefix + '_innings_total'], match[prefix + '_innings_wickets'],
+            dumps(match[prefix + '_innings_overs']), dumps(match.get(prefix + '_innings_max_overs')),
+            dumps(match.get(prefix + '_innings_reductions', [])), dumps(match[prefix + '_innings_batsmen']),
+            dumps(match[prefix + '_innings_bowlers']))
+        log = match.get(prefix + '_innings_log')
+        for i, ball in enumerate(log if log is not None else ()):
+            yield (',' if i else '') + dumps(ball.to_dict())
+        yield ']}'
+    yield ']}'
+
+
+# format -> (exporter, mimetype, file extension)
+FORMATS = {
+    'text': (export_text, 'text/plain', 'txt'),
+    'csv': (export_csv, 'text/csv', 'csv'),
+    'balls': (export_balls, 'text/csv', 'csv'),
+    'json': (export_json, 'application/json', 'json'),
+}
+
+
+class _ZipSink:
+    # Write-only buffer for ZipFile; without tell()/seek() zipfile writes
+    # data descriptors, which is what makes streaming possible
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_zip(entries):
+    # entries: iterable of (filename, iterable of str chunks). Yields the zip
+    # as it is built; only one member's pending output is held at a time.
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for filename, chunks in entries:
+            with archive.open(filename, 'w') as member:
+                for chunk in chunks:
+                    member.write(chunk.encode('utf-8'))
+                    if len(sink._chunks) > 16:
+                        yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()
@@ -0,0 +1,99 @@
+# forecast.py
+# Win probability and projected total for the batting side. The rest of the
+# match is played out in one NumPy batch: one row per simulation, one column
+# per remaining legal ball. Results are memoized on the match state, so each
+# state is only simulated once, and the chase that follows a first innings
+# depends only on the match's length, so it is simulated once per length.
+import functools
+
+import numpy as np
+
+
+SIMULATIONS = 20000
+# Most balls simulated for one forecast. Long innings get fewer play-outs,
+# never fewer than MIN_SIMULATIONS, so a forecast stays a few milliseconds.
+MAX_DRAWS = 500000
+MIN_SIMULATIONS = 2000
+
+# Chance per legal ball of each outcome, in thousandths: runs off the bat,
+# or a wicket (no runs)
+OUTCOMES = (
+    (0, 360),
+    (1, 330),
+    (2, 80),
+    (3, 10),
+    (4, 110),
+    (6, 50),
+    ('W', 60),
+)
+# Chance of a wide or no ball (one run, ball bowled again) per legal ball,
+# in twentieths
+EXTRAS = 1
+_EXTRA_SCALE = 20
+
+# Lookup tables indexed by a uniform draw in [0, 1000 * _EXTRA_SCALE): the
+# thousandth picks the outcome, the remainder whether an extra came first
+_WEIGHTS = [weight * _EXTRA_SCALE for _, weight in OUTCOMES]
+_RUNS = (np.repeat([0 if runs == 'W' else runs for runs, _ in OUTCOMES], _WEIGHTS)
+         + (np.arange(1000 * _EXTRA_SCALE) % _EXTRA_SCALE < EXTRAS)).astype(np.int8)
+_WICKET = np.repeat([runs == 'W' for runs, _ in OUTCOMES], _WEIGHTS)
+assert len(_RUNS) == 1000 * _EXTRA_SCALE
+
+
+def simulations(balls):
+    return max(MIN_SIMULATIONS, min(SIMULATIONS, MAX_DRAWS // max(balls, 1)))
+
+
+def simulate(rng, balls, wickets_in_hand, n=SIMULATIONS):
+    # Runs scored in each of n play-outs of `balls` legal deliveries, stopping
+    # when the last wicket falls
+    if balls <= 0 or wickets_in_hand <= 0:
+        return np.zeros(n, dtype=np.int32)
+    draws = rng.integers(0, len(_RUNS), size=(n, balls), dtype=np.int16)
+    runs = _RUNS[draws]
+    out = _WICKET[draws]
+    # Deliveries after the last wicket are never bowled
+    fallen_before = np.cumsum(out, axis=1, dtype=np.int16) - out
+    return np.where(fallen_before < wickets_in_hand, runs, 0).sum(axis=1, dtype=np.int32)
+
+
+@functools.lru_cache(maxsize=64)
+def chase(total_balls, squad_size):
+    # Sorted totals for a side batting second with nothing to chase, the
+    # same for every first innings of this length
+    rng = np.random.default_rng([total_balls, squad_size])
+    totals = simulate(rng, total_balls, squad_size, simulations(total_balls))
+    totals.sort()
+    totals.flags.writeable = False
+    return totals
+
+
+@functools.lru_cache(maxsize=4096)
+def forecast(runs, wickets_in_hand, balls_left, target, squad_size, total_balls):
+    # target is None in the first innings. Returns win/tie percentages for
+    # the batting side and the projected total with a 10th-90th percentile
+    # range. The seed comes from the state, so every worker agrees.
+    rng = np.random.default_rng([runs, wickets_in_hand, balls_left, target or 0, squad_size, total_balls])
+    scored = runs + simulate(rng, balls_left, wickets_in_hand, simulations(balls_left))
+    if target is None:
+        # Then the other side chases whatever total each simulation made:
+        # the share of chases falling short of it, or level with it
+        chased = chase(total_balls, squad_size)
+        short = np.searchsorted(chased, scored, 'left')
+        level = np.searchsorted(chased, scored, 'right') - short
+        win = short.mean() / len(chased)
+        tie = level.mean() / len(chased)
+    else:
+        # A chase stops once the target is reached
+        scored = np.minimum(scored, target)
+        win = np.mean(scored >= target)
+        tie = np.mean(scored == target - 1)
+    low, high = np.percentile(scored, [10, 90])
+    return {
+        "batting": round(float(win) * 100, 1),
+        "bowling": round(float(1 - win - tie) * 100, 1),
+        "tie": round(float(tie) * 100, 1),
+        "projected": int(round(float(scored.mean()))),
+        "low": int(low),
+        "high": int(high),
+    }
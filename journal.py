@@ -0,0 +1,341 @@
+# journal.py
+# Write-ahead journal for matches in progress. Every saved change to a match
+# is appended to that match's log file and fsynced before the request that
+# made it gets its answer, so a restart loses nothing a scorer was shown,
+# whatever the match store. Most records carry only the inputs since the
+# one before (a delivery, a new bowler) and the match keys that changed;
+# every so often a full snapshot is appended instead, and recovering a match
+# reads only its newest snapshot and the deltas after it. Once a file grows
+# past compact_size it is rewritten from its newest snapshot on.
+#
+# Appends from all requests go through one writer thread. Whatever arrives
+# while it is waiting on the disk goes out together next time, with one
+# fsync per file, so ten scorers saving at once cost about one fsync each
+# rather than ten in a row.
+#
+# A match that hasn't been saved for max_age seconds is taken to be
+# abandoned, and its journal is dropped at the next startup instead of
+# being recovered again.
+import os
+import threading
+import time
+
+from store import MatchStore, MatchState, dumps, loads
+
+try:
+    import fcntl
+except ImportError:  # Windows: file locks are process-local only
+    fcntl = None
+
+
+# Every record starts with its version, then says what kind it is, so a
+# file can be scanned without parsing whole snapshots
+_VERSION_PREFIX = '{"version":'
+
+
+def record_version(line):
+    try:
+        return int(line[len(_VERSION_PREFIX):line.index(',')])
+    except ValueError:
+        # Torn by a crash part way through writing it
+        return -1
+
+
+def is_snapshot(line):
+    return line.startswith('"state":', line.find(',') + 1)
+
+
+def _finished(pid):
+    # Whether process `pid` can no longer be writing: it is this one, and so
+    # not compacting while we clear, or it has exited
+    if pid == os.getpid():
+        return True
+    if os.name != 'posix':
+        # os.kill() would end it rather than ask after it
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        # Running, as someone else
+        return False
+    return False
+
+
+class _Batch:
+    # Records written under the same fsync
+    def __init__(self):
+        self.records = []
+        self.done = threading.Event()
+        self.error = None
+
+
+class MatchJournal:
+    def __init__(self, directory, snapshot_every=30, compact_size=256 * 1024, max_age=None):
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.compact_size = compact_size
+        self.max_age = max_age
+        os.makedirs(directory, exist_ok=True)
+        # Deltas written since each match's last snapshot, as far as this
+        # process knows
+        self.deltas = {}
+        self._batch = _Batch()
+        self._cond = threading.Condition()
+        self._writer = threading.Thread(target=self._run, name='match-journal', daemon=True)
+        self._writer.start()
+
+    def _path(self, match_id):
+        # Match ids are generated by us, but never trust a cookie with a path
+        if not match_id.isalnum():
+            raise ValueError("invalid match id")
+        return os.path.join(self.directory, match_id + '.wal')
+
+    def append(self, match_id, state, base=None, events=None):
+        # Record a saved match; durable once this returns. Given the engine
+        # inputs since version `base`, only those and the changed keys are
+        # written, otherwise the whole match.
+        version = state.get('version', 0)
+        count = self.deltas.get(match_id, 0)
+        if events is None or base is None or count >= self.snapshot_every:
+            record = {'version': version, 'state': state}
+            self.deltas[match_id] = 0
+        else:
+            record = {'version': version, 'base': base, 'events': events,
+                      'match': {key: state[key] for key in state.changed if key in state}}
+            removed = [key for key in state.changed if key not in state]
+            if removed:
+                record['removed'] = removed
+            self.deltas[match_id] = count + 1
+        path = self._path(match_id)
+        line = dumps(record)
+        with self._cond:
+            batch = self._batch
+            batch.records.append((path, line, version if 'state' in record else None))
+            self._cond.notify()
+        batch.done.wait()
+        if batch.error is not None:
+            raise batch.error
+
+    def discard(self, match_id):
+        # The match is finished or deleted; nothing left to recover. The
+        # file is set aside rather than removed, because removing files can
+        # hold up everyone's fsyncs on some filesystems; clear() deletes it
+        # at the next startup.
+        self.deltas.pop(match_id, None)
+        path = self._path(match_id)
+        with open(path + '.lock', 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                os.rename(path, path[:-len('.wal')] + '.done')
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        # Delete the files of finished and abandoned matches, compactions
+        # that never finished, and lock files left without a journal
+        for match_id in self.expired():
+            self.discard(match_id)
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.done'):
+                os.remove(entry.path)
+            elif entry.name.endswith('.tmp'):
+                self._clear_tmp(entry.path)
+            elif entry.name.endswith('.lock') and not os.path.exists(entry.path[:-len('.lock')]):
+                os.remove(entry.path)
+
+    def _clear_tmp(self, tmp):
+        # <match>.wal.<pid>.tmp. Another worker may be compacting into it
+        # right now, so it only goes if it is ours or its process is gone,
+        # and only under the journal's lock, which compaction holds.
+        path, pid = tmp[:-len('.tmp')].rsplit('.', 1)
+        if not pid.isdigit() or not _finished(int(pid)):
+            return
+        with open(path + '.lock', 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                os.remove(tmp)
+            except FileNotFoundError:
+                pass
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._batch.records:
+                    self._cond.wait()
+                batch, self._batch = self._batch, _Batch()
+            try:
+                self._write(batch.records)
+            except Exception as e:
+                # Handed to every request waiting on this batch
+                batch.error = e
+            batch.done.set()
+
+    def _write(self, records):
+        # Lines per file in order, and where the last snapshot among them is
+        files = {}
+        for path, line, snapshot_version in records:
+            lines, snapshot = files.setdefault(path, ([], None))
+            if snapshot_version is not None:
+                snapshot = (snapshot_version, len(lines))
+            lines.append(line)
+            files[path] = (lines, snapshot)
+        created = False
+        for path, (lines, snapshot) in files.items():
+            with open(path + '.lock', 'a') as lock:
+                # The lock file serializes writers across processes
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    size = os.path.getsize(path)
+                except FileNotFoundError:
+                    size = None
+                if snapshot is not None and size is not None and size > self.compact_size:
+                    version, start = snapshot
+                    self._compact(path, version, lines[start:])
+                    created = True
+                    continue
+                created = created or size is None
+                data = ''.join(line + '\n' for line in lines).encode('utf-8')
+                with open(path, 'a+b') as f:
+                    if size:
+                        f.seek(size - 1)
+                        if f.read(1) != b'\n':
+                            # The last record was torn by a crash; don't
+                            # run on from it
+                            data = b'\n' + data
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+        if created and os.name == 'posix':
+            # New and renamed files only survive a crash once the directory
+            # entry does
+            fd = os.open(self.directory, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def _compact(self, path, version, lines):
+        # Start the file again from a new snapshot. Deltas already on top of
+        # it, from another process that saved in the meantime, are kept.
+        newer = [line for line in self._lines(path) if record_version(line) > version]
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(''.join(line + '\n' for line in lines + newer))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _lines(self, path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                return f.read().splitlines()
+        except FileNotFoundError:
+            return []
+
+    def load(self, match_id):
+        # The match as of its latest journalled version: the newest
+        # snapshot, then each delta that follows on from it
+        lines = self._lines(self._path(match_id))
+        snapshots = sorted(((record_version(line), line) for line in lines if is_snapshot(line)), reverse=True)
+        for version, line in snapshots:
+            try:
+                state = MatchState(loads(line)['state'])
+                break
+            except ValueError:
+                continue
+        else:
+            return None
+        deltas = {}
+        for line in lines:
+            if record_version(line) > version and not is_snapshot(line):
+                try:
+                    record = loads(line)
+                except ValueError:
+                    continue
+                deltas[record['base']] = record
+        count = 0
+        while state.get('version', 0) in deltas:
+            record = deltas.pop(state.get('version', 0))
+            state['engine'].play(record['events'])
+            state.update(record['match'])
+            for key in record.get('removed', ()):
+                state.pop(key, None)
+            count += 1
+        if 'engine' in state:
+            state['engine'].mark()
+        state.modified = False
+        state.changed.clear()
+        self.deltas[match_id] = count
+        return state
+
+    def expired(self):
+        # Ids of matches not saved for max_age seconds
+        if self.max_age is None:
+            return []
+        cutoff = time.time() - self.max_age
+        return [entry.name[:-len('.wal')] for entry in os.scandir(self.directory)
+                if entry.name.endswith('.wal') and entry.stat().st_mtime < cutoff]
+
+    def matches(self, limit=None):
+        # Ids of journalled matches, most recently saved first
+        entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith('.wal')]
+        entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+        return [entry.name[:-4] for entry in entries[:limit]]
+
+
+class JournaledStore(MatchStore):
+    # Another store with a journal behind it. Saves go to the store first,
+    # which settles conflicts, then to the journal before returning.
+    def __init__(self, store, journal):
+        self.store = store
+        self.journal = journal
+
+    def new_id(self):
+        return self.store.new_id()
+
+    def load(self, match_id):
+        return self.store.load(match_id)
+
+    def version(self, match_id):
+        return self.store.version(match_id)
+
+    def save(self, match_id, state, expected_version=None):
+        engine = state.get('engine')
+        # Engine inputs since it was loaded, if that's all that happened to it
+        events = engine.events_since_mark() if engine is not None and 'engine' not in state.changed else None
+        self.store.save(match_id, state, expected_version)
+        if 'winner' in state:
+            # Finished, so it's in the archive already
+            self.journal.discard(match_id)
+        else:
+            self.journal.append(match_id, state, expected_version, events)
+        if engine is not None:
+            engine.mark()
+        state.changed.clear()
+
+    def delete(self, match_id):
+        self.store.delete(match_id)
+        self.journal.discard(match_id)
+
+    def recover(self):
+        # Put back every journalled match the store has lost or is behind
+        # on. A journal that can't be replayed is left where it is.
+        self.journal.clear()
+        recovered = 0
+        for match_id in self.journal.matches():
+            try:
+                state = self.journal.load(match_id)
+            except (KeyError, ValueError):
+                continue
+            if state is None:
+                continue
+            stored = self.store.load(match_id)
+            if stored is None or stored.get('version', 0) < state.get('version', 0):
+                self.store.save(match_id, state)
+                recovered += 1
+        return recovered
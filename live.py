@@ -0,0 +1,146 @@
+# live.py
+# Fan-out of live scoreboard snapshots to spectators. Each match channel
+# keeps only its latest snapshot, serialized once when published; every
+# subscriber is handed the same bytes. A subscriber that falls behind just
+# skips to the newest snapshot, so slow readers never hold up the scorer.
+#
+# Channels are per process. With several worker processes a ball is only
+# published on the worker that saved it, so waiting spectators also look
+# for a newer match version in the store every check_interval seconds,
+# once per channel however many are waiting.
+#
+# A channel only exists while someone is watching: the first spectator of a
+# match opens it and it goes when the last one leaves. Its seq is the match
+# version, so a spectator's place survives the channel being reopened or
+# another worker serving the next request.
+import json
+import threading
+import time
+
+
+class Channel:
+    def __init__(self, match_id):
+        self.match_id = match_id
+        self.seq = 0
+        self.data = None
+        self.frame = None
+        self.finished = False
+        # When the store was last checked for a newer match version
+        self.checked = 0
+        self.subscribers = 0
+        self._cond = threading.Condition()
+
+    @property
+    def version(self):
+        return self.seq if self.data is not None else None
+
+    def publish(self, snapshot, version):
+        data = json.dumps(snapshot, separators=(',', ':'))
+        with self._cond:
+            if self.data is not None and version <= self.seq:
+                # Already published, or overtaken while it was being loaded
+                return
+            self.seq = version
+            self.data = data
+            self.finished = 'result' in snapshot
+            self.frame = f"id: {self.seq}\nevent: score\ndata: {data}\n\n".encode('utf-8')
+            self._cond.notify_all()
+
+    def wait(self, since, timeout):
+        # Block until there is something newer than `since`. A client that
+        # saw a later seq (from a match since rolled back) gets the current
+        # snapshot.
+        with self._cond:
+            if since <= self.seq:
+                self._cond.wait_for(lambda: self.seq > since, timeout)
+            return self.seq, self.data, self.frame
+
+
+class LiveHub:
+    def __init__(self, max_subscribers=5000, keepalive=15, refresh=None, check_interval=2):
+        # refresh(match_id, version) returns (snapshot, version) for a match
+        # saved since `version`, or None if it hasn't changed
+        self.max_subscribers = max_subscribers
+        self.keepalive = keepalive
+        self.refresh = refresh
+        self.check_interval = check_interval
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def get(self, match_id):
+        # The match's channel if anyone is watching it, else None
+        with self._lock:
+            return self._channels.get(match_id)
+
+    def subscribe(self, match_id, load):
+        # The match's channel, counting one more subscriber until
+        # unsubscribe(). The first subscriber opens it with load(), which
+        # returns (snapshot, version), or None for a match that doesn't exist.
+        with self._lock:
+            channel = self._channels.get(match_id)
+            if channel is not None:
+                channel.subscribers += 1
+        if channel is not None:
+            self.check(channel)
+            return channel
+        loaded = load()
+        if loaded is None:
+            return None
+        with self._lock:
+            channel = self._channels.setdefault(match_id, Channel(match_id))
+            channel.subscribers += 1
+        channel.publish(*loaded)
+        return channel
+
+    def unsubscribe(self, channel):
+        with self._lock:
+            channel.subscribers -= 1
+            if channel.subscribers <= 0 and self._channels.get(channel.match_id) is channel:
+                del self._channels[channel.match_id]
+
+    def check(self, channel):
+        # Publish a change saved by another process, if there is one. Only
+        # the first caller in each check_interval goes to the store.
+        if self.refresh is None:
+            return
+        with channel._cond:
+            now = time.monotonic()
+            if now - channel.checked < self.check_interval:
+                return
+            channel.checked = now
+            version = channel.version
+        changed = self.refresh(channel.match_id, version)
+        if changed is not None:
+            channel.publish(*changed)
+
+    def wait(self, channel, since, timeout):
+        # channel.wait(), checking the store for changes made elsewhere
+        # while nothing is published here
+        if self.refresh is None:
+            return channel.wait(since, timeout)
+        deadline = time.monotonic() + timeout
+        while True:
+            seq, data, frame = channel.wait(since, min(self.check_interval, max(0, deadline - time.monotonic())))
+            if seq != since or time.monotonic() >= deadline:
+                return seq, data, frame
+            self.check(channel)
+
+    def stream(self, channel, last_seq=0):
+        # Server-Sent Events generator for one subscriber of the channel,
+        # ending after the match result. Returns None if the channel is full.
+        if channel.subscribers > self.max_subscribers:
+            return None
+        return self._stream(channel, last_seq)
+
+    def _stream(self, channel, last_seq):
+        yield b"retry: 3000\n\n"
+        while True:
+            seq, _, frame = self.wait(channel, last_seq, self.keepalive)
+            if seq == last_seq:
+                # Comment line keeps proxies from closing an idle stream
+                yield b": keepalive\n\n"
+                continue
+            last_seq = seq
+            yield frame
+            if channel.finished:
+                return
@@ -0,0 +1,237 @@
+# metrics.py
+# In-process metrics in the Prometheus text format, and a sampling profiler
+# for single requests. Each worker process keeps its own numbers; Prometheus
+# scrapes and sums them per process.
+import collections
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import before_render_template, template_rendered, request_finished, g, request
+
+
+# Seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+# Bytes
+SIZE_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+# A match counts as active if it was saved within this many seconds
+ACTIVE_WINDOW = 300
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                     for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = collections.defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] += amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                yield f"{self.name}{_labels(self.labels, labels)} {value:g}"
+
+
+class Gauge:
+    # Value read from a callback at scrape time
+    def __init__(self, name, help, read):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        yield f"{self.name} {self.read():g}"
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [count per bucket..., +Inf count, sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        names = self.labels + ('le',)
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), series):
+                    cumulative += count
+                    yield f"{self.name}_bucket{_labels(names, labels + (bound,))} {cumulative}"
+                yield f"{self.name}_sum{_labels(self.labels, labels)} {series[-1]:g}"
+                yield f"{self.name}_count{_labels(self.labels, labels)} {cumulative}"
+
+
+class Metrics:
+    # The app's metrics. install() hooks the request-wide ones into an app;
+    # the rest are fed from the routes.
+    def __init__(self):
+        self.requests = Histogram('cricket_request_seconds', "Request latency by endpoint",
+                                  ('endpoint', 'method'))
+        self.store = Histogram('cricket_store_seconds', "Match store load and save time", ('operation',))
+        self.render = Histogram('cricket_render_seconds', "Template render time by page", ('page',))
+        self.session_bytes = Histogram('cricket_session_cookie_bytes', "Size of session cookies sent",
+                                       buckets=SIZE_BUCKETS)
+        self.balls = Counter('cricket_balls_total', "Deliveries recorded")
+        self.statuses = Counter('cricket_responses_total', "Responses by status code", ('status',))
+        self.active = Gauge('cricket_active_matches', f"Matches saved in the last {ACTIVE_WINDOW}s",
+                            self.active_matches)
+        self._seen = {}
+        self._seen_lock = threading.Lock()
+
+    def touch(self, match_id):
+        with self._seen_lock:
+            self._seen[match_id] = time.monotonic()
+
+    def active_matches(self):
+        cutoff = time.monotonic() - ACTIVE_WINDOW
+        with self._seen_lock:
+            for match_id in [m for m, seen in self._seen.items() if seen < cutoff]:
+                del self._seen[match_id]
+            return len(self._seen)
+
+    def exposition(self):
+        lines = []
+        for metric in (self.requests, self.store, self.render, self.session_bytes, self.balls,
+                       self.statuses, self.active):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def install(self, app):
+        started = threading.local()
+
+        @app.before_request
+        def start_timer():
+            g.request_started = time.perf_counter()
+
+        def record_request(sender, response, **extra):
+            # Sent once the session has been saved, so its cookie is included
+            started_at = g.pop('request_started', None)
+            if started_at is not None:
+                # Streamed responses are timed to the first byte
+                self.requests.observe(time.perf_counter() - started_at, request.endpoint or 'unmatched',
+                                      request.method)
+            self.statuses.inc(response.status_code)
+            for header in response.headers.getlist('Set-Cookie'):
+                if header.startswith(app.config['SESSION_COOKIE_NAME'] + '='):
+                    self.session_bytes.observe(len(header))
+
+        def before_render(sender, template, context, **extra):
+            started.at = time.perf_counter()
+
+        def after_render(sender, template, context, **extra):
+            self.render.observe(time.perf_counter() - started.at, context.get('page', template.name))
+
+        request_finished.connect(record_request, app, weak=False)
+        before_render_template.connect(before_render, app, weak=False)
+        template_rendered.connect(after_render, app, weak=False)
+
+
+class Sampler:
+    # Samples one thread's Python stack every `interval` seconds from a
+    # background thread. Cheap enough to leave off by default and switch on
+    # for a single request.
+
+    # The switch interval is process-wide, so while any sampler runs it is
+    # the shortest any of them asked for, and it goes back to what it was
+    # when the last one stops
+    _running = []
+    _switch_interval = None
+    _switch_lock = threading.Lock()
+
+    def __init__(self, thread_id, interval=0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        # The sampling thread only runs when the interpreter switches
+        # threads, so switch as often as we sample while profiling
+        with Sampler._switch_lock:
+            if not Sampler._running:
+                Sampler._switch_interval = sys.getswitchinterval()
+            Sampler._running.append(self)
+            Sampler._set_switch_interval()
+        self.started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join()
+        with Sampler._switch_lock:
+            Sampler._running.remove(self)
+            Sampler._set_switch_interval()
+        self.elapsed = time.perf_counter() - self.started
+
+    @staticmethod
+    def _set_switch_interval():
+        sys.setswitchinterval(min([Sampler._switch_interval] + [s.interval for s in Sampler._running]))
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def report(self):
+        # Collapsed stacks, one per line with its sample count, which flame
+        # graph tools read directly
+        header = f"# {self.samples} samples over {self.elapsed * 1000:.1f}ms every {self.interval * 1000:g}ms\n"
+        return header + ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
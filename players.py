@@ -0,0 +1,87 @@
+# players.py
+# Registry of players and saved squads. Every player gets a stable integer
+# id, so two players with the same name are still two players, and a squad
+# saved once can be picked again for later matches with the same ids.
+import sqlite3
+import threading
+import time
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS players_name ON players (name);
+
+CREATE TABLE IF NOT EXISTS squads (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS squad_players (
+    squad_id INTEGER NOT NULL REFERENCES squads (id),
+    position INTEGER NOT NULL,
+    player_id INTEGER NOT NULL REFERENCES players (id),
+    PRIMARY KEY (squad_id, position)
+) WITHOUT ROWID;
+"""
+
+
+def roster(ids, names):
+    # Player dicts for a side, as the engine takes them
+    return [{"id": player_id, "name": name} for player_id, name in zip(ids, names)]
+
+
+class PlayerRegistry:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self):
+        # One connection per thread, as in SQLiteStore
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def register(self, names):
+        # A new player for every name, duplicates included
+        now = time.time()
+        with self._connect() as conn:
+            return [{"id": conn.execute("INSERT INTO players (name, created_at) VALUES (?, ?)",
+                                        (name, now)).lastrowid, "name": name}
+                    for name in names]
+
+    def save_squad(self, name, players):
+        # players: [{"id", "name"}] in batting order
+        with self._connect() as conn:
+            squad_id = conn.execute("INSERT INTO squads (name, created_at) VALUES (?, ?)",
+                                    (name, time.time())).lastrowid
+            conn.executemany(
+                "INSERT INTO squad_players (squad_id, position, player_id) VALUES (?, ?, ?)",
+                [(squad_id, position, player['id']) for position, player in enumerate(players)],
+            )
+        return squad_id
+
+    def squad(self, squad_id):
+        conn = self._connect()
+        row = conn.execute("SELECT id, name FROM squads WHERE id = ?", (squad_id,)).fetchone()
+        if row is None:
+            return None
+        players = conn.execute(
+            "SELECT p.id, p.name FROM squad_players s JOIN players p ON p.id = s.player_id"
+            " WHERE s.squad_id = ? ORDER BY s.position", (squad_id,))
+        return {"id": row[0], "name": row[1], "players": [{"id": i, "name": n} for i, n in players]}
+
+    def squads(self, limit=50):
+        rows = self._connect().execute(
+            "SELECT s.id, s.name, (SELECT count(*) FROM squad_players WHERE squad_id = s.id)"
+            " FROM squads s ORDER BY s.id DESC LIMIT ?", (limit,))
+        return [{"id": squad_id, "name": name, "size": size} for squad_id, name, size in rows]
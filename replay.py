@@ -0,0 +1,330 @@
+# replay.py
+# Bulk import of ball-by-ball scorebooks. Each file holds one match, either
+# as JSON (the format written by the JSON export) or as CSV (the ball-by-ball
+# export). Every delivery goes through MatchEngine, the same rules the
+# scoring pages use, and each match is checked against the totals recorded
+# in the file. Files are replayed in parallel, one match per task.
+#
+#   python replay.py [--workers N] [--archive archive.db] scorebooks/
+import argparse
+import csv
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from engine import MatchEngine, WIDE, NO_BALL, SCORE, INNINGS_END, SELECT_BATSMEN, NEW_BATSMAN, match_result
+
+
+class ReplayError(Exception):
+    pass
+
+
+def delivery(row):
+    # One ball from either format. A run out at the non-striker's end may
+    # name the batsman in run_out_batsman; otherwise it is worked out from
+    # who batted on.
+    extra = row.get('extra_type') or None
+    runs = WIDE if extra == 'WD' else NO_BALL if extra == 'NB' else int(row['runs'])
+    return {
+        'over': int(row['over']),
+        'batsman': row['batsman'],
+        'bowler': row['bowler'],
+        'runs': runs,
+        'wicket_type': row.get('wicket_type') or None,
+        'run_out_batsman': row.get('run_out_batsman') or None,
+    }
+
+
+def read_json(data):
+    doc = json.loads(data)
+    innings = [{
+        'team': entry['team'],
+        'balls': [delivery(ball) for ball in entry['balls']],
+        'total': entry.get('total'),
+        'wickets': entry.get('wickets'),
+        'batting': entry.get('batting') or [],
+        'reductions': entry.get('reductions') or [],
+    } for entry in doc['innings']]
+    return {
+        'team1': doc['team1'],
+        'team2': doc['team2'],
+        'overs': doc.get('overs'),
+        'players': {team: players for team, players in (doc.get('players') or {}).items() if players},
+        'toss_winner': doc.get('toss_winner'),
+        'target': doc.get('target'),
+        'innings': innings,
+    }
+
+
+def read_csv(data):
+    # Rows are grouped into innings by the `innings` column. The file has no
+    # separate totals, so the rows themselves are the record checked against.
+    innings = {}
+    for row in csv.DictReader(io.StringIO(data)):
+        entry = innings.get(row['innings'])
+        if entry is None:
+            entry = innings[row['innings']] = {'team': row['team'], 'balls': [], 'total': 0, 'wickets': 0,
+                                               'batting': [], 'reductions': []}
+        ball = delivery(row)
+        entry['balls'].append(ball)
+        entry['total'] += 1 if ball['runs'] < 0 else ball['runs']
+        entry['wickets'] += 1 if ball['wicket_type'] else 0
+    innings = [innings[number] for number in sorted(innings, key=int)]
+    if len(innings) != 2:
+        raise ReplayError(f"expected 2 innings, found {len(innings)}")
+    return {
+        'team1': innings[0]['team'],
+        'team2': innings[1]['team'],
+        'overs': None,
+        'players': {},
+        'toss_winner': None,
+        'target': None,
+        'innings': innings,
+    }
+
+
+def player(name):
+    # Scorebooks only have names, so within a replay the name is the id
+    return {'id': name, 'name': name}
+
+
+def batting_order(innings):
+    # Scorecard order where there is one, else order of first appearance
+    if innings['batting']:
+        return [batsman['name'] for batsman in innings['batting']]
+    order = {}
+    for ball in innings['balls']:
+        order.setdefault(ball['batsman'], None)
+    return list(order)
+
+
+def replay_innings(engine, number, innings):
+    balls = innings['balls']
+    order = batting_order(innings)
+    last_faced = {ball['batsman']: i for i, ball in enumerate(balls)}
+    out_at_end = {batsman['name'] for batsman in innings['batting'] if batsman['out']}
+    unknown = 0
+
+    def next_batsman(exclude=None):
+        # Next arrival who hasn't batted yet. Someone who came in and never
+        # faced a ball may be missing from a CSV scorebook.
+        nonlocal unknown
+        for name in order:
+            if name not in engine.batted and name != exclude:
+                return player(name)
+        unknown += 1
+        return player(f"Unknown batsman {unknown}")
+
+    # Overs lost to rain, cut when the same number of balls had been bowled
+    reductions = sorted(innings['reductions'])
+
+    def reduce_overs(before):
+        while reductions and reductions[0][0] <= before:
+            engine.reduce_overs(reductions.pop(0)[1])
+
+    for i, ball in enumerate(balls):
+        where = f"innings {number}, over {ball['over'] + 1}"
+        reduce_overs(i)
+        # Make the selections the scorer would have made before this ball
+        step = engine.next_step()
+        while step != SCORE:
+            if step == INNINGS_END:
+                raise ReplayError(f"{where}: {len(balls) - i} deliveries after the innings ended")
+            if step == SELECT_BATSMEN:
+                engine.set_openers(player(ball['batsman']), next_batsman(exclude=ball['batsman']))
+            elif step == NEW_BATSMAN:
+                engine.add_batsman(next_batsman())
+            else:
+                engine.set_bowler(player(ball['bowler']))
+            step = engine.next_step()
+        if engine.current_bowler != ball['bowler']:
+            engine.set_bowler(player(ball['bowler']))
+
+        striker = engine.batsmen[engine.striker_index]['name']
+        non_striker = engine.batsmen[engine.non_striker_index]['name'] if engine.non_striker_index != -1 else None
+        if ball['batsman'] != striker:
+            if ball['batsman'] != non_striker:
+                raise ReplayError(f"{where}: {ball['batsman']} is not at the crease")
+            engine.switch_strike()
+            striker, non_striker = non_striker, striker
+
+        run_out_batsman = ball['run_out_batsman']
+        if ball['wicket_type'] == 'Run Out' and run_out_batsman is None and non_striker is not None:
+            # The striker batting on later, or surviving on the scorecard,
+            # means it was the non-striker who was run out
+            if last_faced[striker] > i or (non_striker in out_at_end and striker not in out_at_end):
+                run_out_batsman = non_striker
+                if last_faced.get(non_striker, -1) > i and engine.batsmen[engine.non_striker_index]['balls'] == 0:
+                    # Both batsmen bat on, so the one run out was someone who
+                    # never faced and isn't in the scorebook; the name goes
+                    # back to the batsmen still to come
+                    unknown += 1
+                    run_out_batsman = f"Unknown batsman {unknown}"
+                    entry = engine.batsmen[engine.non_striker_index]
+                    engine.batted.discard(entry['id'])
+                    engine.batted.add(run_out_batsman)
+                    entry['id'] = entry['name'] = run_out_batsman
+
+        engine.apply(ball['runs'], ball['wicket_type'], run_out_batsman)
+        if engine.log[-1].over != ball['over']:
+            raise ReplayError(f"{where}: scorebook has this ball in over {ball['over'] + 1}, "
+                              f"the rules put it in over {engine.log[-1].over + 1}")
+    reduce_overs(len(balls))
+
+    summary = engine.innings_summary()
+    if innings['total'] is not None and summary['total'] != innings['total']:
+        raise ReplayError(f"innings {number}: total {summary['total']}, scorebook says {innings['total']}")
+    if innings['wickets'] is not None and summary['wickets'] != innings['wickets']:
+        raise ReplayError(f"innings {number}: {summary['wickets']} wickets, scorebook says {innings['wickets']}")
+    recorded = {batsman['name']: batsman['runs'] for batsman in innings['batting']}
+    for batsman in summary['batsmen']:
+        if batsman['name'] in recorded and batsman['runs'] != recorded[batsman['name']]:
+            raise ReplayError(f"innings {number}: {batsman['name']} scored {batsman['runs']}, "
+                              f"scorebook says {recorded[batsman['name']]}")
+    return summary
+
+
+def replay_match(scorebook, squad=11, overs=None):
+    # Returns the completed match in the same shape as a finished match in
+    # the store, ready for the archive
+    first, second = scorebook['innings']
+    players = scorebook['players']
+    overs = scorebook['overs'] or overs or 1 + max(
+        (ball['over'] for innings in (first, second) for ball in innings['balls']), default=0)
+
+    def squad_size(innings):
+        if innings['team'] in players:
+            return len(players[innings['team']])
+        return max(squad, len(batting_order(innings)))
+
+    engine = MatchEngine(overs, squad_size(first))
+    first_summary = replay_innings(engine, 1, first)
+    first_log = engine.log
+    engine.start_innings(2, squad_size(second), first_innings=(first_summary['total'], engine.resources))
+    second_summary = replay_innings(engine, 2, second)
+
+    match = {
+        'team1_name': scorebook['team1'],
+        'team2_name': scorebook['team2'],
+        'overs': overs,
+        'toss_winner': scorebook['toss_winner'] or first['team'],
+        'batting_first': first['team'],
+        'first_innings_log': first_log,
+        'second_innings_log': engine.log,
+    }
+    for team in ('team1', 'team2'):
+        name = scorebook[team]
+        if name in players:
+            match[team] = list(players[name])
+        else:
+            # Everyone seen batting or bowling for the side
+            seen = dict.fromkeys(batting_order(first if first['team'] == name else second))
+            for ball in (second if first['team'] == name else first)['balls']:
+                seen.setdefault(ball['bowler'], None)
+            match[team] = list(seen)
+    for prefix, summary in (('first', first_summary), ('second', second_summary)):
+        match[prefix + '_innings_total'] = summary['total']
+        match[prefix + '_innings_wickets'] = summary['wickets']
+        match[prefix + '_innings_overs'] = summary['overs']
+        match[prefix + '_innings_batsmen'] = summary['batsmen']
+        match[prefix + '_innings_bowlers'] = summary['bowlers']
+        match[prefix + '_innings_max_overs'] = summary['max_overs']
+        match[prefix + '_innings_reductions'] = summary['reductions']
+    if scorebook['target'] is not None and engine.target != scorebook['target']:
+        raise ReplayError(f"target {engine.target}, scorebook says {scorebook['target']}")
+    match['target'] = engine.target
+    match['winner'], match['win_margin'], match['win_type'] = match_result(
+        first_summary['total'], second_summary['total'], engine.wickets_remaining, first['team'], second['team'],
+        engine.target)
+    return match
+
+
+def replay_file(path, squad=11, overs=None):
+    # One task in the pool: (path, match id, match or None, balls, error)
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        # Ids come from the file contents, so importing a file twice is a no-op
+        match_id = hashlib.sha1(data).hexdigest()[:32]
+        read = read_csv if path.lower().endswith('.csv') else read_json
+        scorebook = read(data.decode('utf-8'))
+        match = replay_match(scorebook, squad, overs)
+    except ReplayError as e:
+        return path, None, None, 0, str(e)
+    except (ValueError, KeyError, OSError) as e:
+        # Unreadable file, or a delivery the rules reject
+        return path, None, None, 0, f"{type(e).__name__}: {e}"
+    balls = len(match['first_innings_log']) + len(match['second_innings_log'])
+    return path, match_id, match, balls, None
+
+
+def scorebook_paths(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in sorted(files):
+                    if name.lower().endswith(('.json', '.csv')):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay ball-by-ball scorebooks through the scoring rules")
+    parser.add_argument('paths', nargs='+', help="scorebook files, or directories of .json/.csv files")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="worker processes (1 runs inline)")
+    parser.add_argument('--archive', help="archive database to add the matches to")
+    parser.add_argument('--squad', type=int, default=11, help="squad size when a scorebook has no squads")
+    parser.add_argument('--overs', type=int, help="overs per innings when a scorebook doesn't say")
+    args = parser.parse_args(argv)
+
+    archive = None
+    if args.archive:
+        from archive import MatchArchive
+        archive = MatchArchive(args.archive)
+
+    task = partial(replay_file, squad=args.squad, overs=args.overs)
+    paths = list(scorebook_paths(args.paths))
+    matches = balls = failed = imported = 0
+    # Big enough chunks to keep pool overhead down, small enough to balance
+    chunksize = max(1, len(paths) // (args.workers * 8))
+    start = time.perf_counter()
+    with ProcessPoolExecutor(args.workers) if args.workers > 1 else _Inline() as pool:
+        for path, match_id, match, count, error in pool.map(task, paths, chunksize=chunksize):
+            if error:
+                failed += 1
+                print(f"{path}: {error}", file=sys.stderr)
+                continue
+            matches += 1
+            balls += count
+            # Archived from this process only, so there is a single writer
+            if archive is not None and archive.record(match_id, match) is not None:
+                imported += 1
+    elapsed = time.perf_counter() - start
+
+    print(f"{matches} matches, {balls} balls in {elapsed:.2f}s "
+          f"({balls / elapsed if elapsed else 0:.0f} balls/sec), {failed} failed")
+    if archive is not None:
+        print(f"{imported} new matches archived in {args.archive}")
+    return 1 if failed else 0
+
+
+class _Inline:
+    # Stand-in for the pool when running in one process
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def map(self, fn, iterable, chunksize=1):
+        return map(fn, iterable)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -22,6 +22,23 @@ function toggleExtraOptions() {
 }
 
 window.onload = function () {
+  const ballForm = document.getElementById("ball-form");
+  if (ballForm) {
+    // The page is cached and shared by everyone viewing this version of the
+    // match, so each gets its own key here
+    ballForm.elements.ball_key.value = newBallKey();
+    startBallQueue(ballForm);
+    ballForm.addEventListener("submit", queueBall);
+  }
+  const charts = document.getElementById("charts");
+  if (charts) {
+    loadCharts(charts);
+  }
+  const liveBoard = document.getElementById("live-scoreboard");
+  if (liveBoard) {
+    startLiveScoreboard(liveBoard);
+    return;
+  }
   toggleExtraOptions();
   toggleWicketType();
 };
@@ -38,6 +55,20 @@ function addPlayer(team) {
   playersDiv.appendChild(newPlayer);
 }
 
+// A saved squad brings its own players; typing them isn't needed
+function chooseSquad(team, select) {
+  const saved = select.value !== "";
+  const playersDiv = document.getElementById(`${team}-players`);
+  playersDiv.style.display = saved ? "none" : "";
+  playersDiv.querySelectorAll("input").forEach((input, i) => {
+    input.required = !saved && i < 2;
+  });
+  const name = document.querySelector(`input[name="${team}_name"]`);
+  if (saved) {
+    name.value = select.selectedOptions[0].dataset.name;
+  }
+}
+
 function performToss() {
   const coin = document.getElementById("coin");
   coin.classList.add("coin-flip");
@@ -58,3 +89,524 @@ function switchStrike() {
   // Submit a form to switch striker and non-striker
   document.getElementById("switchStrikeForm").submit();
 }
+
+// Deliveries are queued in localStorage and shown straight away, then sent
+// to the server in batches. A dropped connection only delays the sync; the
+// queue survives reloads and is sent again, and the server skips any ball
+// whose key it has already recorded.
+const SYNC_DELAY = 1500;
+const SYNC_RETRY = 5000;
+const SYNC_BATCH = 36;
+let ballQueue = null;
+
+function startBallQueue(form) {
+  const storageKey = `balls:${form.dataset.match}:${form.dataset.innings}`;
+  ballQueue = {
+    form,
+    storageKey,
+    innings: parseInt(form.dataset.innings, 10),
+    items: JSON.parse(localStorage.getItem(storageKey) || "[]"),
+    // Balls the server had when the page was rendered, and the position in
+    // the current over as far as this page knows
+    balls: parseInt(form.dataset.balls, 10),
+    over: parseInt(form.dataset.over, 10),
+    overBall: parseInt(form.dataset.overBall, 10),
+    timer: null,
+    syncing: false,
+  };
+  // Anything left from the previous innings came after it ended
+  localStorage.removeItem(`balls:${form.dataset.match}:${ballQueue.innings - 1}`);
+  ballQueue.items.forEach(showPendingBall);
+  window.addEventListener("online", syncBalls);
+  syncBalls();
+}
+
+function queueBall(event) {
+  event.preventDefault();
+  const form = event.target;
+  const data = new FormData(form);
+  const runs = parseInt(data.get("runs"), 10);
+  const wicketType = data.get("is_wicket") ? data.get("wicket_type") : null;
+  const item = {
+    key: data.get("ball_key") || newBallKey(),
+    seq: ballQueue.balls + ballQueue.items.length,
+    runs,
+    wicket_type: wicketType,
+    run_out_batsman: wicketType === "Run Out" ? parseInt(data.get("run_out_batsman"), 10) : null,
+  };
+  ballQueue.items.push(item);
+  saveBallQueue();
+  showPendingBall(item);
+  resetBallForm(form);
+  // A wicket or the end of the over needs a selection on the server, so
+  // those go at once; everything else waits to share a request
+  if (wicketType || ballQueue.overBall === 0) {
+    syncBalls();
+  } else {
+    clearTimeout(ballQueue.timer);
+    ballQueue.timer = setTimeout(syncBalls, SYNC_DELAY);
+  }
+}
+
+function saveBallQueue() {
+  if (ballQueue.items.length) {
+    localStorage.setItem(ballQueue.storageKey, JSON.stringify(ballQueue.items));
+  } else {
+    localStorage.removeItem(ballQueue.storageKey);
+  }
+  const status = document.getElementById("sync-status");
+  const waiting = ballQueue.items.length;
+  status.textContent = waiting ? `${waiting} ball${waiting !== 1 ? "s" : ""} waiting to sync` : "";
+}
+
+function showPendingBall(item) {
+  // Optimistic score: the server's figures replace it once synced
+  const over = ballQueue.over;
+  const legal = item.runs >= 0;
+  if (legal) {
+    ballQueue.overBall += 1;
+  }
+  const runs = document.getElementById("score-runs");
+  runs.textContent = parseInt(runs.textContent, 10) + (legal ? item.runs : 1);
+  if (item.wicket_type) {
+    const wickets = document.getElementById("score-wickets");
+    wickets.textContent = `/${parseInt(wickets.textContent.slice(1), 10) + 1}`;
+  }
+  document.getElementById("score-overs").textContent = `(${over}.${ballQueue.overBall} Overs)`;
+
+  const row = commentaryRow({
+    index: item.seq,
+    over,
+    ball: ballQueue.overBall,
+    bowler: "",
+    batsman: "",
+    runs: item.runs,
+    is_wicket: Boolean(item.wicket_type),
+    wicket_type: item.wicket_type,
+  });
+  row.classList.add("pending");
+  row.dataset.key = item.key;
+  const group = commentaryGroup(over, null);
+  group.insertBefore(row, group.children[1] || null);
+
+  if (ballQueue.overBall >= 6) {
+    ballQueue.over += 1;
+    ballQueue.overBall = 0;
+  }
+}
+
+function syncBalls() {
+  if (!ballQueue || ballQueue.syncing || !ballQueue.items.length) return;
+  clearTimeout(ballQueue.timer);
+  ballQueue.syncing = true;
+  const form = ballQueue.form;
+  fetch(form.dataset.sync, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ innings: ballQueue.innings, balls: ballQueue.items.slice(0, SYNC_BATCH) }),
+  })
+    .then((response) => response.json().then((data) => ({ response, data })))
+    .then(({ response, data }) => {
+      if (data.applied === undefined) {
+        // The request never got as far as the balls (a save conflict, or
+        // the server struggling), so nothing was kept; try again
+        throw new Error(data.error);
+      }
+      ballQueue.syncing = false;
+      const applied = new Set(data.applied || []);
+      ballQueue.items = ballQueue.items.filter((item) => !applied.has(item.key));
+      ballQueue.balls = data.balls;
+      document.querySelectorAll(".ball-event.pending").forEach((row) => {
+        if (applied.has(row.dataset.key)) row.remove();
+      });
+      (data.recorded || []).forEach((ball) => addCommentary(ball, null));
+      if (data.delta) {
+        applyBallDelta(data.delta, false);
+      }
+      if (response.status === 409) {
+        // Someone else changed the match; what's queued no longer fits
+        ballQueue.items = [];
+        saveBallQueue();
+        alert(`${data.error}. Balls not yet synced were discarded.`);
+        window.location.reload();
+        return;
+      }
+      if (!response.ok) {
+        // Drop the ball the server refused so the rest can go through
+        const refused = ballQueue.items.shift();
+        saveBallQueue();
+        alert(data.error || "Could not record the ball");
+        if (refused) window.location.reload();
+        return;
+      }
+      saveBallQueue();
+      if (data.next) {
+        // Anything still queued is sent again once the selection is made
+        window.location = data.next;
+      } else if (ballQueue.items.length) {
+        syncBalls();
+      } else if (data.delta) {
+        // Back in step with the server
+        ballQueue.over = parseInt(data.delta.score.overs.split(".")[0], 10);
+        ballQueue.overBall = parseInt(data.delta.score.overs.split(".")[1], 10);
+      }
+    })
+    .catch(() => {
+      ballQueue.syncing = false;
+      const status = document.getElementById("sync-status");
+      status.textContent = `Offline: ${ballQueue.items.length} ball${ballQueue.items.length !== 1 ? "s" : ""} queued`;
+      ballQueue.timer = setTimeout(syncBalls, SYNC_RETRY);
+    });
+}
+
+function applyBallDelta(data, withBall = true) {
+  const score = data.score;
+  document.getElementById("score-runs").textContent = score.runs;
+  document.getElementById("score-wickets").textContent = `/${score.wickets}`;
+  document.getElementById("score-overs").textContent = `(${score.overs} Overs)`;
+  document.getElementById("run-rate").textContent = score.run_rate;
+  if (score.required !== undefined) {
+    document.getElementById("runs-required").textContent = score.required;
+    document.getElementById("balls-left").textContent = score.balls_left;
+    document.getElementById("par-score").textContent = score.par;
+  }
+  document.getElementById("free-hit").style.display = score.free_hit ? "" : "none";
+
+  if (data.forecast && document.getElementById("forecast")) {
+    document.getElementById("win-batting").textContent = data.forecast.batting;
+    document.getElementById("win-bowling").textContent = data.forecast.bowling;
+    document.getElementById("projected").textContent = data.forecast.projected;
+    document.getElementById("projected-range").textContent =
+      `(${data.forecast.low}-${data.forecast.high})`;
+  }
+
+  const bowler = data.bowler;
+  document.getElementById("bowler-figures").textContent =
+    `${bowler.overs}-${bowler.maidens}-${bowler.runs}-${bowler.wickets}`;
+
+  document.querySelectorAll(".batsman-stat-box").forEach((box) => {
+    box.classList.remove("active");
+    box.onclick = null;
+    box.style.cursor = "";
+  });
+  data.batsmen.forEach((batsman) => {
+    const box = document.querySelector(
+      `.batsman-stat-box[data-index="${batsman.index}"]`
+    );
+    if (!box) return;
+    box.querySelector(".batsman-score").textContent = `${batsman.runs}(${batsman.balls})`;
+    if (batsman.striker) {
+      box.classList.add("active");
+      box.onclick = switchStrike;
+      box.style.cursor = "pointer";
+    }
+  });
+
+  if (withBall) {
+    addCommentary(data.ball, data.over);
+  } else {
+    commentaryGroup(data.ball.over, data.over);
+  }
+}
+
+function commentaryGroup(over, summary) {
+  // The over's group in the commentary, newest first, with its header
+  // updated when there's a summary to show
+  const commentary = document.getElementById("commentary");
+  let group = commentary.querySelector(`.over-group[data-over="${over}"]`);
+  if (!group) {
+    group = overGroup(over, summary);
+    commentary.insertBefore(group, commentary.firstChild);
+  } else if (summary) {
+    group.firstChild.replaceWith(overHeader(over, summary));
+  }
+  return group;
+}
+
+function addCommentary(ball, summary) {
+  const group = commentaryGroup(ball.over, summary);
+  // After any rows still waiting to sync, which are newer
+  let before = group.children[1] || null;
+  while (before && before.classList.contains("pending")) {
+    before = before.nextSibling;
+  }
+  group.insertBefore(commentaryRow(ball), before);
+}
+
+function overGroup(over, summary) {
+  const group = document.createElement("div");
+  group.className = "over-group";
+  group.dataset.over = over;
+  group.appendChild(overHeader(over, summary));
+  return group;
+}
+
+function overHeader(over, summary) {
+  const header = document.createElement("div");
+  header.className = "over-header";
+  header.textContent = `Over ${over + 1} `;
+  if (summary) {
+    const text = document.createElement("span");
+    text.className = "over-summary";
+    let line = `${summary.bowler} · ${summary.runs} run${summary.runs !== 1 ? "s" : ""}`;
+    if (summary.wickets) line += `, ${summary.wickets} wkt`;
+    if (summary.extras) line += `, ${summary.extras} extra${summary.extras !== 1 ? "s" : ""}`;
+    if (summary.maiden) line += " · MAIDEN";
+    text.textContent = line;
+    header.appendChild(text);
+  }
+  return header;
+}
+
+// Fetch the next page of older overs and append them below the ones shown
+function loadOlderOvers() {
+  const button = document.getElementById("older-overs");
+  const commentary = document.getElementById("commentary");
+  fetch(`${commentary.dataset.url}?before=${button.dataset.before}`)
+    .then((response) => response.json())
+    .then((data) => {
+      data.overs.forEach((over) => {
+        const group = overGroup(over.over, over.summary);
+        over.balls.forEach((ball) => group.appendChild(commentaryRow(ball)));
+        commentary.appendChild(group);
+      });
+      if (data.next === null) {
+        button.remove();
+      } else {
+        button.dataset.before = data.next;
+      }
+    });
+}
+
+function describeBall(ball) {
+  let text = `${ball.bowler} to ${ball.batsman} - `;
+  if (ball.runs >= 0) {
+    text += `${ball.runs} run${ball.runs !== 1 ? "s" : ""}`;
+  } else if (ball.runs === -1) {
+    text += "Wide";
+  } else if (ball.runs === -2) {
+    text += "No Ball";
+  }
+  if (ball.is_wicket) {
+    text += ` and is OUT (${ball.wicket_type})`;
+  }
+  return text;
+}
+
+function commentaryRow(ball) {
+  const row = document.createElement("div");
+  row.className = "ball-event";
+  const time = document.createElement("a");
+  time.className = "event-time";
+  time.href = `/edit_ball/${ball.index}`;
+  time.title = "Correct this ball";
+  time.textContent = `${ball.over}.${ball.ball}`;
+  const text = document.createElement("span");
+  text.className = "event-text";
+  text.textContent = describeBall(ball);
+  row.appendChild(time);
+  row.appendChild(text);
+  return row;
+}
+
+function resetBallForm(form) {
+  form.reset();
+  // The next ball gets a fresh idempotency key; retries of this one reuse it
+  form.elements.ball_key.value = newBallKey();
+  toggleExtraOptions();
+}
+
+function newBallKey() {
+  if (window.crypto && crypto.randomUUID) {
+    return crypto.randomUUID();
+  }
+  return `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+}
+
+// Read-only spectator scoreboard. Listens on the match's event stream and
+// falls back to long-polling where EventSource isn't available.
+function startLiveScoreboard(board) {
+  if (window.EventSource) {
+    const source = new EventSource(board.dataset.stream);
+    source.addEventListener("score", (event) => {
+      const state = JSON.parse(event.data);
+      renderLiveScoreboard(state);
+      // Nothing more is coming once there's a result
+      if (state.result) source.close();
+    });
+  } else {
+    pollLiveScoreboard(board.dataset.poll, 0);
+  }
+}
+
+function pollLiveScoreboard(url, since) {
+  fetch(`${url}?since=${since}`)
+    .then((response) => (response.status === 200 ? response.json() : null))
+    .then((data) => {
+      if (data) {
+        renderLiveScoreboard(data.state);
+        if (data.state.result) return;
+        since = data.seq;
+      }
+      pollLiveScoreboard(url, since);
+    })
+    .catch(() => setTimeout(() => pollLiveScoreboard(url, since), 3000));
+}
+
+function renderLiveScoreboard(state) {
+  document.getElementById("live-batting").textContent = state.batting_team || state.team1_name;
+  document.getElementById("live-bowling").textContent = state.bowling_team || state.team2_name;
+  if (state.innings === undefined) return;
+
+  document.getElementById("live-runs").textContent = state.runs;
+  document.getElementById("live-wickets").textContent = `/${state.wickets}`;
+  document.getElementById("live-overs").textContent = `(${state.overs} Overs)`;
+  document.getElementById("live-run-rate").textContent = state.run_rate;
+  const bowler = state.bowler;
+  document.getElementById("live-bowler").textContent = bowler
+    ? `${bowler.name} ${bowler.overs}-${bowler.maidens}-${bowler.runs}-${bowler.wickets}`
+    : "";
+
+  let status = state.free_hit ? "FREE HIT" : "";
+  if (state.result) {
+    status = state.result;
+  } else if (state.required !== undefined) {
+    status = `Need ${state.required} from ${state.balls_left} (DLS par ${state.par})`;
+  }
+  document.getElementById("live-status").textContent = status;
+
+  // Charts only change shape at the end of an over or on a wicket
+  const charts = document.getElementById("charts");
+  const chartKey = `${state.innings}-${state.overs.split(".")[0]}-${state.wickets}-${state.result || ""}`;
+  if (charts && charts.dataset.key !== chartKey) {
+    charts.dataset.key = chartKey;
+    loadCharts(charts);
+  }
+
+  const batsmen = document.getElementById("live-batsmen");
+  batsmen.textContent = "";
+  state.batsmen.forEach((batsman) => {
+    const box = document.createElement("div");
+    box.className = "batsman-stat-box" + (batsman.striker ? " active" : "");
+    const name = document.createElement("span");
+    name.className = "batsman-name";
+    name.textContent = batsman.name;
+    const score = document.createElement("span");
+    score.className = "batsman-score";
+    score.textContent = `${batsman.runs}(${batsman.balls})`;
+    box.appendChild(name);
+    box.appendChild(score);
+    batsmen.appendChild(box);
+  });
+
+  const recent = document.getElementById("live-recent");
+  recent.textContent = "";
+  state.recent
+    .slice()
+    .reverse()
+    .forEach((ball) => {
+      const row = document.createElement("div");
+      row.className = "ball-event";
+      const time = document.createElement("span");
+      time.className = "event-time";
+      time.textContent = `${ball.over}.${ball.ball}`;
+      const text = document.createElement("span");
+      text.className = "event-text";
+      text.textContent = describeBall(ball);
+      row.appendChild(time);
+      row.appendChild(text);
+      recent.appendChild(row);
+    });
+}
+
+const SVG_NS = "http://www.w3.org/2000/svg";
+const CHART_WIDTH = 320;
+const CHART_HEIGHT = 140;
+const INNINGS_COLOURS = ["#1e88e5", "#e53935"];
+
+function svgElement(tag, attributes) {
+  const element = document.createElementNS(SVG_NS, tag);
+  Object.entries(attributes).forEach(([name, value]) => element.setAttribute(name, value));
+  return element;
+}
+
+function loadCharts(container) {
+  fetch(container.dataset.charts)
+    .then((response) => response.json())
+    .then((data) => drawCharts(container, data))
+    .catch(() => {});
+}
+
+function drawCharts(container, data) {
+  container.textContent = "";
+  if (!data.innings.length) return;
+  const overs = Math.max(data.overs || 0, ...data.innings.map((innings) => innings.manhattan.length), 1);
+  container.appendChild(chartSection("Worm", wormChart(data.innings, overs)));
+  container.appendChild(chartSection("Manhattan", manhattanChart(data.innings, overs)));
+  data.innings.forEach((innings, i) => {
+    const section = document.createElement("div");
+    section.className = "chart-innings";
+    section.style.color = INNINGS_COLOURS[i];
+    const title = document.createElement("h4");
+    title.textContent = innings.team;
+    section.appendChild(title);
+    const fall = document.createElement("p");
+    fall.textContent =
+      "Fall of wickets: " +
+      (innings.fall_of_wickets.map(([wicket, score, over, name]) => `${score}-${wicket} (${name}, ${over})`).join(", ") ||
+        "none");
+    section.appendChild(fall);
+    const partnerships = document.createElement("p");
+    partnerships.textContent =
+      "Partnerships: " +
+      innings.partnerships.map(([first, second, runs, balls]) => `${first} & ${second} ${runs} (${balls})`).join(", ");
+    section.appendChild(partnerships);
+    container.appendChild(section);
+  });
+}
+
+function chartSection(title, svg) {
+  const section = document.createElement("div");
+  section.className = "chart";
+  const heading = document.createElement("h4");
+  heading.textContent = title;
+  section.appendChild(heading);
+  section.appendChild(svg);
+  return section;
+}
+
+function wormChart(innings, overs) {
+  // Score at the end of each over, one line per innings
+  const top = Math.max(...innings.map((entry) => entry.worm[entry.worm.length - 1] || 0), 1);
+  const svg = svgElement("svg", { viewBox: `0 0 ${CHART_WIDTH} ${CHART_HEIGHT}`, class: "chart-svg" });
+  innings.forEach((entry, i) => {
+    const points = [[0, 0], ...entry.worm.map((score, over) => [over + 1, score])]
+      .map(([over, score]) => `${(over / overs) * CHART_WIDTH},${CHART_HEIGHT - (score / top) * CHART_HEIGHT}`)
+      .join(" ");
+    svg.appendChild(svgElement("polyline", { points, fill: "none", stroke: INNINGS_COLOURS[i], "stroke-width": 2 }));
+  });
+  return svg;
+}
+
+function manhattanChart(innings, overs) {
+  // Runs per over side by side, with a dot for each over a wicket fell in
+  const top = Math.max(...innings.flatMap((entry) => entry.manhattan), 1);
+  const svg = svgElement("svg", { viewBox: `0 0 ${CHART_WIDTH} ${CHART_HEIGHT}`, class: "chart-svg" });
+  const slot = CHART_WIDTH / overs;
+  const width = slot / innings.length;
+  innings.forEach((entry, i) => {
+    entry.manhattan.forEach((runs, over) => {
+      const height = (runs / top) * (CHART_HEIGHT - 10);
+      const x = over * slot + i * width;
+      svg.appendChild(
+        svgElement("rect", { x, y: CHART_HEIGHT - height, width: width - 1, height, fill: INNINGS_COLOURS[i] })
+      );
+      if (entry.wickets[over]) {
+        svg.appendChild(
+          svgElement("circle", { cx: x + width / 2, cy: CHART_HEIGHT - height - 5, r: 3, fill: "#fdd835" })
+        );
+      }
+    });
+  });
+  return svg;
+}
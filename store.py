@@ -0,0 +1,280 @@
+# store.py
+# Server-side match state. The session cookie only carries the match id;
+# everything else lives in one of the backends below.
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+
+try:
+    import fcntl
+except ImportError:  # Windows: file locks are process-local only
+    fcntl = None
+
+
+class ConflictError(Exception):
+    # The match was saved by another request since this one loaded it
+    pass
+
+
+class MatchState(dict):
+    # A plain dict that remembers whether it was changed since it was loaded,
+    # so unchanged matches are not written back on every request. `changed`
+    # collects the keys set or removed until the journal takes them.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.modified = False
+        self.changed = set()
+
+    def __setitem__(self, key, value):
+        self.modified = True
+        self.changed.add(key)
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self.modified = True
+        self.changed.add(key)
+        super().__delitem__(key)
+
+    def clear(self):
+        self.modified = True
+        self.changed.update(self)
+        super().clear()
+
+    def pop(self, key, *args):
+        self.modified = True
+        self.changed.add(key)
+        return super().pop(key, *args)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self.modified = True
+            self.changed.add(key)
+        return super().setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        self.modified = True
+        other = dict(*args, **kwargs)
+        self.changed.update(other)
+        super().update(other)
+
+
+# Custom value types stored in a match (tag -> class). Each class provides
+# to_json() and a from_json() classmethod.
+_types = {}
+
+
+def register_type(tag, cls):
+    _types[tag] = cls
+    cls._store_tag = tag
+
+
+def _encode(value):
+    tag = getattr(type(value), '_store_tag', None)
+    if tag is None:
+        raise TypeError(f"Cannot store {type(value).__name__} in a match")
+    return {'__type__': tag, 'value': value.to_json()}
+
+
+def _decode(obj):
+    tag = obj.get('__type__')
+    if tag is not None and tag in _types:
+        return _types[tag].from_json(obj['value'])
+    return obj
+
+
+def dumps(state):
+    return json.dumps(state, separators=(',', ':'), default=_encode)
+
+
+def loads(data):
+    return MatchState(json.loads(data, object_hook=_decode))
+
+
+class MatchStore:
+    # save() takes the version the caller loaded. If the stored match has
+    # moved on since then it raises ConflictError instead of overwriting.
+    def new_id(self):
+        return uuid.uuid4().hex
+
+    def load(self, match_id):
+        raise NotImplementedError
+
+    def version(self, match_id):
+        # The stored match's version, or None if there isn't one
+        state = self.load(match_id)
+        return state.get('version', 0) if state is not None else None
+
+    def save(self, match_id, state, expected_version=None):
+        raise NotImplementedError
+
+    def delete(self, match_id):
+        raise NotImplementedError
+
+
+class MemoryStore(MatchStore):
+    # Matches serialized in a dict, so each request works on its own copy
+    # and the version check means the same here as in the other stores.
+    # Only suitable for a single process.
+    def __init__(self):
+        self._matches = {}
+        self._lock = threading.Lock()
+
+    def load(self, match_id):
+        with self._lock:
+            stored = self._matches.get(match_id)
+        return loads(stored[1]) if stored is not None else None
+
+    def version(self, match_id):
+        with self._lock:
+            stored = self._matches.get(match_id)
+        return stored[0] if stored is not None else None
+
+    def save(self, match_id, state, expected_version=None):
+        data = dumps(state)
+        with self._lock:
+            stored = self._matches.get(match_id)
+            if expected_version is not None and stored is not None and stored[0] != expected_version:
+                raise ConflictError(match_id)
+            self._matches[match_id] = (state.get('version', 0), data)
+        state.modified = False
+
+    def delete(self, match_id):
+        with self._lock:
+            self._matches.pop(match_id, None)
+
+
+class SQLiteStore(MatchStore):
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS matches ("
+                " id TEXT PRIMARY KEY,"
+                " data TEXT NOT NULL,"
+                " version INTEGER NOT NULL DEFAULT 0,"
+                " updated_at REAL NOT NULL)"
+            )
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(matches)")]
+            if 'version' not in columns:
+                conn.execute("ALTER TABLE matches ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+    def _connect(self):
+        # One connection per thread; sqlite3 connections can't be shared
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load(self, match_id):
+        row = self._connect().execute(
+            "SELECT data FROM matches WHERE id = ?", (match_id,)
+        ).fetchone()
+        return loads(row[0]) if row else None
+
+    def version(self, match_id):
+        row = self._connect().execute(
+            "SELECT version FROM matches WHERE id = ?", (match_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def save(self, match_id, state, expected_version=None):
+        data = dumps(state)
+        version = state.get('version', 0)
+        with self._connect() as conn:
+            if expected_version is None:
+                conn.execute(
+                    "INSERT OR REPLACE INTO matches (id, data, version, updated_at) VALUES (?, ?, ?, ?)",
+                    (match_id, data, version, time.time()),
+                )
+            else:
+                # Compare-and-swap on the version column
+                updated = conn.execute(
+                    "UPDATE matches SET data = ?, version = ?, updated_at = ? WHERE id = ? AND version = ?",
+                    (data, version, time.time(), match_id, expected_version),
+                ).rowcount
+                if not updated:
+                    try:
+                        conn.execute(
+                            "INSERT INTO matches (id, data, version, updated_at) VALUES (?, ?, ?, ?)",
+                            (match_id, data, version, time.time()),
+                        )
+                    except sqlite3.IntegrityError:
+                        raise ConflictError(match_id)
+        state.modified = False
+
+    def delete(self, match_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM matches WHERE id = ?", (match_id,))
+
+
+class FileStore(MatchStore):
+    # One JSON file per match
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, match_id):
+        # Match ids are generated by us, but never trust a cookie with a path
+        if not match_id.isalnum():
+            raise ValueError("invalid match id")
+        return os.path.join(self.directory, match_id + '.json')
+
+    def load(self, match_id):
+        try:
+            with open(self._path(match_id), encoding='utf-8') as f:
+                return loads(f.read())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save(self, match_id, state, expected_version=None):
+        path = self._path(match_id)
+        with open(path + '.lock', 'a') as lock:
+            # The lock file serializes writers across processes
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            if expected_version is not None:
+                stored = self.load(match_id)
+                if stored is not None and stored.get('version', 0) != expected_version:
+                    raise ConflictError(match_id)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(dumps(state))
+            # Atomic replace so readers never see a half-written match
+            os.replace(tmp, path)
+        state.modified = False
+
+    def delete(self, match_id):
+        try:
+            path = self._path(match_id)
+            os.remove(path)
+            os.remove(path + '.lock')
+        except (FileNotFoundError, ValueError):
+            pass
+
+
+class MatchLocks:
+    # Per-match locks for requests within one process. Striped over a fixed
+    # pool so memory stays bounded however many matches come and go.
+    def __init__(self, stripes=64):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def lock_for(self, match_id):
+        return self._locks[hash(match_id) % len(self._locks)]
+
+
+def create_store(kind, path=None):
+    if kind == 'memory':
+        return MemoryStore()
+    if kind == 'sqlite':
+        return SQLiteStore(path or 'matches.db')
+    if kind == 'filesystem':
+        return FileStore(path or 'matches')
+    raise ValueError(f"Unknown match store: {kind}")
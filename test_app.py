@@ -0,0 +1,243 @@
+# test_app.py
+# The scoring pages and APIs through the Flask test client, on a store and
+# archive of their own per test.
+import re
+import threading
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from app import create_app
+from store import ConflictError
+
+
+@pytest.fixture
+def app(tmp_path):
+    return create_app({
+        'TESTING': True,
+        'MATCH_STORE': 'sqlite',
+        'MATCH_STORE_PATH': str(tmp_path / 'matches.db'),
+        'ARCHIVE_PATH': str(tmp_path / 'archive.db'),
+        'MATCH_JOURNAL_PATH': str(tmp_path / 'journal'),
+        'TEMPLATE_CACHE': False,
+        'PRECOMPILE_TEMPLATES': False,
+    })
+
+
+def options(html, name):
+    found = re.search(r'<select name="%s"[^>]*>(.*?)</select>' % name, html, re.S)
+    return re.findall(r'<option value="([^"]*)"', found.group(1))
+
+
+def start_scoring(client, overs=2):
+    # A new match, up to its first delivery; returns the match id
+    players = [('team1_name', 'HOME'), ('team2_name', 'AWAY'), ('overs', str(overs))]
+    players += [('team1', f'H{i}') for i in range(4)] + [('team2', f'A{i}') for i in range(4)]
+    client.post('/add_players', data=MultiDict(players))
+    client.get('/perform_toss')
+    client.post('/toss_decision', data={'choice': 'bat'})
+    batsmen = options(client.get('/select_batsmen').get_data(as_text=True), 'striker')
+    client.post('/select_batsmen', data={'striker': batsmen[0], 'non_striker': batsmen[1]})
+    bowlers = options(client.get('/select_bowler').get_data(as_text=True), 'bowler')
+    client.post('/select_bowler', data={'bowler': bowlers[0]})
+    with client.session_transaction() as session:
+        return session['match_id']
+
+
+def bowl(client, deliveries):
+    # Each delivery through /api/ball, picking the next bowler whenever an
+    # over ends; returns where the last one left the scorer
+    step = None
+    for runs in deliveries:
+        step = client.post('/api/ball', json={'runs': runs}).get_json().get('next')
+        if step == '/select_bowler':
+            bowlers = options(client.get(step).get_data(as_text=True), 'bowler')
+            client.post(step, data={'bowler': bowlers[0]})
+            step = None
+    return step
+
+
+def start_second_innings(client):
+    client.get('/innings_end')
+    batsmen = options(client.get('/select_batsmen').get_data(as_text=True), 'striker')
+    client.post('/select_batsmen', data={'striker': batsmen[0], 'non_striker': batsmen[1]})
+    bowlers = options(client.get('/select_bowler').get_data(as_text=True), 'bowler')
+    client.post('/select_bowler', data={'bowler': bowlers[0]})
+
+
+def scorer_link(client):
+    return re.search(r'href="(/resume/[^"]+)"', client.get('/score').get_data(as_text=True)).group(1)
+
+
+def test_match_id_alone_doesnt_take_over_a_match(app):
+    scorer, other = app.test_client(), app.test_client()
+    match_id = start_scoring(scorer)
+    assert '/resume/' not in other.get('/').get_data(as_text=True)
+    assert other.get(f'/resume/{match_id}').status_code == 404
+    assert other.get(f'/resume/{match_id}/guess').status_code == 404
+    assert other.post('/api/ball', json={'runs': 1}).status_code == 404
+
+
+def test_scorer_link_carries_on_elsewhere(app):
+    scorer, other = app.test_client(), app.test_client()
+    start_scoring(scorer)
+    response = other.get(scorer_link(scorer))
+    assert response.status_code == 302
+    assert other.post('/api/ball', json={'runs': 1}).status_code == 200
+
+
+def test_spectating_unknown_matches_leaves_no_channels(app):
+    client = app.test_client()
+    for i in range(50):
+        assert client.get(f'/match/nomatch{i}/poll').status_code == 404
+        assert client.get(f'/match/nomatch{i}/live').status_code == 404
+    assert app.extensions['live_hub']._channels == {}
+
+
+def test_channel_goes_with_its_last_spectator(app):
+    scorer, spectator = app.test_client(), app.test_client()
+    match_id = start_scoring(scorer)
+    hub = app.extensions['live_hub']
+
+    stream = spectator.get(f'/match/{match_id}/live', buffered=False)
+    frames = iter(stream.response)
+    next(frames)
+    assert b'"runs":0' in next(frames)
+    scorer.post('/api/ball', json={'runs': 4})
+    assert b'"runs":4' in next(frames)
+    assert hub.get(match_id) is not None
+    stream.close()
+    assert hub.get(match_id) is None
+
+    polled = spectator.get(f'/match/{match_id}/poll?since=0').get_json()
+    assert polled['state']['runs'] == 4
+    assert hub.get(match_id) is None
+    # Nothing to publish to, and nothing made for it
+    scorer.post('/api/ball', json={'runs': 1})
+    assert hub.get(match_id) is None
+
+
+def test_result_lost_to_a_conflicting_save_is_not_archived(app):
+    client = app.test_client()
+    match_id = start_scoring(client, overs=1)
+    bowl(client, [1] * 6)
+    start_second_innings(client)
+    assert bowl(client, [0] * 6) == '/innings_end'
+
+    # Another worker saves the match between this request's load and save
+    store = app.extensions['match_store']
+
+    def save(match_id, state, expected_version=None):
+        raise ConflictError(match_id)
+
+    store.save = save
+    assert client.get('/innings_end').status_code == 302
+    assert app.extensions['match_archive'].get(match_id) is None
+    del store.save
+    assert client.get('/innings_end').status_code == 200
+    archived = app.extensions['match_archive'].get(match_id)
+    assert archived['winner'] == archived['batting_first']
+
+
+def recorded_balls(app, match_id):
+    return len(app.extensions['match_store'].load(match_id)['engine'].log)
+
+
+def test_retried_ball_is_recorded_once(app):
+    client = app.test_client()
+    match_id = start_scoring(client)
+    for _ in range(2):
+        response = client.post('/api/ball', json={'runs': 4}, headers={'Idempotency-Key': 'k1'})
+        assert response.status_code == 200
+        assert response.get_json()['score']['runs'] == 4
+    for _ in range(2):
+        client.post('/score', data={'runs': '1', 'ball_key': 'k2'})
+    assert recorded_balls(app, match_id) == 2
+
+
+def test_retried_batch_is_recorded_once(app):
+    client = app.test_client()
+    match_id = start_scoring(client)
+    batch = {"innings": 1, "balls": [{"key": f"b{i}", "seq": i, "runs": 1} for i in range(3)]}
+    first = client.post('/api/balls', json=batch).get_json()
+    again = client.post('/api/balls', json=batch).get_json()
+    assert first['applied'] == again['applied'] == ['b0', 'b1', 'b2']
+    assert again['recorded'] == []
+    assert recorded_balls(app, match_id) == 3
+
+    # A ball that doesn't follow on from the server's is refused
+    late = {"innings": 1, "balls": [{"key": "b9", "seq": 1, "runs": 6}]}
+    response = client.post('/api/balls', json=late)
+    assert response.status_code == 409
+    assert response.get_json()['applied'] == []
+    assert recorded_balls(app, match_id) == 3
+
+
+@pytest.mark.parametrize("body", [[1, 2], {"runs": "4"}, {"runs": 1, "wicket_type": "Sneezed"},
+                                  {"runs": -1, "wicket_type": "Bowled"}])
+def test_malformed_ball_is_a_400(app, body):
+    client = app.test_client()
+    match_id = start_scoring(client)
+    assert client.post('/api/ball', json=body).status_code == 400
+    ball = dict(body, key="k1", seq=0) if isinstance(body, dict) else body
+    assert client.post('/api/balls', json={"innings": 1, "balls": [ball]}).status_code == 400
+    assert recorded_balls(app, match_id) == 0
+
+
+def test_scorers_at_once_on_one_match(app):
+    # Requests on one match take turns, so none is lost
+    clients = [app.test_client() for _ in range(3)]
+    start_scoring(clients[0])
+    link = scorer_link(clients[0])
+    for client in clients[1:]:
+        client.get(link)
+    with clients[0].session_transaction() as session:
+        match_id = session['match_id']
+
+    def score(client, n):
+        for i in range(2):
+            assert client.post('/api/ball', json={'runs': 0}, headers={'Idempotency-Key': f'{n}-{i}'}).status_code == 200
+
+    threads = [threading.Thread(target=score, args=(client, n)) for n, client in enumerate(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert recorded_balls(app, match_id) == 6
+
+
+def test_save_that_loses_to_another_worker_is_a_409(app):
+    # Two worker processes on one store: a ball saved by the other between
+    # this worker loading the match and saving it
+    other = create_app(app.config)
+    client = app.test_client()
+    match_id = start_scoring(client)
+    elsewhere = other.test_client()
+    elsewhere.get(scorer_link(client))
+    store = app.extensions['match_store']
+
+    def save(match_id, state, expected_version=None):
+        del store.save
+        assert elsewhere.post('/api/ball', json={'runs': 6}).status_code == 200
+        store.save(match_id, state, expected_version)
+
+    store.save = save
+    response = client.post('/api/ball', json={'runs': 4})
+    assert response.status_code == 409
+    engine = app.extensions['match_store'].load(match_id)['engine']
+    assert (len(engine.log), engine.total_runs) == (1, 6)
+    # The scorer reloads and carries on from the other worker's ball
+    assert client.post('/api/ball', json={'runs': 4}).get_json()['score']['runs'] == 10
+
+
+def test_unchanged_views_are_304(app):
+    client = app.test_client()
+    match_id = start_scoring(client)
+    for path in ('/score', '/commentary', f'/match/{match_id}/charts'):
+        etag = client.get(path).headers['ETag']
+        assert client.get(path, headers={'If-None-Match': etag}).status_code == 304
+    etag = client.get('/score').headers['ETag']
+    client.post('/api/ball', json={'runs': 1})
+    response = client.get('/score', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
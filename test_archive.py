@@ -0,0 +1,93 @@
+# test_archive.py
+# Career totals as matches are archived, worked out by hand from two
+# scorecards.
+import pytest
+
+from archive import MatchArchive
+
+# Two players called Sam on one side
+TEAM1 = [('a1', 'Sam'), ('a2', 'Sam'), ('a3', 'Lee')]
+TEAM2 = [('b1', 'Kim'), ('b2', 'Max')]
+
+
+@pytest.fixture
+def archive(tmp_path):
+    return MatchArchive(str(tmp_path / 'archive.db'))
+
+
+def bat(player, runs, balls, fours=0, sixes=0, out=False):
+    return {'id': player[0], 'name': player[1], 'runs': runs, 'balls': balls, 'fours': fours, 'sixes': sixes,
+            'out': out, 'wicket_type': 'Bowled' if out else None}
+
+
+def bowl(player, overs, balls, runs, maidens, wickets):
+    return {'id': player[0], 'name': player[1], 'overs': overs, 'balls': balls, 'runs': runs,
+            'maidens': maidens, 'wickets': wickets, 'economy': 0}
+
+
+def finished_match(first_batting, first_bowling, second_batting, second_bowling):
+    # team1 bats first and wins; only the scorecards matter here
+    return {
+        'team1_name': 'A', 'team2_name': 'B', 'overs': 5, 'toss_winner': 'A', 'batting_first': 'A',
+        'team1': [name for _, name in TEAM1], 'team1_ids': [i for i, _ in TEAM1],
+        'team2': [name for _, name in TEAM2], 'team2_ids': [i for i, _ in TEAM2],
+        'first_innings_total': sum(b['runs'] for b in first_batting), 'first_innings_wickets': 1,
+        'first_innings_overs': '5.0', 'first_innings_batsmen': first_batting,
+        'first_innings_bowlers': first_bowling,
+        'second_innings_total': sum(b['runs'] for b in second_batting), 'second_innings_wickets': 2,
+        'second_innings_overs': '5.0', 'second_innings_batsmen': second_batting,
+        'second_innings_bowlers': second_bowling,
+        'winner': 'A', 'win_type': 'runs', 'win_margin': '1 runs',
+    }
+
+
+def test_careers_add_up_over_matches(archive):
+    sam, other_sam, lee, kim, max_ = TEAM1 + TEAM2
+    assert archive.record('m1', finished_match(
+        [bat(sam, 30, 20, fours=3, sixes=1, out=True), bat(other_sam, 10, 8)],
+        [bowl(kim, 2, 0, 15, 0, 1), bowl(max_, 1, 2, 25, 0, 0)],
+        [bat(kim, 15, 12, out=True), bat(max_, 5, 6, out=True)],
+        [bowl(lee, 3, 0, 20, 1, 2)],
+    ))
+    archive.record('m2', finished_match(
+        [bat(sam, 50, 30, fours=6, sixes=2)],
+        [bowl(kim, 3, 0, 40, 0, 0)],
+        [bat(kim, 24, 18, fours=2, out=True)],
+        [bowl(lee, 2, 0, 18, 0, 2), bowl(other_sam, 1, 0, 6, 1, 0)],
+    ))
+
+    batting = archive.player('a1')['batting']
+    assert [batting[key] for key in ('matches', 'innings', 'runs', 'balls', 'fours', 'sixes', 'outs', 'highest')] \
+        == [2, 2, 80, 50, 9, 3, 1, 50]
+    assert (batting['average'], batting['strike_rate']) == (80.0, 160.0)
+
+    # Same name, different player
+    other = archive.player('a2')
+    assert [other['batting'][key] for key in ('matches', 'innings', 'runs', 'outs', 'highest')] == [2, 1, 10, 0, 10]
+    assert other['batting']['average'] is None
+    assert other['bowling']['best'] == '0/6'
+
+    # In both squads twice, batted in one match
+    lee = archive.player('a3')
+    assert [lee['batting'][key] for key in ('matches', 'innings', 'runs')] == [2, 0, 0]
+    bowling = lee['bowling']
+    assert [bowling[key] for key in ('innings', 'overs', 'runs', 'maidens', 'wickets')] == [2, '5.0', 38, 1, 4]
+    # Two wickets each time; the cheaper is the best
+    assert bowling['best'] == '2/18'
+    assert (bowling['economy'], bowling['average']) == (7.6, 9.5)
+
+    kim = archive.player('b1')
+    assert (kim['batting']['runs'], kim['batting']['highest'], kim['batting']['outs']) == (39, 24, 2)
+    assert (kim['bowling']['overs'], kim['bowling']['best']) == ('5.0', '1/15')
+    assert archive.player('b2')['bowling']['overs'] == '1.2'
+    assert archive.player('Sam') is None
+
+
+def test_archiving_a_match_again_adds_nothing(archive):
+    match = finished_match([bat(TEAM1[0], 30, 20, out=True)], [bowl(TEAM2[0], 5, 0, 30, 0, 1)],
+                           [bat(TEAM2[0], 29, 30)], [bowl(TEAM1[2], 5, 0, 29, 0, 0)])
+    assert archive.record('m1', match) is not None
+    assert archive.record('m1', match) is None
+    assert [archive.player('a1')['batting'][key] for key in ('matches', 'innings', 'runs')] == [1, 1, 30]
+    assert archive.player('b1')['bowling']['wickets'] == 1
+    assert archive.leaders('batting', 'runs')[0]['player_id'] == 'a1'
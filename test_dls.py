@@ -0,0 +1,109 @@
+# test_dls.py
+# Resources, revised targets and par scores for matches cut short by rain,
+# and that a rain-shortened match keeps its result through export and
+# replay.
+import json
+
+import pytest
+
+import dls
+from engine import MatchEngine
+from replay import read_json, replay_match
+from test_app import app, bowl, start_scoring, start_second_innings  # noqa: F401
+from test_engine import OPENER, PARTNER, BOWLERS, new_innings, score
+
+
+def chase(first_runs=150, overs=20):
+    # The start of a second innings after `first_runs` off a full innings
+    engine = MatchEngine(overs, 11)
+    engine.start_innings(2, 11, first_innings=(first_runs, float(dls.resources(overs * 6, 0))))
+    engine.set_openers(OPENER, PARTNER)
+    engine.set_bowler(BOWLERS[0])
+    return engine
+
+
+def test_resources_follow_the_standard_table():
+    assert dls.resources(300, 0) == pytest.approx(100)
+    assert dls.resources(120, 0) == pytest.approx(56.6, abs=0.5)
+    assert dls.resources(0, 3) == 0
+    # A side of six losing its fifth wicket is all out
+    assert dls.resources(60, 5, squad_size=6) == 0
+
+
+def test_unchanged_match_keeps_the_usual_target():
+    full = float(dls.resources(120, 0))
+    assert dls.revised_target(150, full, full) == 151
+    assert chase().target == 151
+
+
+def test_par_scales_with_resources_used():
+    assert dls.par(150, 60.0, 30.0) == pytest.approx(75)
+    # More resources than the side batting first: G50 per 100% extra
+    assert dls.par(100, 50.0, 60.0) == pytest.approx(100 + dls.G50 * 10 / 100)
+
+
+def test_reduce_overs_at_the_start_of_a_chase():
+    engine = chase()
+    engine.reduce_overs(10)
+    first, second = float(dls.resources(120, 0)), float(dls.resources(60, 0))
+    assert engine.overs == 10
+    assert engine.resources == pytest.approx(second)
+    assert engine.target == int(150 * second / first) + 1
+
+
+def test_reduce_overs_part_way_through_counts_wickets_lost():
+    engine = chase()
+    score(engine, [1, 0, 0, 2, 0, 0] * 4 + [(0, 'Bowled')])
+    engine.add_batsman({"id": 3, "name": "C"})
+    before = engine.resources
+    engine.reduce_overs(10)
+    lost = float(dls.resources(120 - 25, 1) - dls.resources(60 - 25, 1))
+    assert engine.resources == pytest.approx(before - lost)
+    assert engine.target == dls.revised_target(150, float(dls.resources(120, 0)), engine.resources)
+    left = dls.resources(60 - 25, 1)
+    assert engine.par_score == int(dls.par(150, float(dls.resources(120, 0)), engine.resources - left))
+
+
+def test_par_score_on_an_unchanged_chase():
+    engine = chase()
+    score(engine, [4, 0, 1, 0, 0, 6])
+    used = float(dls.resources(120, 0) - dls.resources(114, 0))
+    assert engine.par_score == int(150 * used / float(dls.resources(120, 0)))
+
+
+def test_reduce_overs_to_those_bowled_ends_the_innings():
+    engine = new_innings(5)
+    score(engine, [1, 0, 2, 0, 0, 4] * 2)
+    engine.reduce_overs(2)
+    assert engine.innings_complete
+    assert engine.innings_summary()['max_overs'] == 2
+    assert engine.innings_summary()['reductions'] == [[12, 2]]
+
+
+@pytest.mark.parametrize("overs", [0, 5, 6, 1])
+def test_reduce_overs_rejects_impossible_limits(overs):
+    engine = new_innings(5)
+    score(engine, [1, 0, 2, 0, 0, 4, 1])
+    with pytest.raises(ValueError):
+        engine.reduce_overs(overs)
+
+
+def test_rain_shortened_match_keeps_its_result_through_export_and_replay(app):
+    client = app.test_client()
+    match_id = start_scoring(client, overs=4)
+    assert bowl(client, [1] * 24) == '/innings_end'
+    start_second_innings(client)
+    bowl(client, [1] * 6)
+    client.post('/reduce_overs', data={'overs': 2})
+    assert bowl(client, [0] * 6) == '/innings_end'
+    client.get('/innings_end')
+
+    archived = app.extensions['match_archive'].get(match_id)
+    assert archived['second_innings_reductions'] == [[6, 2]]
+    assert archived['win_margin'].endswith('(DLS)')
+    exported = client.get(f'/archive/matches/{match_id}/export?format=json').get_data(as_text=True)
+    assert json.loads(exported)['target'] == archived['target']
+
+    replayed = replay_match(read_json(exported), squad=4)
+    assert replayed['target'] == archived['target']
+    assert (replayed['winner'], replayed['win_margin']) == (archived['winner'], archived['win_margin'])
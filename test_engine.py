@@ -0,0 +1,123 @@
+# test_engine.py
+# Undo and corrections: whatever they're asked to do, the innings either
+# comes out as if the deliveries had been scored that way or is left alone.
+import pytest
+
+from balllog import BallLog
+from engine import MatchEngine, CHECKPOINTS_KEPT, WIDE, NO_BALL
+
+OPENER = {"id": 1, "name": "A"}
+PARTNER = {"id": 2, "name": "B"}
+BOWLERS = [{"id": 20, "name": "X"}, {"id": 21, "name": "Y"}]
+
+
+def new_innings(overs=5):
+    engine = MatchEngine(overs, 11)
+    engine.set_openers(OPENER, PARTNER)
+    engine.set_bowler(BOWLERS[0])
+    return engine
+
+
+def score(engine, deliveries):
+    for delivery in deliveries:
+        if engine.next_step() == 'select_bowler':
+            engine.set_bowler(BOWLERS[engine.current_over % 2])
+        if not isinstance(delivery, tuple):
+            delivery = (delivery,)
+        engine.apply(*delivery)
+
+
+def state(engine):
+    return engine.snapshot(), engine.events, [ball.to_dict() for ball in engine.log], len(engine.checkpoints)
+
+
+def test_undo_matches_never_scoring_the_ball():
+    engine, expected = new_innings(), new_innings()
+    score(engine, [1, 4, 0, 2, 6])
+    score(expected, [1, 4, 0, 2])
+    engine.undo()
+    assert state(engine) == state(expected)
+
+
+def test_undo_back_over_an_over_and_a_wicket():
+    engine, expected = new_innings(), new_innings()
+    score(engine, [1, 0, 0, 0, 0, 0, (0, 'Bowled')])
+    score(expected, [1, 0, 0, 0, 0, 0])
+    # The next bowler was picked before the wicket, so stays picked
+    expected.set_bowler(BOWLERS[1])
+    engine.undo()
+    assert state(engine) == state(expected)
+    assert engine.next_step() == 'score'
+
+
+def test_edit_matches_scoring_it_that_way():
+    engine, expected = new_innings(), new_innings()
+    score(engine, [1, 4, 0, 2, 6, 1, 3, WIDE, 2])
+    score(expected, [1, 4, 0, 2, 6, 1, 3, NO_BALL, 2])
+    engine.edit(7, NO_BALL)
+    assert state(engine) == state(expected)
+
+
+def test_edit_older_than_the_checkpoints_kept():
+    engine, expected = new_innings(20), new_innings(20)
+    deliveries = [1, 0, 4, 2, 0, 6] * 12
+    score(engine, deliveries)
+    score(expected, [3] + deliveries[1:])
+    engine.edit(0, 3)
+    assert state(engine) == state(expected)
+    assert len(engine.checkpoints) == CHECKPOINTS_KEPT + 1
+
+
+@pytest.mark.parametrize("ball, delivery", [
+    (0, (1, 'Nope')),
+    (0, (WIDE, 'Bowled')),
+    (0, (9,)),
+    (6, (1, "Run Out", 99)),
+    # A wicket that leaves later deliveries without a batsman to face them
+    (0, (0, 'Caught')),
+])
+def test_rejected_edit_leaves_the_innings_alone(ball, delivery):
+    engine = new_innings()
+    score(engine, [1, 0, 2, 0, 0, 4, 1, 1])
+    engine.mark()
+    before = state(engine)
+    with pytest.raises(ValueError):
+        engine.edit(ball, *delivery)
+    assert state(engine) == before
+    assert engine.events_since_mark() == []
+    score(engine, [2])
+    assert engine.total_runs == 11
+
+
+def test_bowler_changed_part_way_through_an_over():
+    engine = new_innings()
+    score(engine, [0, 0, 0])
+    engine.set_bowler(BOWLERS[1])
+    score(engine, [0, 0, 0])
+    figures = {bowler['name']: bowler for bowler in engine.innings_summary()['bowlers']}
+    assert (figures['X']['overs'], figures['X']['balls'], figures['X']['maidens']) == (0, 3, 0)
+    assert (figures['Y']['overs'], figures['Y']['balls'], figures['Y']['maidens']) == (0, 3, 0)
+    assert engine.over_summary(0)['bowler'] == 'X/Y'
+    assert engine.over_summary(0)['maiden']
+
+
+@pytest.mark.parametrize("deliveries", [
+    # The over is done and no bowler has been picked for the next
+    [0, 0, 0, 0, 0, 0],
+    # A wicket, and no new batsman yet
+    [(0, 'Bowled')],
+])
+def test_no_delivery_until_the_selection_is_made(deliveries):
+    engine = new_innings()
+    score(engine, deliveries)
+    before = state(engine)
+    with pytest.raises(ValueError):
+        engine.apply(4)
+    assert state(engine) == before
+
+
+def test_ball_log_needs_both_players():
+    log = BallLog()
+    with pytest.raises(ValueError):
+        log.append(0, 1, "A", None, 0)
+    assert len(log) == 0
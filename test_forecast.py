@@ -0,0 +1,59 @@
+# test_forecast.py
+# The Monte Carlo forecast, with the seeds it picks for itself: results in
+# range, certain outcomes certain, and each play-out following the rules.
+import numpy as np
+import pytest
+
+import forecast
+from forecast import MAX_DRAWS, MIN_SIMULATIONS, SIMULATIONS, simulate, simulations
+
+
+def test_simulations_are_capped_by_balls():
+    assert simulations(0) == simulations(1) == SIMULATIONS
+    assert simulations(50) == MAX_DRAWS // 50
+    assert simulations(300) == MIN_SIMULATIONS
+
+
+def test_each_play_out_stops_at_the_last_wicket():
+    draws = np.random.default_rng(7).integers(0, len(forecast._RUNS), size=(200, 30), dtype=np.int16)
+    expected = []
+    for row in draws:
+        runs = wickets = 0
+        for draw in row:
+            if wickets == 2:
+                break
+            runs += int(forecast._RUNS[draw])
+            wickets += int(forecast._WICKET[draw])
+        expected.append(runs)
+    assert simulate(np.random.default_rng(7), 30, 2, 200).tolist() == expected
+
+
+def test_nothing_left_to_play():
+    rng = np.random.default_rng(1)
+    assert not simulate(rng, 0, 5, 10).any()
+    assert not simulate(rng, 60, 0, 10).any()
+
+
+@pytest.mark.parametrize("runs, wickets, balls, target", [
+    (0, 11, 120, None), (87, 4, 40, None), (0, 11, 120, 160), (120, 3, 30, 151), (150, 1, 5, 151),
+])
+def test_forecast_is_a_distribution(runs, wickets, balls, target):
+    result = forecast.forecast.__wrapped__(runs, wickets, balls, target, 11, 120)
+    assert result == forecast.forecast.__wrapped__(runs, wickets, balls, target, 11, 120)
+    assert result['batting'] + result['bowling'] + result['tie'] == pytest.approx(100, abs=0.2)
+    assert 0 <= min(result['batting'], result['bowling'], result['tie'])
+    assert runs <= result['low'] <= result['projected'] <= result['high'] <= runs + 7 * balls
+    if target is not None:
+        assert result['high'] <= target
+
+
+@pytest.mark.parametrize("runs, expected", [(10, 'bowling'), (11, 'tie')])
+def test_no_balls_left_is_decided(runs, expected):
+    result = forecast.forecast.__wrapped__(runs, 5, 0, 12, 11, 120)
+    assert result[expected] == 100
+    assert result['projected'] == runs
+
+
+def test_one_to_win_with_everything_in_hand():
+    result = forecast.forecast.__wrapped__(150, 10, 60, 151, 11, 120)
+    assert result['batting'] > 99
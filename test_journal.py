@@ -0,0 +1,102 @@
+# test_journal.py
+# Whatever the journal holds for a match loads back as the match last saved:
+# across snapshots and deltas, torn writes, compaction and a restart.
+import os
+
+import pytest
+
+from journal import MatchJournal, JournaledStore
+from store import MatchState, MemoryStore, dumps
+from test_engine import new_innings, score
+
+MATCH_ID = 'a1b2c3'
+
+
+def save(store, state):
+    version = state.get('version', 0)
+    state['version'] = version + 1
+    store.save(MATCH_ID, state, expected_version=version)
+
+
+def scored_match(store, deliveries):
+    # A match saved after every ball, as the scoring pages save it
+    state = MatchState(team1_name='HOME', team2_name='AWAY', engine=new_innings(20))
+    save(store, state)
+    for runs in deliveries:
+        score(state['engine'], [runs])
+        save(store, state)
+    return state
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return MatchJournal(str(tmp_path), snapshot_every=5)
+
+
+def wal(journal):
+    with open(os.path.join(journal.directory, MATCH_ID + '.wal')) as f:
+        return f.read().splitlines()
+
+
+def test_load_replays_deltas_onto_the_newest_snapshot(journal):
+    state = scored_match(JournaledStore(MemoryStore(), journal), [1, 4, 0, 2, 6, 1, 0, 0, 3, 1, 2, 0, 4])
+    lines = wal(journal)
+    assert sum('"state":' in line for line in lines) == 3
+    assert len(lines) == 14
+    assert dumps(MatchJournal(journal.directory).load(MATCH_ID)) == dumps(state)
+
+
+def test_torn_record_is_skipped_and_later_saves_still_load(journal):
+    store = JournaledStore(MemoryStore(), journal)
+    state = scored_match(store, [1, 4, 0, 2])
+    # A crash part way through writing the next record
+    with open(os.path.join(journal.directory, MATCH_ID + '.wal'), 'a') as f:
+        f.write(wal(journal)[-1][:30])
+    assert dumps(MatchJournal(journal.directory).load(MATCH_ID)) == dumps(state)
+
+    score(state['engine'], [6])
+    save(store, state)
+    assert dumps(MatchJournal(journal.directory).load(MATCH_ID)) == dumps(state)
+
+
+def test_compaction_starts_the_file_again_from_a_snapshot(tmp_path):
+    journal = MatchJournal(str(tmp_path), snapshot_every=5, compact_size=2048)
+    state = scored_match(JournaledStore(MemoryStore(), journal), [1, 0, 2, 0, 4, 1] * 6)
+    lines = wal(journal)
+    assert '"state":' in lines[0]
+    assert sum('"state":' in line for line in lines) <= 2
+    # One record per save (37) without it
+    assert len(lines) < 20
+    assert dumps(MatchJournal(journal.directory).load(MATCH_ID)) == dumps(state)
+
+
+def test_recover_puts_back_what_the_store_lost(journal):
+    state = scored_match(JournaledStore(MemoryStore(), journal), [1, 4, 0, 2, 6, 1, 3])
+    # A restart with an in-memory store
+    store = JournaledStore(MemoryStore(), MatchJournal(journal.directory))
+    assert store.recover() == 1
+    assert dumps(store.load(MATCH_ID)) == dumps(state)
+
+
+def test_finished_match_is_not_recovered(journal):
+    store = JournaledStore(MemoryStore(), journal)
+    state = scored_match(store, [1, 4])
+    state['winner'] = 'HOME'
+    save(store, state)
+    store = JournaledStore(MemoryStore(), MatchJournal(journal.directory))
+    assert store.recover() == 0
+    assert os.listdir(journal.directory) == []
+
+
+def test_abandoned_match_expires(journal):
+    scored_match(JournaledStore(MemoryStore(), journal), [1, 4])
+    path = os.path.join(journal.directory, MATCH_ID + '.wal')
+    day_ago = os.path.getmtime(path) - 24 * 60 * 60
+    os.utime(path, (day_ago, day_ago))
+
+    store = JournaledStore(MemoryStore(), MatchJournal(journal.directory, max_age=48 * 60 * 60))
+    assert store.recover() == 1
+    store = JournaledStore(MemoryStore(), MatchJournal(journal.directory, max_age=12 * 60 * 60))
+    assert store.recover() == 0
+    assert store.load(MATCH_ID) is None
+    assert os.listdir(journal.directory) == []
@@ -0,0 +1,53 @@
+# test_store.py
+# Every backend behaves the same way: a loaded match is the caller's own
+# copy, and saving over a newer version is a ConflictError.
+import pytest
+
+from store import ConflictError, MatchState, create_store
+from test_engine import new_innings, score
+
+MATCH_ID = 'a1b2c3'
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'filesystem'])
+def store(request, tmp_path):
+    path = {'memory': None, 'sqlite': str(tmp_path / 'matches.db'), 'filesystem': str(tmp_path / 'matches')}
+    return create_store(request.param, path[request.param])
+
+
+def saved_match(store):
+    state = MatchState(team1_name='HOME', team2_name='AWAY', engine=new_innings(), version=1)
+    store.save(MATCH_ID, state)
+    return state
+
+
+def test_loaded_match_is_a_copy(store):
+    saved_match(store)
+    first = store.load(MATCH_ID)
+    score(first['engine'], [4])
+    first['version'] = 2
+    assert store.load(MATCH_ID)['engine'].total_runs == 0
+    assert store.version(MATCH_ID) == 1
+
+
+def test_save_over_a_newer_version_conflicts(store):
+    saved_match(store)
+    first, second = store.load(MATCH_ID), store.load(MATCH_ID)
+    score(first['engine'], [4])
+    first['version'] = 2
+    store.save(MATCH_ID, first, expected_version=1)
+
+    score(second['engine'], [6])
+    second['version'] = 2
+    with pytest.raises(ConflictError):
+        store.save(MATCH_ID, second, expected_version=1)
+    stored = store.load(MATCH_ID)
+    assert (stored['version'], stored['engine'].total_runs) == (2, 4)
+
+
+def test_first_save_of_a_new_match(store):
+    state = MatchState(team1_name='HOME', version=1)
+    store.save(MATCH_ID, state, expected_version=0)
+    assert store.version(MATCH_ID) == 1
+    assert store.version('d4e5f6') is None
+    assert store.load('d4e5f6') is None
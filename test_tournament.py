@@ -0,0 +1,87 @@
+# test_tournament.py
+# Points table and net run rate, worked out by hand for a few results.
+import pytest
+
+from tournament import TournamentStore, KNOCKOUT, ROUND_ROBIN
+
+SQUADS = {team: [{"id": team + str(i), "name": team + str(i)} for i in range(11)] for team in ('A', 'B')}
+
+
+@pytest.fixture
+def tournaments(tmp_path):
+    return TournamentStore(str(tmp_path / 'archive.db'))
+
+
+def finished_match(first, second, winner, margin, win_type, max_overs=(20, 20)):
+    # first and second are (team, runs, wickets, overs)
+    match = {
+        'team1_name': 'A', 'team2_name': 'B', 'team1': SQUADS['A'], 'team2': SQUADS['B'],
+        'batting_first': first[0], 'winner': winner, 'win_margin': margin, 'win_type': win_type,
+    }
+    for prefix, (_, runs, wickets, overs), limit in zip(('first', 'second'), (first, second), max_overs):
+        match.update({prefix + '_innings_total': runs, prefix + '_innings_wickets': wickets,
+                      prefix + '_innings_overs': overs, prefix + '_innings_max_overs': limit})
+    return match
+
+
+def play(tournaments, match):
+    tournament_id = tournaments.create("Cup", ROUND_ROBIN, 20, list(SQUADS.items()))
+    fixture = tournaments.fixtures(tournament_id)[0]
+    tournaments.start_fixture(fixture['id'], 'm1')
+    assert tournaments.complete_fixture(fixture['id'], match)
+    return {row['team']: row for row in tournaments.standings(tournament_id)}
+
+
+def test_all_out_in_a_rain_shortened_chase_is_charged_the_revised_overs(tournaments):
+    # A 120 off 20 overs; B, set a DLS target for 10 overs, all out for 50 in 8
+    table = play(tournaments, finished_match(('A', 120, 3, '20.0'), ('B', 50, 11, '8.0'),
+                                             'A', '62 runs (DLS)', 'runs', max_overs=(20, 10)))
+    assert (table['B']['runs_for'], table['B']['balls_for']) == (50, 60)
+    assert table['A']['nrr'] == pytest.approx(120 / 20 - 50 / 10)
+    assert table['B']['nrr'] == pytest.approx(50 / 10 - 120 / 20)
+
+
+def test_win_is_two_points_and_net_run_rate_counts_balls_faced(tournaments):
+    # A 140/7 off 20 overs; B get there at 141/4 in 17.3 overs (105 balls)
+    table = play(tournaments, finished_match(('A', 140, 7, '20.0'), ('B', 141, 4, '17.3'),
+                                             'B', '7 wickets', 'wickets'))
+    assert [table['B'][key] for key in ('played', 'won', 'lost', 'points')] == [1, 1, 0, 2]
+    assert [table['A'][key] for key in ('played', 'won', 'lost', 'points')] == [1, 0, 1, 0]
+    assert (table['B']['runs_for'], table['B']['balls_for'], table['B']['balls_against']) == (141, 105, 120)
+    # 141 * 6 / 105 - 140 / 20 = 8.0571 - 7 = 1.057
+    assert table['B']['nrr'] == 1.057
+    assert table['A']['nrr'] == -1.057
+
+
+def test_all_out_is_charged_the_full_quota(tournaments):
+    # B bowled out for 100 in 15.2 overs counts as 100 off 20
+    table = play(tournaments, finished_match(('A', 140, 7, '20.0'), ('B', 100, 11, '15.2'),
+                                             'A', '40 runs', 'runs'))
+    assert table['B']['balls_for'] == table['A']['balls_against'] == 120
+    assert table['A']['nrr'] == 2.0
+    assert table['B']['nrr'] == -2.0
+
+
+def test_tie_is_a_point_each(tournaments):
+    table = play(tournaments, finished_match(('A', 150, 6, '20.0'), ('B', 150, 8, '20.0'),
+                                             None, None, 'tie'))
+    for team in ('A', 'B'):
+        assert [table[team][key] for key in ('won', 'lost', 'tied', 'points', 'nrr')] == [0, 0, 1, 1, 0]
+
+
+def test_league_winner_is_the_top_of_the_table(tournaments):
+    play(tournaments, finished_match(('A', 120, 9, '20.0'), ('B', 121, 2, '12.0'), 'B', '9 wickets', 'wickets'))
+    assert tournaments.recent()[0]['winner'] == 'B'
+
+
+def test_knockout_tie_goes_to_fewer_wickets_lost(tournaments):
+    tournament_id = tournaments.create("Cup", KNOCKOUT, 20, list(SQUADS.items()))
+    fixture = tournaments.fixtures(tournament_id)[0]
+    tournaments.start_fixture(fixture['id'], 'm1')
+    assert tournaments.complete_fixture(fixture['id'], finished_match(
+        ('A', 150, 8, '20.0'), ('B', 150, 6, '20.0'), None, None, 'tie'))
+    assert tournaments.fixture(fixture['id'])['winner'] == 'B'
+    assert tournaments.get(tournament_id)['winner'] == 'B'
+    # Completing it again changes nothing
+    assert not tournaments.complete_fixture(fixture['id'], finished_match(
+        ('A', 150, 8, '20.0'), ('B', 150, 6, '20.0'), None, None, 'tie'))
@@ -0,0 +1,277 @@
+# tournament.py
+# Round-robin and knockout tournaments. Fixtures start ordinary matches;
+# when one finishes, its result is folded into the points table in a single
+# transaction, so standings are read straight from their own rows rather
+# than recomputed from every fixture.
+import json
+import sqlite3
+import threading
+import time
+
+
+ROUND_ROBIN = 'round_robin'
+KNOCKOUT = 'knockout'
+FORMATS = (ROUND_ROBIN, KNOCKOUT)
+
+# Points per result
+WIN_POINTS = 2
+TIE_POINTS = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tournaments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    format TEXT NOT NULL,
+    overs INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    winner TEXT
+);
+
+CREATE TABLE IF NOT EXISTS tournament_teams (
+    tournament_id INTEGER NOT NULL REFERENCES tournaments (id),
+    team TEXT NOT NULL,
+    seed INTEGER NOT NULL,
+    players TEXT NOT NULL,
+    played INTEGER NOT NULL DEFAULT 0,
+    won INTEGER NOT NULL DEFAULT 0,
+    lost INTEGER NOT NULL DEFAULT 0,
+    tied INTEGER NOT NULL DEFAULT 0,
+    points INTEGER NOT NULL DEFAULT 0,
+    runs_for INTEGER NOT NULL DEFAULT 0,
+    balls_for INTEGER NOT NULL DEFAULT 0,
+    runs_against INTEGER NOT NULL DEFAULT 0,
+    balls_against INTEGER NOT NULL DEFAULT 0,
+    nrr REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (tournament_id, team)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tournament_standings ON tournament_teams (tournament_id, points, nrr);
+
+CREATE TABLE IF NOT EXISTS fixtures (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tournament_id INTEGER NOT NULL REFERENCES tournaments (id),
+    round INTEGER NOT NULL,
+    team1 TEXT NOT NULL,
+    team2 TEXT,
+    status TEXT NOT NULL DEFAULT 'scheduled',
+    match_id TEXT,
+    winner TEXT,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS fixtures_round ON fixtures (tournament_id, round, id);
+"""
+
+TEAM_COLUMNS = ("team", "seed", "played", "won", "lost", "tied", "points", "runs_for", "balls_for",
+                "runs_against", "balls_against", "nrr")
+FIXTURE_COLUMNS = ("id", "tournament_id", "round", "team1", "team2", "status", "match_id", "winner", "result")
+
+# Fixture states
+SCHEDULED = 'scheduled'
+LIVE = 'live'
+COMPLETED = 'completed'
+BYE = 'bye'
+
+
+def round_robin(teams):
+    # Circle method: every team meets every other once, and nobody plays
+    # twice in a round. With an odd number one team sits out each round.
+    teams = list(teams)
+    if len(teams) % 2:
+        teams.append(None)
+    rounds = []
+    for _ in range(len(teams) - 1):
+        pairs = [(teams[i], teams[-1 - i]) for i in range(len(teams) // 2)]
+        rounds.append([pair for pair in pairs if None not in pair])
+        teams.insert(1, teams.pop())
+    return rounds
+
+
+def knockout_round(teams):
+    # Pairs in seed order, top against bottom; an odd team out gets a bye
+    teams = list(teams)
+    pairs = [(teams[i], teams[-1 - i]) for i in range(len(teams) // 2)]
+    if len(teams) % 2:
+        pairs.append((teams[len(teams) // 2], None))
+    return pairs
+
+
+def innings_balls(overs, wickets, squad_size, quota):
+    # Balls counted for net run rate: a side bowled out is charged its full
+    # quota of overs
+    if wickets >= squad_size:
+        return quota
+    completed, balls = overs.split('.')
+    return int(completed) * 6 + int(balls)
+
+
+class TournamentStore:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self):
+        # One connection per thread, as in SQLiteStore
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def create(self, name, fmt, overs, teams):
+        # teams: [(team name, [{"id", "name"} players])] in seed order
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown tournament format: {fmt}")
+        names = [team for team, _ in teams]
+        if len(names) < 2 or len(set(names)) != len(names):
+            raise ValueError("A tournament needs at least 2 teams with different names")
+        with self._connect() as conn:
+            tournament_id = conn.execute(
+                "INSERT INTO tournaments (name, format, overs, created_at) VALUES (?, ?, ?, ?)",
+                (name, fmt, overs, time.time()),
+            ).lastrowid
+            conn.executemany(
+                "INSERT INTO tournament_teams (tournament_id, team, seed, players) VALUES (?, ?, ?, ?)",
+                [(tournament_id, team, seed, json.dumps(players)) for seed, (team, players) in enumerate(teams, 1)],
+            )
+            if fmt == ROUND_ROBIN:
+                for number, pairs in enumerate(round_robin(names), 1):
+                    self._add_round(conn, tournament_id, number, pairs)
+            else:
+                self._add_round(conn, tournament_id, 1, knockout_round(names))
+        return tournament_id
+
+    def _add_round(self, conn, tournament_id, number, pairs):
+        conn.executemany(
+            "INSERT INTO fixtures (tournament_id, round, team1, team2, status, winner) VALUES (?, ?, ?, ?, ?, ?)",
+            [(tournament_id, number, team1, team2, SCHEDULED if team2 else BYE, None if team2 else team1)
+             for team1, team2 in pairs],
+        )
+
+    def get(self, tournament_id):
+        row = self._connect().execute(
+            "SELECT id, name, format, overs, created_at, winner FROM tournaments WHERE id = ?", (tournament_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("id", "name", "format", "overs", "created_at", "winner"), row))
+
+    def recent(self, limit=50):
+        rows = self._connect().execute(
+            "SELECT id, name, format, overs, created_at, winner FROM tournaments ORDER BY id DESC LIMIT ?", (limit,)
+        )
+        return [dict(zip(("id", "name", "format", "overs", "created_at", "winner"), row)) for row in rows]
+
+    def squad(self, tournament_id, team):
+        row = self._connect().execute(
+            "SELECT players FROM tournament_teams WHERE tournament_id = ? AND team = ?", (tournament_id, team)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def standings(self, tournament_id):
+        # Straight off the standings index
+        rows = self._connect().execute(
+            "SELECT " + ", ".join(TEAM_COLUMNS) + " FROM tournament_teams WHERE tournament_id = ?"
+            " ORDER BY points DESC, nrr DESC, seed", (tournament_id,)
+        )
+        return [dict(zip(TEAM_COLUMNS, row)) for row in rows]
+
+    def fixtures(self, tournament_id):
+        rows = self._connect().execute(
+            "SELECT " + ", ".join(FIXTURE_COLUMNS) + " FROM fixtures WHERE tournament_id = ? ORDER BY round, id",
+            (tournament_id,)
+        )
+        return [dict(zip(FIXTURE_COLUMNS, row)) for row in rows]
+
+    def fixture(self, fixture_id):
+        row = self._connect().execute(
+            "SELECT " + ", ".join(FIXTURE_COLUMNS) + " FROM fixtures WHERE id = ?", (fixture_id,)
+        ).fetchone()
+        return dict(zip(FIXTURE_COLUMNS, row)) if row else None
+
+    def start_fixture(self, fixture_id, match_id):
+        # Claim a scheduled fixture for a match. Returns False if someone
+        # else started it first.
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE fixtures SET status = ?, match_id = ? WHERE id = ? AND status = ?",
+                (LIVE, match_id, fixture_id, SCHEDULED),
+            ).rowcount == 1
+
+    def complete_fixture(self, fixture_id, match):
+        # Record a finished match against its fixture and update the table.
+        # Only the first call for a fixture counts.
+        fixture = self.fixture(fixture_id)
+        tournament = self.get(fixture['tournament_id'])
+        first = match['batting_first']
+        second = match['team2_name'] if first == match['team1_name'] else match['team1_name']
+        sides = {}
+        for team, prefix in ((first, 'first'), (second, 'second')):
+            squad = len(match['team1'] if team == match['team1_name'] else match['team2'])
+            # An innings cut short by rain is charged only the overs it had
+            quota = (match.get(prefix + '_innings_max_overs') or tournament['overs']) * 6
+            sides[team] = (match[prefix + '_innings_total'],
+                           innings_balls(match[prefix + '_innings_overs'], match[prefix + '_innings_wickets'],
+                                         squad, quota))
+        tie = match['win_type'] == 'tie'
+        winner = None if tie else match['winner']
+        result = "Match Tied" if tie else f"{match['winner']} won by {match['win_margin']}"
+        if tie and tournament['format'] == KNOCKOUT:
+            # Someone has to go through: fewer wickets lost, then the higher seed
+            if match['first_innings_wickets'] != match['second_innings_wickets']:
+                winner = first if match['first_innings_wickets'] < match['second_innings_wickets'] else second
+            else:
+                winner = fixture['team1']
+            result += f", {winner} through on wickets lost"
+
+        with self._connect() as conn:
+            if not conn.execute(
+                    "UPDATE fixtures SET status = ?, winner = ?, result = ? WHERE id = ? AND status != ?",
+                    (COMPLETED, winner, result, fixture_id, COMPLETED)).rowcount:
+                return False
+            tid = fixture['tournament_id']
+            for team, opponent in ((first, second), (second, first)):
+                runs_for, balls_for = sides[team]
+                runs_against, balls_against = sides[opponent]
+                won = 1 if not tie and team == match['winner'] else 0
+                lost = 1 if not tie and team != match['winner'] else 0
+                conn.execute(
+                    "UPDATE tournament_teams SET played = played + 1, won = won + ?, lost = lost + ?,"
+                    " tied = tied + ?, points = points + ?, runs_for = runs_for + ?, balls_for = balls_for + ?,"
+                    " runs_against = runs_against + ?, balls_against = balls_against + ?"
+                    " WHERE tournament_id = ? AND team = ?",
+                    (won, lost, 1 if tie else 0, WIN_POINTS * won + (TIE_POINTS if tie else 0),
+                     runs_for, balls_for, runs_against, balls_against, tid, team),
+                )
+            conn.execute(
+                "UPDATE tournament_teams SET nrr = round("
+                " CASE WHEN balls_for > 0 THEN runs_for * 6.0 / balls_for ELSE 0 END -"
+                " CASE WHEN balls_against > 0 THEN runs_against * 6.0 / balls_against ELSE 0 END, 3)"
+                " WHERE tournament_id = ? AND team IN (?, ?)",
+                (tid, first, second),
+            )
+            if tournament['format'] == KNOCKOUT:
+                self._advance(conn, tid, fixture['round'])
+            elif not conn.execute("SELECT 1 FROM fixtures WHERE tournament_id = ? AND status != ? LIMIT 1",
+                                  (tid, COMPLETED)).fetchone():
+                # League over; the top of the table wins it
+                conn.execute(
+                    "UPDATE tournaments SET winner = (SELECT team FROM tournament_teams WHERE tournament_id = ?"
+                    " ORDER BY points DESC, nrr DESC, seed LIMIT 1) WHERE id = ?", (tid, tid))
+        return True
+
+    def _advance(self, conn, tournament_id, number):
+        # Once a knockout round is finished, its winners meet in the next one
+        pending = conn.execute(
+            "SELECT 1 FROM fixtures WHERE tournament_id = ? AND round = ? AND status NOT IN (?, ?) LIMIT 1",
+            (tournament_id, number, COMPLETED, BYE),
+        ).fetchone()
+        if pending:
+            return
+        winners = [winner for (winner,) in conn.execute(
+            "SELECT winner FROM fixtures WHERE tournament_id = ? AND round = ? ORDER BY id", (tournament_id, number))]
+        if len(winners) == 1:
+            conn.execute("UPDATE tournaments SET winner = ? WHERE id = ?", (winners[0], tournament_id))
+        else:
+            self._add_round(conn, tournament_id, number + 1, knockout_round(winners))